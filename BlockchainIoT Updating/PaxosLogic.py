@@ -13,7 +13,22 @@ from piChain.PaxosNetwork import ConnectionManager
 from piChain.blocktree import Blocktree
 from piChain.messages import PaxosMessage, Block, RequestBlockMessage, RespondBlockMessage, Transaction, \
     AckCommitMessage
-from piChain.config import ACCUMULATION_TIME, MAX_COMMIT_TIME, MAX_TXN_COUNT, TESTING, RECOVERY_BLOCKS_COUNT
+from piChain.config import MAX_COMMIT_TIME, TESTING, RECOVERY_BLOCKS_COUNT
+from piChain.batching import FixedBatchingPolicy
+from piChain.rtt import RttEstimator
+from piChain.delivery import CommitDelivery
+from piChain.recovery import RequestRangeMessage, RespondRangeMessage, RangeRecovery, collect_range, split_range, \
+    MIN_RANGE_DEPTH, RANGE_RESPONSE_BLOCKS, RANGE_TIMEOUT_RTTS
+from piChain.snapshot import SnapshotOfferMessage, RequestSnapshotMessage, SnapshotChunkMessage, SnapshotTransfer, \
+    checksum, get_chunk, SNAPSHOT_INTERVAL, MAX_SNAPSHOT_ATTEMPTS
+from piChain.pruning import Pruner
+from piChain.compact import CompactBlock, TxnTable, block_commands, expand
+from piChain.metrics import Metrics, TimedDB, timed, listen
+from piChain.client import Admission
+from piChain.archive import BlockArchive, ARCHIVE_SEGMENT_BLOCKS
+from piChain.validation import BlockValidation
+from piChain.monitor import ReactorStallMonitor
+from piChain.codec import Encoded, DecodeError, MESSAGE_TYPES, decode_frame
 
 
 # variables representing the state of a node
@@ -23,6 +38,19 @@ SLOW = 2
 
 EPSILON = 0.001
 
+# maximal number of quick propose rounds that may be in flight at the same time (1 disables pipelining)
+COMMIT_WINDOW = 1
+
+# duration of a leader lease in multiples of the commit rtt (0 disables leases)
+LEASE_RTTS = 0
+
+# part of its lease a leaseholder does not use to tolerate clock drift
+LEASE_DRIFT = 0.1
+
+# maximal length of `new_txs` up to which txns of other nodes are queued, further ones are dropped (their creator still
+# queues and proposes them). Own txns are bounded by the admission control of `submit`.
+MAX_NEW_TXS = 10000
+
 # genesis block
 GENESIS = Block(-1, None, [], 0)
 GENESIS.depth = 0
@@ -42,13 +70,17 @@ class Node(ConnectionManager):
     Args:
         node_index (int): the index of this node into the peers dictionary. The entry defines its ip address and port.
         peers_dict (dict): a dict containing the (ip, port) pairs for all nodes (see examples folder for its structure).
+        db_path (str): directory of the LevelDB of the blocktree, None for the default location of `node_index`.
 
     Attributes:
         state (int): 0,1 or 2 corresponds to QUICK, MEDIUM or SLOW.
         blocktree (Blocktree): The blocktree which this node owns.
         known_txs (set): all txs seen so far. Set of txn ids.
         new_txs (list): txs not yet in a block, behaving like a queue.
+        max_new_txs (int): length of `new_txs` from which on txns of other nodes are dropped (see `MAX_NEW_TXS`).
         oldest_txn (Transaction): txn which started a timeout.
+        full_txn (Transaction): oldest txn of `new_txs` when they filled a block, its timeout skips the accumulation
+            time.
         s_max_block_depth (int):  depth of deepest block seen in round 1 (like T_max).
         s_prop_block (Block): stored block from a valid propose message.
         s_supp_block (Block): block supporting proposed block (like T_store).
@@ -61,14 +93,46 @@ class Node(ConnectionManager):
         c_quick_proposing (bool): a node may skip round 1 if his ticket is still valid.
         c_commit_running (bool): True if a commit currently running.
         c_current_committable_block (Block): block to still be committed
+        c_pipeline (dict): Mapping from request_seq to the block proposed in that (pipelined) quick propose round.
+        c_pipeline_votes (dict): Mapping from request_seq to the number of PROPOSE_ACKs received in that round.
+        commit_window (int): maximal number of pipelined commit rounds in flight (see `COMMIT_WINDOW`).
+        lease_rtts (float): duration of a leader lease in multiples of `commit_rtt` (see `LEASE_RTTS`).
+        lease_requests (dict): Mapping from request_seq to (send time, duration) of a PROPOSE requesting a lease.
+        lease_expiry (float): time until this node holds the leader lease (None if it never held one).
+        lease_holder (int): id of the node this node granted a lease to.
+        lease_granted_until (float): time until the granted lease is valid.
         tx_committed (Callable): method given by app service that is called once a transaction has been committed.
-        rtts (dict): Mapping from peer_node_id to RTT. Used to estimate expected round trip time.
-        expected_rtt (float): based on this rtt the timeouts are computed.
+        snapshot_app_state (Callable): method given by app service that returns its state as bytes. If None, no
+            snapshots are taken.
+        install_app_state (Callable): method given by app service that replaces its state by a snapshot (bytes).
+        snapshot_block (Block): block up to which the latest snapshot contains all commands (None if none).
+        snapshot_transfer (SnapshotTransfer): snapshot currently received from a peer (None if none).
+        pruner (Pruner): deletes pruned blocks from the db on a background thread.
+        archive (BlockArchive): if not None, pruned blocks are archived in compressed segments instead of only being
+            deleted (see `enable_archive`).
+        archive_segment_blocks (int): number of blocks below the genesis block that are archived together.
+        metrics (Metrics): counters and histograms of this node, None if disabled (see `enable_metrics`).
+        admission (Admission): bounds the commands submitted with `submit` that are not yet committed.
+        block_validation (BlockValidation): if not None, received blocks are validated in batches on a worker thread
+            (see `enable_block_validation`).
+        commit_delivery (CommitDelivery): if not None, committed commands are delivered to `tx_committed` in batches
+            on a worker thread (see `enable_commit_delivery`).
+        stall_monitor (ReactorStallMonitor): if not None, measures how long the reactor is stalled (see
+            `enable_stall_monitor`).
+        binary_codec (bool): send messages in the binary encoding of the codec module (see `enable_binary_codec`).
+        rtts (dict): Mapping from peer_node_id to latest RTT sample.
+        rtt_estimator (RttEstimator): smoothed RTT and variation per peer (see rtt module).
+        expected_rtt (float): expected rtt of a majority, based on this rtt the patience is computed.
+        commit_rtt (float): conservative rtt of a majority, based on this rtt the commit timeouts are computed.
         slow_timeout_backoff (float): fix additional timeout backoff of a slow node (u.a.r only set once).
         n (int): total numberof nodes.
         retry_commit_timeout_queued (bool): is there a timeout in queue that will retry to commit.
+        range_recovery (RangeRecovery): running recovery of a large range of missing blocks (None if none).
+        range_recovery_counter (int): id of the last started range recovery.
+        batching_policy (FixedBatchingPolicy): decides the size of a new block and the accumulation time (see
+            batching module).
     """
-    def __init__(self, node_index, peers_dict):
+    def __init__(self, node_index, peers_dict, db_path=None):
 
         super().__init__(node_index, peers_dict)
 
@@ -78,12 +142,14 @@ class Node(ConnectionManager):
         if self.id == 0:
             self.state = QUICK
 
-        self.blocktree = Blocktree(node_index)
+        self.blocktree = Blocktree(node_index) if db_path is None else Blocktree(node_index, db_path)
 
         # Transaction variables
         self.known_txs = set()
         self.new_txs = []
+        self.max_new_txs = MAX_NEW_TXS
         self.oldest_txn = None
+        self.full_txn = None
 
         # node acting as server
         self.s_max_block_depth = 0
@@ -100,8 +166,35 @@ class Node(ConnectionManager):
         self.c_quick_proposing = False
         self.c_commit_running = False
         self.c_current_committable_block = None
+        self.c_pipeline = {}
+        self.c_pipeline_votes = {}
+        self.commit_window = COMMIT_WINDOW
+
+        # leader lease
+        self.lease_rtts = LEASE_RTTS
+        self.lease_requests = {}
+        self.lease_expiry = None
+        self.lease_holder = None
+        self.lease_granted_until = 0
 
         self.tx_committed = None
+        self.commit_delivery = None
+
+        self.snapshot_app_state = None
+        self.install_app_state = None
+        self.snapshot_block = None
+        self.snapshot_transfer = None
+
+        self.pruner = Pruner(self.blocktree.db)
+        self.archive = None
+        self.archive_segment_blocks = ARCHIVE_SEGMENT_BLOCKS
+
+        self.metrics = None
+
+        self.admission = Admission(self)
+        self.block_validation = None
+        self.stall_monitor = None
+        self.binary_codec = False
 
         # timeout/timing variables
         self.rtts = {}
@@ -109,7 +202,14 @@ class Node(ConnectionManager):
         self.slow_timeout_backoff = None
         self.retry_commit_timeout_queued = False
 
+        self.range_recovery = None
+        self.range_recovery_counter = 0
+
+        self.batching_policy = FixedBatchingPolicy()
+
         self.n = len(self.peers)
+        self.rtt_estimator = RttEstimator(self.n, self.expected_rtt)
+        self.commit_rtt = self.expected_rtt
 
         # load server variables (after crash)
         for key, value in self.blocktree.db:
@@ -121,7 +221,11 @@ class Node(ConnectionManager):
             elif key == b's_supp_block':
                 block = self.blocktree.nodes.get(int(value.decode()))
                 self.s_supp_block = block
+            elif key == b'snapshot_block':
+                block = self.blocktree.nodes.get(int(value.decode()))
+                self.snapshot_block = block
 
+    @timed()
     def receive_paxos_message(self, message, sender):
         """React on a received paxos `message`. This method implements the main functionality of the paxos algorithm.
 
@@ -130,6 +234,11 @@ class Node(ConnectionManager):
             sender (Connection): Connection instance of the sender (None if sender is this Node).
         """
         logger.debug('receive message type = %s', message.msg_type)
+        if message.msg_type in ('TRY', 'PROPOSE') and self.lease_granted_to_other(getattr(message, 'leader', None)):
+            # do not support another node while the leaseholder may commit without asking us again
+            logger.debug('%s rejected, lease granted to %s', message.msg_type, str(self.lease_holder))
+            return
+
         if message.msg_type == 'TRY':
             # make sure last commited block of sender is also committed by this node
             if message.last_committed_block not in self.blocktree.committed_blocks:
@@ -187,6 +296,8 @@ class Node(ConnectionManager):
                 self.c_prop_block = prop_block
 
             self.c_votes += 1
+            if self.metrics is not None:
+                self.metrics.inc('pichain_votes_total', type='TRY_OK')
             if self.c_votes > self.n / 2:
 
                 # start new round
@@ -204,6 +315,7 @@ class Node(ConnectionManager):
                 propose = PaxosMessage('PROPOSE', self.c_request_seq)
                 propose.com_block = self.c_com_block.block_id
                 propose.new_block = self.c_new_block.block_id
+                self.request_lease(propose)
 
                 self.broadcast(propose, 'PROPOSE')
                 self.receive_paxos_message(propose, None)
@@ -217,8 +329,13 @@ class Node(ConnectionManager):
             if com_block is None:
                 return
             if new_block.depth == self.s_max_block_depth:
-                self.s_prop_block = com_block
-                self.s_supp_block = new_block
+                if self.s_prop_block is not None and com_block.block_id != self.s_prop_block.block_id and \
+                        self.blocktree.ancestor(com_block, self.s_prop_block):
+                    # reordered PROPOSE of an earlier pipelined round: keep the stored descendant, it implies com_block
+                    logger.debug('PROPOSE for an ancestor of s_prop_block, keep s_prop_block')
+                else:
+                    self.s_prop_block = com_block
+                    self.s_supp_block = new_block
 
                 # write changes to disk (add s_prop_block and s_supp_block)
                 if self.s_prop_block is not None:
@@ -229,6 +346,12 @@ class Node(ConnectionManager):
                     block_id_bytes = str(self.s_supp_block.block_id).encode()
                     self.blocktree.db.put(b's_supp_block', block_id_bytes)
 
+                # acknowledging a PROPOSE that requests a lease grants it
+                lease = getattr(message, 'lease', None)
+                if lease:
+                    self.lease_holder = message.leader
+                    self.lease_granted_until = self.reactor.seconds() + lease / 1000.
+
                 # create a PROPOSE_ACK message
                 propose_ack = PaxosMessage('PROPOSE_ACK', message.request_seq)
                 propose_ack.com_block = message.com_block
@@ -239,13 +362,22 @@ class Node(ConnectionManager):
                     self.receive_paxos_message(propose_ack, None)
 
         elif message.msg_type == 'PROPOSE_ACK':
+            # votes of a pipelined round are counted separately per request_seq
+            if message.request_seq in self.c_pipeline:
+                self.receive_pipelined_propose_ack(message)
+                return
+
             # check if message is not outdated
             if message.request_seq != self.c_request_seq:
                 # outdated message
                 return
 
             self.c_votes += 1
+            if self.metrics is not None:
+                self.metrics.inc('pichain_votes_total', type='PROPOSE_ACK')
             if self.c_votes > self.n / 2:
+                self.lease_acknowledged(message.request_seq)
+
                 # ignore further answers
                 self.c_request_seq += 1
 
@@ -268,12 +400,20 @@ class Node(ConnectionManager):
                 return
             self.commit(com_block)
 
+    @timed('TXN')
     def receive_transaction(self, txn):
         """React on a received `txn` depending on state.
 
         Args:
             txn (Transaction): Transaction received.
         """
+        if len(self.new_txs) >= self.max_new_txs and txn.creator_id != self.id and txn.txn_id not in self.known_txs:
+            # overloaded: the txn is not remembered as seen, blocks containing it are still accepted
+            logger.debug('new txs full, drop txn of node %s', str(txn.creator_id))
+            if self.metrics is not None:
+                self.metrics.inc('pichain_txns_dropped_total')
+            return
+
         # check if txn has already been seen
         if txn.txn_id not in self.known_txs:
             logger.debug('txn has not yet been seen')
@@ -282,14 +422,24 @@ class Node(ConnectionManager):
 
             # timeout handling
             self.new_txs.append(txn)
+            self.batching_policy.observe(txn)
+            if self.metrics is not None:
+                self.metrics.txn_received(txn.txn_id)
+                self.metrics.set('pichain_new_txs', len(self.new_txs))
             if len(self.new_txs) == 1:
                 self.oldest_txn = txn
                 # start a timeout
                 logger.debug('start timeout')
                 deferLater(self.reactor, self.get_patience(), self.timeout_over, txn)
+            elif self.full_txn is not self.new_txs[0] and self.batching_policy.is_full(self.new_txs):
+                # the next block is full, do not wait for further txns (but still as long as the state requires)
+                logger.debug('new txs fill a block, shorten timeout')
+                self.full_txn = self.new_txs[0]
+                deferLater(self.reactor, self.get_state_patience(), self.timeout_over, self.full_txn)
         else:
             logger.debug('txn has already been seen')
 
+    @timed('BLK')
     def receive_block(self, block):
         """React on a received `block`.
 
@@ -301,22 +451,37 @@ class Node(ConnectionManager):
             logger.debug('block not reachable')
             return
 
-        # demote node if necessary
-        if self.blocktree.head_block < block or block.creator_state == QUICK:
+        # demote node if necessary (a leaseholder stays quick, a majority will not support anyone else)
+        if (self.blocktree.head_block < block or block.creator_state == QUICK) and not self.has_lease():
             if self.state != SLOW:
                 logger.debug('Demoted to slow. Previous State = %s', str(self.state))
-            self.state = SLOW
+            self.change_state(SLOW)
             self.c_quick_proposing = False
+            self.abort_pipeline()
+
+        if self.block_validation is not None:
+            # validated off the reactor thread, `block_validated` is called if it is valid
+            self.block_validation.submit(block)
+            return
 
         if not self.blocktree.valid_block(block):
             logger.debug('block invalid')
             return
 
+        self.block_validated(block)
+
+    def block_validated(self, block):
+        """Move to the received and validated `block`.
+
+        Args:
+            block (Block): valid block.
+        """
         self.move_to_block(block)
 
         # timeout readjustment
         self.readjust_timeout()
 
+    @timed('RQB')
     def receive_request_blocks_message(self, req, sender):
         """A node is missing a block. Send him the missing block if we have it. Also send him a predefined number
         (=RECOVERY_BLOCKS_COUNT given in config.py) of ancestors of the missing block s.t he can recover faster in case
@@ -326,6 +491,13 @@ class Node(ConnectionManager):
             req (RequestBlockMessage): Message that requests a missing block.
             sender (Connection): Connection instance form the sender.
         """
+        if self.blocktree.nodes.get(req.block_id) is None and self.archive is not None:
+            # a pruned block can still be read from the archive
+            b = self.archive.get(req.block_id)
+            if b is not None:
+                self.respond(RespondBlockMessage([b]), sender)
+            return
+
         if self.blocktree.nodes.get(req.block_id) is not None:
             blocks = [self.blocktree.nodes.get(req.block_id)]
 
@@ -339,9 +511,10 @@ class Node(ConnectionManager):
                     blocks.append(b)
 
             # send blocks back
-            respond = RespondBlockMessage(blocks)
+            respond = RespondBlockMessage([expand(b) for b in blocks])
             self.respond(respond, sender)
 
+    @timed('RSB')
     def receive_respond_blocks_message(self, resp):
         """Receive the blocks that are missing from a peer. Can directly be added to `self.nodes`.
 
@@ -352,6 +525,155 @@ class Node(ConnectionManager):
         for b in blocks:
             self.blocktree.add_block(b)
 
+    @timed('RQR')
+    def receive_request_range_message(self, req, sender):
+        """A node is missing a range of blocks. Stream the blocks of all chunks assigned to this node.
+
+        Args:
+            req (RequestRangeMessage): Message that requests the chunks.
+            sender (Connection): Connection instance form the sender.
+        """
+        # blocks below the genesis and snapshot block have been deleted
+        lowest_depth = self.blocktree.genesis.depth
+        if self.snapshot_block is not None:
+            lowest_depth = min(lowest_depth, self.snapshot_block.depth)
+
+        for lo, hi, responder_id in req.chunks:
+            if responder_id != self.id:
+                continue
+            if lo < lowest_depth and self.archive is not None and self.archive.covers(lo):
+                blocks = self.collect_archived_range(lo, hi)
+            elif lo < lowest_depth:
+                if self.snapshot_block is not None:
+                    snapshot = self.blocktree.db.get(b'snapshot')
+                    offer = SnapshotOfferMessage(expand(self.snapshot_block), len(snapshot), checksum(snapshot))
+                    self.respond(offer, sender)
+                continue
+            else:
+                blocks = [expand(b) for b in collect_range(self.blocktree, lo, hi)]
+            i = 0
+            while True:
+                part = blocks[i:i + RANGE_RESPONSE_BLOCKS]
+                i += RANGE_RESPONSE_BLOCKS
+                last = i >= len(blocks)
+                self.respond(RespondRangeMessage(req.recovery_id, lo, hi, part, last, self.id), sender)
+                if last:
+                    break
+
+    def collect_archived_range(self, lo, hi):
+        """Returns the blocks with lo < depth <= hi on the path from the head block downwards, sorted by depth. Blocks
+        that are no longer in the blocktree are read from the archive.
+        """
+        blocks = []
+        lowest = None
+        b = self.blocktree.head_block
+        while b is not None and b.parent_block_id is not None and b.depth > lo:
+            if b.depth <= hi:
+                blocks.append(expand(b))
+            lowest = b.depth
+            b = self.blocktree.nodes.get(b.parent_block_id)
+        blocks.reverse()
+        if b is None:
+            # the walk ended at a pruned block, the blocks below are archived
+            top = hi if lowest is None else min(hi, lowest - 1)
+            blocks = self.archive.collect(lo, top) + blocks
+        return blocks
+
+    @timed('RSR')
+    def receive_respond_range_message(self, resp):
+        """Receive part of a chunk of a range recovery. Blocks are added to the blocktree once all chunks with
+        smaller depth are complete.
+
+        Args:
+            resp (RespondRangeMessage): Message containing the blocks.
+        """
+        if self.range_recovery is None or self.range_recovery.recovery_id != resp.recovery_id:
+            return
+        for b in self.range_recovery.add(resp):
+            self.blocktree.add_block(b)
+        if self.range_recovery.failed:
+            logger.debug('range recovery given up')
+            self.range_recovery = None
+            return
+        if self.range_recovery.retries:
+            # short or forked chunks are requested from other peers
+            req = RequestRangeMessage(resp.recovery_id, self.range_recovery.retries)
+            self.range_recovery.retries = []
+            self.broadcast(req, 'RQR')
+        if self.range_recovery.done():
+            logger.debug('range recovery done')
+            self.range_recovery = None
+
+    @timed('SNO')
+    def receive_snapshot_offer_message(self, offer, sender):
+        """A peer cannot send the requested blocks anymore but offers a snapshot. Accept it if it is deeper than the
+        committed block and request all its chunks.
+
+        Args:
+            offer (SnapshotOfferMessage): Received offer.
+            sender (Connection): Connection instance form the sender.
+        """
+        if self.install_app_state is None or self.snapshot_transfer is not None:
+            return
+        if offer.block.depth <= self.blocktree.committed_block.depth:
+            return
+
+        # the blocks above the snapshot will be recovered once it is installed
+        target_depth = offer.block.depth
+        if self.range_recovery is not None:
+            target_depth = max(target_depth, max(chunk[1] for chunk in self.range_recovery.chunks))
+            self.range_recovery = None
+
+        logger.debug('receive snapshot of block %s', str(offer.block.block_id))
+        self.snapshot_transfer = SnapshotTransfer(offer, target_depth)
+        req = RequestSnapshotMessage(offer.block.block_id, self.snapshot_transfer.missing())
+        self.respond(req, sender)
+        deferLater(self.reactor, RANGE_TIMEOUT_RTTS * self.commit_rtt, self.snapshot_transfer_timeout,
+                   offer.block.block_id)
+
+    @timed('RQS')
+    def receive_request_snapshot_message(self, req, sender):
+        """Send the requested chunks of the snapshot if it is still the latest snapshot of this node.
+
+        Args:
+            req (RequestSnapshotMessage): Message that requests the chunks.
+            sender (Connection): Connection instance form the sender.
+        """
+        if self.snapshot_block is None or self.snapshot_block.block_id != req.block_id:
+            return
+        snapshot = self.blocktree.db.get(b'snapshot')
+        for index in req.indices:
+            data = get_chunk(snapshot, index)
+            if data is not None:
+                self.respond(SnapshotChunkMessage(req.block_id, index, data, checksum(data)), sender)
+
+    @timed('SNC')
+    def receive_snapshot_chunk_message(self, msg):
+        """Receive a chunk of a snapshot. Once all chunks are received the snapshot is installed.
+
+        Args:
+            msg (SnapshotChunkMessage): Received chunk.
+        """
+        if self.snapshot_transfer is None or not self.snapshot_transfer.add(msg):
+            return
+        snapshot = self.snapshot_transfer.assemble()
+        if snapshot is not None:
+            self.install_snapshot(snapshot)
+
+    def snapshot_transfer_timeout(self, block_id):
+        """Request the missing chunks of a snapshot from all peers."""
+        transfer = self.snapshot_transfer
+        if transfer is None or transfer.block.block_id != block_id:
+            return
+        if transfer.attempts >= MAX_SNAPSHOT_ATTEMPTS:
+            logger.debug('snapshot transfer given up')
+            self.snapshot_transfer = None
+            return
+        transfer.attempts += 1
+        req = RequestSnapshotMessage(block_id, transfer.missing())
+        self.broadcast(req, 'RQS')
+        deferLater(self.reactor, RANGE_TIMEOUT_RTTS * self.commit_rtt, self.snapshot_transfer_timeout, block_id)
+
     def receive_pong_message(self, message, peer_node_id):
         """Receive PongMessage and update RRT's accordingly.
 
@@ -365,8 +687,24 @@ class Node(ConnectionManager):
 
         # update RTT's
         self.rtts.update({peer_node_id: rtt})
-        self.expected_rtt = max(self.rtts.values()) + 0.1
+        self.rtt_estimator.add_sample(peer_node_id, rtt)
+        self.expected_rtt = self.rtt_estimator.expected_rtt()
+        self.commit_rtt = self.rtt_estimator.timeout()
+
+    def connection_lost(self, peer_node_id):
+        """Is called by the networking module when the connection to a peer is lost. Its RTT samples are forgotten,
+        the expected rtts are computed from the peers that are still connected.
 
+        Args:
+            peer_node_id (str): uuid of the peer whose connection was lost.
+        """
+        logger.debug('connection to %s lost', str(peer_node_id))
+        self.rtts.pop(peer_node_id, None)
+        self.rtt_estimator.remove_peer(peer_node_id)
+        self.expected_rtt = self.rtt_estimator.expected_rtt()
+        self.commit_rtt = self.rtt_estimator.timeout()
+
+    @timed('ACM')
     def receive_ack_commit_message(self, message):
         """Check if all nodes acknowledged this block, if true make it the new genesis block and delete the blocks
         below the new genesis block from db and blocktree.
@@ -399,21 +737,125 @@ class Node(ConnectionManager):
             block_id_bytes = str(self.blocktree.genesis.block_id).encode()
             self.blocktree.db.put(b'genesis', block_id_bytes)
 
-            # delete inside blocktree.nodes dict and on disk
+            self.take_snapshot()
+            if self.block_validation is not None:
+                self.block_validation.genesis_changed()
+
+            # delete inside blocktree.nodes dict and on disk. Blocks above the snapshot block are kept s.t a lagging
+            # node can install the snapshot and recover them.
             parent = self.blocktree.genesis
+            if self.snapshot_block is not None and self.blocktree.ancestor(self.snapshot_block, parent):
+                parent = self.snapshot_block
+
+            if self.commit_delivery is not None:
+                # blocks the app has not acknowledged yet are delivered again after a restart, keep them
+                offset = self.commit_delivery.delivered_offset
+                delivered = self.blocktree.nodes.get(self.blocktree.committed_blocks[offset - 1]) if offset else None
+                if delivered is None:
+                    # no delivered block is known, nothing can be pruned yet
+                    parent = None
+                elif self.blocktree.ancestor(delivered, parent):
+                    parent = delivered
+
+            if self.archive is not None and parent is not None:
+                # archive the blocks below the bound in full segments, the oldest first. Blocks not yet archived
+                # are kept (and archived at a later genesis block change), only archived blocks are pruned.
+                cold = []
+                b = self.blocktree.nodes.get(parent.parent_block_id)
+                while b is not None and b.parent_block_id is not None:
+                    cold.append(b)
+                    b = self.blocktree.nodes.get(b.parent_block_id)
+                cold.reverse()
+                archived = len(cold) - len(cold) % self.archive_segment_blocks
+                for i in range(0, archived, self.archive_segment_blocks):
+                    self.archive.add([expand(b) for b in cold[i:i + self.archive_segment_blocks]])
+                if archived < len(cold):
+                    parent = cold[archived]
+
+            pruned_keys = []
             while parent is not None and parent.parent_block_id is not None:
                 parent_block_id = parent.parent_block_id
-                self.blocktree.db.delete(str(parent_block_id).encode())
+                pruned_keys.append(str(parent_block_id).encode())
                 parent = self.blocktree.nodes.pop(parent_block_id, None)
                 # also delete txns
                 if parent is not None:
-                    for txn in parent.txs:
-                        self.known_txs.discard(txn.txn_id)
+                    txn_ids = parent.txs.txn_ids if isinstance(parent.txs, TxnTable) else \
+                        [txn.txn_id for txn in parent.txs]
+                    self.known_txs.difference_update(txn_ids)
 
             self.blocktree.nodes.update({GENESIS.block_id: GENESIS})
 
-            # force deletion in leveldb
-            self.blocktree.db.compact_range()
+            # delete on disk and force deletion in leveldb in the background (does not block the reactor)
+            self.pruner.delete(pruned_keys)
+
+    def take_snapshot(self):
+        """Take a snapshot of the app state if there is none yet or if the genesis block moved at least
+        `SNAPSHOT_INTERVAL` txns since the last one.
+        """
+        if self.snapshot_app_state is None:
+            return
+        if self.snapshot_block is not None and \
+           self.blocktree.genesis.depth - self.snapshot_block.depth < SNAPSHOT_INTERVAL:
+            return
+
+        # the snapshot contains the commands of all blocks that have been delivered to the app
+        if self.commit_delivery is not None:
+            if self.commit_delivery.delivering:
+                # app state is changing right now, try again at the next genesis block change
+                return
+            offset = self.commit_delivery.delivered_offset
+        else:
+            offset = len(self.blocktree.committed_blocks)
+        if offset == 0:
+            return
+        block = self.blocktree.nodes.get(self.blocktree.committed_blocks[offset - 1])
+        if block is None:
+            return
+
+        logger.debug('take snapshot at block %s', str(block.block_id))
+        snapshot = self.snapshot_app_state()
+        self.blocktree.db.put(b'snapshot', snapshot)
+        self.blocktree.db.put(b'snapshot_block', str(block.block_id).encode())
+        self.snapshot_block = block
+
+    def install_snapshot(self, snapshot):
+        """Replace the app state by `snapshot` and make its block the new genesis and committed block. Then recover
+        the blocks above it.
+
+        Args:
+            snapshot (bytes): the received snapshot.
+        """
+        transfer = self.snapshot_transfer
+        self.snapshot_transfer = None
+        block = transfer.block
+        logger.debug('install snapshot of block %s', str(block.block_id))
+
+        self.install_app_state(snapshot)
+
+        self.blocktree.add_block(block)
+        self.blocktree.genesis = block
+        if self.block_validation is not None:
+            self.block_validation.genesis_changed()
+        self.blocktree.committed_block = block
+        self.blocktree.committed_blocks.append(block.block_id)
+        self.blocktree.head_block = block
+        self.snapshot_block = block
+
+        # write changes to disk
+        block_id_bytes = str(block.block_id).encode()
+        self.blocktree.db.put(b'genesis', block_id_bytes)
+        self.blocktree.db.put(b'committed_block', block_id_bytes)
+        self.blocktree.db.put(b'head_block', block_id_bytes)
+        self.blocktree.db.put(b'committed_blocks', json.dumps(self.blocktree.committed_blocks).encode())
+        self.blocktree.db.put(b'snapshot', snapshot)
+        self.blocktree.db.put(b'snapshot_block', block_id_bytes)
+
+        # the app already contains the commands of all committed blocks
+        if self.commit_delivery is not None:
+            self.commit_delivery.skip_to(len(self.blocktree.committed_blocks))
+
+        if transfer.target_depth > block.depth:
+            self.start_range_recovery(block.depth, transfer.target_depth)
 
     def move_to_block(self, target):
         """Change to `target` block as new `head_block`. If `target` is found on a forked path, have to broadcast txs
@@ -435,15 +877,16 @@ class Node(ConnectionManager):
                 to_broadcast |= set(b.txs)
                 b = self.blocktree.nodes.get(b.parent_block_id)
             # go from target to common ancestor: remove txs from to_broadcast and new_txs, add to known_txs
+            included = set()
             b = target
             while b != common_ancestor:
-                for tx in b.txs:
-                    self.known_txs.add(tx.txn_id)
-                for tx in b.txs:
-                    if tx in self.new_txs:
-                        self.new_txs.remove(tx)
-                to_broadcast -= set(b.txs)
+                included.update(b.txs.txn_ids if isinstance(b.txs, TxnTable) else [tx.txn_id for tx in b.txs])
                 b = self.blocktree.nodes.get(b.parent_block_id)
+            to_broadcast = [tx for tx in to_broadcast if tx.txn_id not in included]
+            self.known_txs |= included
+            if included:
+                # filter once instead of removing txs one by one
+                self.new_txs = [tx for tx in self.new_txs if tx.txn_id not in included]
 
             # target is now the new head_block
             self.blocktree.head_block = target
@@ -475,6 +918,7 @@ class Node(ConnectionManager):
            block != self.blocktree.committed_block:
             if block.creator_id != self.id:
                 self.c_quick_proposing = False
+                self.abort_pipeline()
 
             last_committed_block = self.blocktree.committed_block
             self.blocktree.committed_block = block
@@ -515,23 +959,46 @@ class Node(ConnectionManager):
                 logger.debug('committing a block: with block id = %s', str(b.block_id))
                 logger.debug('committed blocks so far: %s', str(self.blocktree.committed_blocks))
 
+                if self.metrics is not None:
+                    if self.commit_delivery is None:
+                        self.metrics.txns_committed([txn.txn_id for txn in b.txs])
+                    self.metrics.inc('pichain_committed_blocks_total')
+
+                # resolve the Deferreds of commands submitted at this node
+                self.admission.committed(b)
+
                 # call callable of app service
-                commands = []
-                for txn in b.txs:
-                    commands.append(txn.content)
-                if self.tx_committed is not None:
+                commands = block_commands(b)
+                if self.commit_delivery is not None:
+                    self.commit_delivery.enqueue(len(self.blocktree.committed_blocks), commands)
+                elif self.tx_committed is not None:
                     self.tx_committed(commands)
 
-            # reinitialize server variables
-            self.s_supp_block = None
-            self.s_prop_block = None
+                # a committed block is only read again for recovery, store it in compact form
+                self.blocktree.nodes.update({b.block_id: CompactBlock(b)})
+
+            # reinitialize server variables. A proposed block extending the committed block (proposed in a
+            # pipelined round) has to be kept, it may already be committed by a majority.
+            keep_proposal = self.s_prop_block is not None and self.blocktree.ancestor(block, self.s_prop_block)
+            if not keep_proposal:
+                self.s_supp_block = None
+                self.s_prop_block = None
             self.s_max_block_depth = 0
             self.c_commit_running = False
 
+            # pipelined rounds whose block is now committed are finished
+            for request_seq, b in list(self.c_pipeline.items()):
+                if b.block_id in self.blocktree.committed_blocks:
+                    del self.c_pipeline[request_seq]
+                    self.c_pipeline_votes.pop(request_seq, None)
+            if self.c_pipeline:
+                self.c_commit_running = True
+
             # write changes to disk (delete s_max_block, s_prop_block and s_supp_block)
             self.blocktree.db.delete(b's_max_block_depth')
-            self.blocktree.db.delete(b's_prop_block')
-            self.blocktree.db.delete(b's_supp_block')
+            if not keep_proposal:
+                self.blocktree.db.delete(b's_prop_block')
+                self.blocktree.db.delete(b's_supp_block')
 
     def reach_genesis_block(self, block):
         """Check if there is a path from `block` to `GENESIS` block. If a block on the path is not contained in
@@ -550,11 +1017,61 @@ class Node(ConnectionManager):
             if self.blocktree.nodes.get(b.parent_block_id) is not None:
                 b = self.blocktree.nodes.get(b.parent_block_id)
             else:
-                req = RequestBlockMessage(b.parent_block_id)
-                self.broadcast(req, 'RQB')
+                self.request_missing_blocks(b)
                 return False
         return True
 
+    def request_missing_blocks(self, block):
+        """The parent of `block` is missing. If many blocks are missing, start a range recovery, otherwise request
+        the parent from the peers.
+
+        Args:
+            block (Block): block whose parent is missing.
+        """
+        lo = self.blocktree.committed_block.depth
+        hi = block.depth - len(block.txs)
+        if self.range_recovery is not None and self.range_recovery.covers(hi):
+            # the parent is recovered by the running range recovery
+            return
+        if self.range_recovery is None and self.n > 1 and hi - lo >= MIN_RANGE_DEPTH:
+            self.start_range_recovery(lo, hi)
+        else:
+            req = RequestBlockMessage(block.parent_block_id)
+            self.broadcast(req, 'RQB')
+
+    def start_range_recovery(self, lo, hi):
+        """Request the blocks with lo < depth <= hi in chunks from several peers in parallel.
+
+        Args:
+            lo (int): depth of the committed block, the recovered blocks continue it.
+            hi (int): depth of the deepest missing block.
+        """
+        responders = [i for i in range(self.n) if i != self.id]
+        chunks = split_range(lo, hi, responders)
+        self.range_recovery_counter += 1
+        self.range_recovery = RangeRecovery(self.range_recovery_counter, chunks, responders,
+                                            self.blocktree.committed_block.block_id)
+        logger.debug('start range recovery of depth %s to %s in %s chunks', str(lo), str(hi), str(len(chunks)))
+
+        req = RequestRangeMessage(self.range_recovery_counter, chunks)
+        self.broadcast(req, 'RQR')
+        deferLater(self.reactor, RANGE_TIMEOUT_RTTS * self.commit_rtt, self.range_recovery_timeout,
+                   self.range_recovery_counter)
+
+    def range_recovery_timeout(self, recovery_id):
+        """Request the chunks of a range recovery that are still incomplete from other peers."""
+        if self.range_recovery is None or self.range_recovery.recovery_id != recovery_id:
+            return
+        chunks = self.range_recovery.retry_chunks()
+        if chunks is None:
+            logger.debug('range recovery given up')
+            self.range_recovery = None
+            return
+
+        req = RequestRangeMessage(recovery_id, chunks)
+        self.broadcast(req, 'RQR')
+        deferLater(self.reactor, RANGE_TIMEOUT_RTTS * self.commit_rtt, self.range_recovery_timeout, recovery_id)
+
     def create_block(self):
         """Create a block containing `new_txs` and return it.
 
@@ -568,21 +1085,25 @@ class Node(ConnectionManager):
 
         # create block
         self.blocktree.counter += 1
-        if len(self.new_txs) < MAX_TXN_COUNT:
+        count = self.batching_policy.batch_size(self.new_txs)
+        if count == len(self.new_txs):
             b = Block(self.id, self.blocktree.head_block.block_id, self.new_txs, self.blocktree.counter)
             # create a new, empty list (do not use clear!)
             self.new_txs = []
         else:
             logger.debug('Cannot fit all transactions in the block that is beeing created. Remaining transactions '
                          'will be included in the next block.')
-            txns_include = self.new_txs[:MAX_TXN_COUNT]
+            txns_include = self.new_txs[:count]
             b = Block(self.id, self.blocktree.head_block.block_id, txns_include, self.blocktree.counter)
-            self.new_txs = self.new_txs[MAX_TXN_COUNT:]
+            self.new_txs = self.new_txs[count:]
             self.readjust_timeout()
 
         # compute its depth (will be fixed -> depth field is only set once)
         b.depth = d + len(b.txs)
 
+        if self.metrics is not None:
+            self.metrics.set('pichain_new_txs', len(self.new_txs))
+
         self.blocktree.db.put(b'counter', str(self.blocktree.counter).encode())
 
         # add block to blocktree
@@ -590,7 +1111,7 @@ class Node(ConnectionManager):
 
         # promote node
         if self.state != QUICK:
-            self.state = max(QUICK, self.state - 1)
+            self.change_state(max(QUICK, self.state - 1))
             logger.debug('Got promoted. State = %s', str(self.state))
 
         # add state of creator node to block
@@ -600,6 +1121,14 @@ class Node(ConnectionManager):
 
         return b
 
+    def change_state(self, state):
+        """Set the state of this node to `state` (QUICK, MEDIUM or SLOW)."""
+        if self.metrics is not None and state != self.state:
+            names = ['QUICK', 'MEDIUM', 'SLOW']
+            self.metrics.inc('pichain_state_transitions_total', src=names[self.state], dst=names[state])
+            self.metrics.set('pichain_state', state)
+        self.state = state
+
     def get_patience(self):
         """Returns the time a node has to wait before creating a new block.
         Corresponds to the nodes eagerness to create a new block.
@@ -607,6 +1136,12 @@ class Node(ConnectionManager):
         Returns:
             int: time node has to wait.
 
+        """
+        return self.get_state_patience() + self.batching_policy.get_accumulation_time(self.new_txs)
+
+    def get_state_patience(self):
+        """Returns the part of the patience given by the state of the node, without the accumulation time of the
+        batching policy.
         """
         if self.state == QUICK:
             patience = 0
@@ -622,7 +1157,7 @@ class Node(ConnectionManager):
 
             patience = (2. + EPSILON) * self.expected_rtt + self.slow_timeout_backoff * self.expected_rtt
 
-        return patience + ACCUMULATION_TIME
+        return patience
 
     def timeout_over(self, txn):
         """This function is called once a timeout is over. Will check if in the meantime the node received
@@ -634,6 +1169,20 @@ class Node(ConnectionManager):
         """
         logger.debug('timeout_over called')
         if txn in self.new_txs:
+            if self.commit_delivery is not None and self.commit_delivery.is_full():
+                # the app falls behind: do not create new blocks until it caught up. Patience may be 0, wait at least
+                # one delivery batch s.t the reactor does not spin.
+                logger.debug('commit delivery is full, postpone block creation')
+                backoff = max(self.get_patience(), self.commit_delivery.max_batch_delay)
+                deferLater(self.reactor, backoff, self.timeout_over, txn)
+                return
+
+            if self.lease_granted_to_other(self.id):
+                # the leaseholder will include txn, check again once the lease expired
+                remaining = self.lease_granted_until - self.reactor.seconds()
+                deferLater(self.reactor, remaining + self.get_patience(), self.timeout_over, txn)
+                return
+
             # create a new block
             b = self.create_block()
             self.move_to_block(b)
@@ -649,9 +1198,17 @@ class Node(ConnectionManager):
             # this block has already been committed
             return
 
+        # a quick proposing node may have several propose rounds in flight
+        if self.state == QUICK and self.c_quick_proposing and self.commit_window > 1:
+            if self.can_pipeline(self.c_current_committable_block):
+                self.start_pipelined_round(self.c_current_committable_block)
+                return
+
         #  if quick node then start a new instance of paxos
         if self.state == QUICK and not self.c_commit_running:
             logger.debug('start an new instance of paxos')
+            if self.metrics is not None:
+                self.metrics.inc('pichain_rounds_total', result='started')
             self.c_commit_running = True
             self.c_votes = 0
             self.c_request_seq += 1
@@ -659,7 +1216,7 @@ class Node(ConnectionManager):
             self.c_prop_block = None
 
             # set commit_running to False if after expected time needed for commit process still equals True
-            deferLater(self.reactor, 2 * self.expected_rtt + MAX_COMMIT_TIME, self.commit_timeout, self.c_request_seq)
+            deferLater(self.reactor, 2 * self.commit_rtt + MAX_COMMIT_TIME, self.commit_timeout, self.c_request_seq)
 
             if not self.c_quick_proposing:
                 self.c_new_block = self.c_current_committable_block
@@ -668,6 +1225,7 @@ class Node(ConnectionManager):
                 try_msg = PaxosMessage('TRY', self.c_request_seq)
                 try_msg.last_committed_block = self.blocktree.committed_block.block_id
                 try_msg.new_block = self.c_new_block.block_id
+                try_msg.leader = self.id
                 self.broadcast(try_msg, 'TRY')
                 self.receive_paxos_message(try_msg, None)
             else:
@@ -676,6 +1234,7 @@ class Node(ConnectionManager):
                 propose = PaxosMessage('PROPOSE', self.c_request_seq)
                 propose.com_block = self.c_current_committable_block.block_id
                 propose.new_block = GENESIS.block_id
+                self.request_lease(propose)
                 self.broadcast(propose, 'PROPOSE')
                 self.receive_paxos_message(propose, None)
 
@@ -684,7 +1243,118 @@ class Node(ConnectionManager):
             logger.debug('commit is already running, try to commit later')
             if not self.retry_commit_timeout_queued:
                 self.retry_commit_timeout_queued = True
-                deferLater(self.reactor, 2 * self.expected_rtt + MAX_COMMIT_TIME, self.start_commit_process)
+                deferLater(self.reactor, 2 * self.commit_rtt + MAX_COMMIT_TIME, self.start_commit_process)
+
+    def can_pipeline(self, block):
+        """Check if a new pipelined propose round for `block` may be started.
+
+        Args:
+            block (Block): Block that should be committed next.
+
+        Returns:
+            bool: True if the window is not full and `block` extends all blocks currently in flight.
+        """
+        if len(self.c_pipeline) >= self.commit_window:
+            return False
+
+        if not self.c_pipeline:
+            # no round in flight, but a commit with a TRY may still be running
+            return not self.c_commit_running
+
+        if block in self.c_pipeline.values():
+            return False
+
+        # the newest block in flight must be an ancestor of block
+        last_block = self.c_pipeline[max(self.c_pipeline)]
+        return self.blocktree.ancestor(last_block, block)
+
+    def start_pipelined_round(self, block):
+        """Start a quick propose round for `block` without waiting for the rounds already in flight.
+
+        Args:
+            block (Block): Block to be committed.
+        """
+        logger.debug('start pipelined round, rounds in flight = %s', str(len(self.c_pipeline)))
+        self.c_commit_running = True
+        self.c_request_seq += 1
+        self.c_pipeline.update({self.c_request_seq: block})
+        self.c_pipeline_votes.update({self.c_request_seq: 0})
+        if self.metrics is not None:
+            self.metrics.inc('pichain_rounds_total', result='started')
+
+        deferLater(self.reactor, 2 * self.commit_rtt + MAX_COMMIT_TIME, self.commit_timeout, self.c_request_seq)
+
+        propose = PaxosMessage('PROPOSE', self.c_request_seq)
+        propose.com_block = block.block_id
+        propose.new_block = GENESIS.block_id
+        self.request_lease(propose)
+        self.broadcast(propose, 'PROPOSE')
+        self.receive_paxos_message(propose, None)
+
+    def receive_pipelined_propose_ack(self, message):
+        """Count a PROPOSE_ACK of a pipelined round and commit its block once a majority acknowledged it.
+
+        Args:
+            message (PaxosMessage): PROPOSE_ACK message whose request_seq is in `c_pipeline`.
+        """
+        request_seq = message.request_seq
+        self.c_pipeline_votes[request_seq] += 1
+        if self.metrics is not None:
+            self.metrics.inc('pichain_votes_total', type='PROPOSE_ACK')
+        if self.c_pipeline_votes[request_seq] > self.n / 2:
+            block = self.c_pipeline.pop(request_seq)
+            del self.c_pipeline_votes[request_seq]
+            self.lease_acknowledged(request_seq)
+
+            commit = PaxosMessage('COMMIT', request_seq)
+            commit.com_block = block.block_id
+            self.broadcast(commit, 'COMMIT')
+
+            # committing block also finishes all rounds of its ancestors
+            self.commit(block)
+
+            # continue with the newest block if it is not yet in flight
+            b = self.c_current_committable_block
+            if b is not None and self.c_quick_proposing and b not in self.c_pipeline.values():
+                self.start_commit_process()
+
+    def request_lease(self, propose):
+        """Add the id of this node and, if leases are enabled, a lease request to `propose`.
+
+        Args:
+            propose (PaxosMessage): PROPOSE message sent by this node.
+        """
+        propose.leader = self.id
+        if self.lease_rtts > 0:
+            duration = self.lease_rtts * self.commit_rtt
+            propose.lease = int(duration * 1000)  # in ms
+            self.lease_requests.update({propose.request_seq: (self.reactor.seconds(), duration)})
+
+    def lease_acknowledged(self, request_seq):
+        """A majority acknowledged the PROPOSE with `request_seq`: the lease holds from the time it was sent."""
+        request = self.lease_requests.get(request_seq)
+        for seq in [seq for seq in self.lease_requests if seq <= request_seq]:
+            del self.lease_requests[seq]
+        if request is not None:
+            sent, duration = request
+            self.lease_expiry = max(self.lease_expiry or 0, sent + duration * (1 - LEASE_DRIFT))
+
+    def has_lease(self):
+        """Returns True if this node currently holds the leader lease."""
+        return self.lease_expiry is not None and self.reactor.seconds() < self.lease_expiry
+
+    def lease_granted_to_other(self, node_id):
+        """Returns True if this node granted a still valid lease to another node than `node_id`."""
+        return self.lease_holder is not None and self.lease_holder != node_id and \
+            self.reactor.seconds() < self.lease_granted_until
+
+    def abort_pipeline(self):
+        """Forget all pipelined rounds in flight. Their acknowledgements will be ignored."""
+        if self.c_pipeline:
+            logger.debug('abort %s pipelined rounds', str(len(self.c_pipeline)))
+            self.c_pipeline.clear()
+            self.c_pipeline_votes.clear()
+            self.c_commit_running = False
 
     def readjust_timeout(self):
         """Is called if `new_txs` changed and thus the `oldest_txn` may be removed."""
@@ -695,6 +1365,18 @@ class Node(ConnectionManager):
 
     def commit_timeout(self, commit_counter):
         """Is called once a commit should have been finished. If it is still running, it will be 'terminated'. """
+        if self.metrics is not None and (commit_counter in self.c_pipeline or
+                                         (self.c_commit_running and self.c_request_seq == commit_counter)):
+            self.metrics.inc('pichain_rounds_total', result='timeout')
+
+        if commit_counter in self.c_pipeline:
+            # a pipelined round did not get enough acknowledgements: fall back to a full commit
+            logger.debug('pipelined round terminated because did not receive enough acknowlegements')
+            self.c_quick_proposing = False
+            self.abort_pipeline()
+            self.start_commit_process()
+            return
+
         if self.c_commit_running and self.c_request_seq == commit_counter:
             self.c_commit_running = False
             self.c_quick_proposing = False
@@ -721,13 +1403,179 @@ class Node(ConnectionManager):
 
     # methods used by the app (part of external interface)
 
+    def enable_metrics(self, port=None):
+        """Start collecting metrics (see metrics module). If `port` is given, they are served in the Prometheus text
+        format on http://127.0.0.1:`port`/.
+
+        Args:
+            port (int): port of the local metrics endpoint.
+
+        Returns:
+            Metrics: the metrics of this node.
+        """
+        self.metrics = Metrics()
+        self.blocktree.db = TimedDB(self.blocktree.db, self.metrics)
+        if port is not None:
+            listen(self.reactor, self.metrics, port)
+        return self.metrics
+
+    def enable_stall_monitor(self, interval=0.01):
+        """Start measuring how late the reactor runs a call scheduled every `interval` seconds (see monitor module).
+
+        Args:
+            interval (float): time between two measurements in seconds.
+
+        Returns:
+            ReactorStallMonitor: the started monitor.
+        """
+        self.stall_monitor = ReactorStallMonitor(self.reactor, interval)
+        self.stall_monitor.start()
+        return self.stall_monitor
+
+    def enable_archive(self, segment_blocks=ARCHIVE_SEGMENT_BLOCKS):
+        """Archive pruned blocks in compressed segments instead of only deleting them (see archive module). Peers
+        can then still recover blocks below the genesis block from this node.
+
+        Args:
+            segment_blocks (int): number of blocks below the genesis block that are archived together.
+
+        Returns:
+            BlockArchive: the archive of this node.
+        """
+        self.archive = BlockArchive(self.blocktree.db, GENESIS.block_id)
+        self.archive_segment_blocks = segment_blocks
+        return self.archive
+
+    def enable_block_validation(self, **kwargs):
+        """Validate received blocks in batches on a worker thread instead of on the reactor thread, s.t message
+        handling does not wait behind a burst of blocks (see validation module).
+
+        Args:
+            **kwargs: passed on to `BlockValidation` (max_batch, run_in_thread).
+        """
+        self.block_validation = BlockValidation(self.blocktree, self.block_validated, self.reactor, **kwargs)
+
+    def enable_commit_delivery(self, **kwargs):
+        """Deliver committed commands to `tx_committed` in batches on a worker thread instead of once per block.
+        Blocks that were committed but not acknowledged by the app before a restart are delivered again. Must be
+        called after `tx_committed` is set.
+
+        Args:
+            **kwargs: passed on to `CommitDelivery` (max_batch_count, max_batch_delay, max_pending).
+        """
+        self.commit_delivery = CommitDelivery(self.tx_committed, self.reactor, self.blocktree.db,
+                                              on_delivered=self.commands_delivered, **kwargs)
+
+        # redeliver blocks which are committed but were not acknowledged
+        for offset, block_id in enumerate(self.blocktree.committed_blocks, 1):
+            if offset <= self.commit_delivery.delivered_offset:
+                continue
+            b = self.blocktree.nodes.get(block_id)
+            if b is None:
+                logger.debug('committed block %s already deleted, cannot redeliver it', str(block_id))
+                continue
+            self.commit_delivery.enqueue(offset, block_commands(b))
+
+    def commands_delivered(self, first, last):
+        """The app acknowledged the committed blocks at positions `first` to `last` (1-based): their txns are
+        committed from the point of view of a client, observe their commit latency.
+        """
+        if self.metrics is None:
+            return
+        for block_id in self.blocktree.committed_blocks[first - 1:last]:
+            b = self.blocktree.nodes.get(block_id)
+            if b is None:
+                continue
+            if isinstance(b.txs, TxnTable):
+                self.metrics.txns_committed(b.txs.txn_ids)
+            else:
+                self.metrics.txns_committed([txn.txn_id for txn in b.txs])
+
+    def enable_binary_codec(self):
+        """Send messages in the compact binary encoding of the codec module instead of their `serialize` method.
+        Messages the codec does not know (e.g pings) are still sent with `serialize`. All peers must enable it, their
+        networking module passes frames starting with `codec.FRAME_PREFIX` to `receive_frame`.
+        """
+        self.binary_codec = True
+
+    def broadcast(self, obj, msg_type):
+        if self.binary_codec and isinstance(obj, MESSAGE_TYPES):
+            obj = Encoded(obj)
+        super().broadcast(obj, msg_type)
+
+    def respond(self, obj, sender):
+        if self.binary_codec and isinstance(obj, MESSAGE_TYPES):
+            obj = Encoded(obj)
+        super().respond(obj, sender)
+
+    def receive_frame(self, data, sender):
+        """Receive a frame in the binary encoding of the codec module and hand the message to its receive method.
+
+        Args:
+            data (bytes): the received frame.
+            sender (Connection): Connection instance of the sender.
+        """
+        try:
+            obj = decode_frame(data)
+        except DecodeError as e:
+            logger.debug('dropped malformed frame: %s', str(e))
+            return
+        self.dispatch(obj, sender)
+
+    def dispatch(self, obj, sender):
+        """Hand a received message to the receive method matching its type.
+
+        Args:
+            obj: the received message.
+            sender: Connection instance of the sender (the index of the sender in the simulation).
+        """
+        if isinstance(obj, PaxosMessage):
+            self.receive_paxos_message(obj, sender)
+        elif isinstance(obj, Transaction):
+            self.receive_transaction(obj)
+        elif isinstance(obj, Block):
+            self.receive_block(obj)
+        elif isinstance(obj, RequestBlockMessage):
+            self.receive_request_blocks_message(obj, sender)
+        elif isinstance(obj, RespondBlockMessage):
+            self.receive_respond_blocks_message(obj)
+        elif isinstance(obj, AckCommitMessage):
+            self.receive_ack_commit_message(obj)
+        elif isinstance(obj, RequestRangeMessage):
+            self.receive_request_range_message(obj, sender)
+        elif isinstance(obj, RespondRangeMessage):
+            self.receive_respond_range_message(obj)
+        elif isinstance(obj, SnapshotOfferMessage):
+            self.receive_snapshot_offer_message(obj, sender)
+        elif isinstance(obj, RequestSnapshotMessage):
+            self.receive_request_snapshot_message(obj, sender)
+        elif isinstance(obj, SnapshotChunkMessage):
+            self.receive_snapshot_chunk_message(obj)
+
     def make_txn(self, command):
         """This method is called by the app with the command to be committed.
 
         Args:
             command (str): command to be commited
+
+        Returns:
+            Transaction: the txn containing `command`.
         """
         self.blocktree.counter += 1
         txn = Transaction(self.id, command, self.blocktree.counter)
         self.blocktree.db.put(b'counter', str(self.blocktree.counter).encode())
         self.broadcast(txn, 'TXN')
+        return txn
+
+    def submit(self, command, client_id=None):
+        """Like `make_txn` but with admission control: the command is rejected if too many submitted commands (of
+        all clients or of `client_id`) are not yet committed (see client module).
+
+        Args:
+            command (str): command to be commited
+            client_id: identifies the client for its quota.
+
+        Returns:
+            Deferred: fires with `command` once it is committed, fails with QueueFull if it was rejected.
+        """
+        return self.admission.submit(command, client_id)
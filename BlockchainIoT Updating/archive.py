@@ -0,0 +1,177 @@
+"""This module implements the archive of committed blocks below the genesis block.
+Instead of deleting pruned blocks, a node may pack them into compressed archive segments stored in its LevelDB. Every
+block of a segment is compressed on its own with a preset dictionary shared by all segments, thus a single block can
+be read without decompressing the whole segment. The dictionary is built from the blocks of the first segment.
+
+Keys in the db:
+    b'archive_dict': the preset dictionary.
+    b'archive:<first depth>:<last depth>': a segment (depths zero padded s.t the keys are sorted by depth).
+    b'archive_id:<block_id>': key of the segment containing the block.
+    b'archive_complete': present if the archive contains all blocks down to the initial genesis block.
+"""
+
+import logging
+import zlib
+from bisect import bisect_right
+
+from piChain.codec import Writer, Reader, encode, decode
+
+logger = logging.getLogger(__name__)
+
+# number of blocks below the genesis block which are archived together
+ARCHIVE_SEGMENT_BLOCKS = 1000
+
+# maximal size of the preset dictionary (zlib uses at most 32 KiB)
+DICT_SIZE = 32 * 1024
+
+ARCHIVE_LEVEL = 9
+
+SEGMENT_PREFIX = b'archive:'
+ID_PREFIX = b'archive_id:'
+DICT_KEY = b'archive_dict'
+
+
+def segment_key(first_depth, last_depth):
+    return SEGMENT_PREFIX + b'%020d:%020d' % (first_depth, last_depth)
+
+
+def build_dictionary(samples, size=DICT_SIZE):
+    """Returns a preset dictionary built from `samples` (encoded blocks): samples spread evenly over the given ones
+    are concatenated until `size` bytes are reached.
+
+    Args:
+        samples (list): encoded blocks.
+        size (int): maximal size of the dictionary.
+    """
+    total = sum(len(sample) for sample in samples)
+    step = max(1, total // size)
+    return b''.join(samples[::step])[-size:]
+
+
+class Segment:
+    """Decoded header of a segment.
+
+    Args:
+        data (bytes): the stored segment.
+    """
+    __slots__ = ['block_ids', 'depths', 'offsets', 'data', 'start']
+
+    def __init__(self, data):
+        r = Reader(data)
+        count = r.uint()
+        self.block_ids = []
+        self.depths = []
+        self.offsets = [0]
+        for _ in range(count):
+            self.block_ids.append(r.int())
+            self.depths.append(r.int())
+            self.offsets.append(self.offsets[-1] + r.uint())
+        self.data = data
+        self.start = r.pos
+
+
+class BlockArchive:
+    """Archive of committed blocks below the genesis block (see module docstring).
+
+    Args:
+        db: the LevelDB (plyvel.DB) of the node.
+        root_id (int): id of the initial genesis block.
+
+    Attributes:
+        segments (list): (first depth, last depth) of all segments, sorted.
+        dictionary (bytes): preset dictionary of the compression (None until the first segment is written).
+        cache (tuple): (key, Segment) of the segment read last.
+    """
+    def __init__(self, db, root_id):
+        self.db = db
+        self.root_id = root_id
+        self.dictionary = db.get(DICT_KEY)
+        self.segments = []
+        for key in db.iterator(prefix=SEGMENT_PREFIX, include_value=False):
+            first, last = key[len(SEGMENT_PREFIX):].split(b':')
+            self.segments.append((int(first), int(last)))
+        self.segments.sort()
+        self.complete = db.get(b'archive_complete') is not None
+        self.cache = None
+
+    def add(self, blocks):
+        """Archive `blocks` as one segment.
+
+        Args:
+            blocks (list): consecutive committed blocks sorted by depth.
+        """
+        encoded = [encode(b) for b in blocks]
+        if self.dictionary is None:
+            self.dictionary = build_dictionary(encoded)
+            self.db.put(DICT_KEY, self.dictionary)
+
+        compressed = []
+        for data in encoded:
+            c = zlib.compressobj(ARCHIVE_LEVEL, zdict=self.dictionary)
+            compressed.append(c.compress(data) + c.flush())
+
+        w = Writer()
+        w.uint(len(blocks))
+        for b, data in zip(blocks, compressed):
+            w.int(b.block_id)
+            w.int(b.depth)
+            w.uint(len(data))
+        w.buf += b''.join(compressed)
+
+        first, last = blocks[0].depth, blocks[-1].depth
+        key = segment_key(first, last)
+        with self.db.write_batch() as wb:
+            wb.put(key, bytes(w.buf))
+            for b in blocks:
+                wb.put(ID_PREFIX + str(b.block_id).encode(), key)
+            if not self.segments and blocks[0].parent_block_id == self.root_id:
+                wb.put(b'archive_complete', b'1')
+                self.complete = True
+        self.segments.insert(bisect_right(self.segments, (first, last)), (first, last))
+        logger.debug('archived %s blocks in %s bytes', str(len(blocks)), str(len(w.buf)))
+
+    def segment(self, key):
+        if self.cache is None or self.cache[0] != key:
+            data = self.db.get(key)
+            if data is None:
+                return None
+            self.cache = (key, Segment(data))
+        return self.cache[1]
+
+    def block(self, segment, i):
+        d = zlib.decompressobj(zdict=self.dictionary)
+        data = segment.data[segment.start + segment.offsets[i]:segment.start + segment.offsets[i + 1]]
+        return decode(d.decompress(data) + d.flush())
+
+    def get(self, block_id):
+        """Returns the archived block with `block_id` or None."""
+        key = self.db.get(ID_PREFIX + str(block_id).encode())
+        if key is None:
+            return None
+        segment = self.segment(key)
+        if segment is None:
+            return None
+        return self.block(segment, segment.block_ids.index(block_id))
+
+    def covers(self, lo):
+        """Returns True if all archived blocks with depth > `lo` can be read from the archive, i.e the archive reaches
+        down to depth `lo`.
+        """
+        if not self.segments:
+            return False
+        return self.complete or self.segments[0][0] <= lo
+
+    def collect(self, lo, hi):
+        """Returns the archived blocks with lo < depth <= hi sorted by depth."""
+        blocks = []
+        i = max(0, bisect_right(self.segments, (lo, float('inf'))) - 1)
+        for first, last in self.segments[i:]:
+            if first > hi:
+                break
+            if last <= lo:
+                continue
+            segment = self.segment(segment_key(first, last))
+            for j, depth in enumerate(segment.depths):
+                if lo < depth <= hi:
+                    blocks.append(self.block(segment, j))
+        return blocks
@@ -0,0 +1,149 @@
+"""This module defines the policies a node uses to decide how many transactions go into a new block and how long it
+waits for further transactions before creating it.
+"""
+
+import time
+from itertools import islice
+
+from piChain.config import ACCUMULATION_TIME, MAX_TXN_COUNT
+
+
+class FixedBatchingPolicy:
+    """Always wait `ACCUMULATION_TIME` and include at most `MAX_TXN_COUNT` transactions in a block.
+
+    Args:
+        max_count (int): maximal number of transactions in a block.
+        accumulation_time (float): time added to the patience of a node to accumulate transactions.
+    """
+    def __init__(self, max_count=MAX_TXN_COUNT, accumulation_time=ACCUMULATION_TIME):
+        self.max_count = max_count
+        self.accumulation_time = accumulation_time
+
+    def observe(self, txn):
+        """Is called for every new transaction that is added to the queue of a node.
+
+        Args:
+            txn (Transaction): the new transaction.
+        """
+        pass
+
+    def get_accumulation_time(self, new_txs):
+        """Returns the time a node waits for further transactions before creating a block out of `new_txs`.
+
+        Args:
+            new_txs (list): txs not yet in a block.
+
+        Returns:
+            float: accumulation time in seconds.
+        """
+        return self.accumulation_time
+
+    def is_full(self, new_txs):
+        """Returns True if `new_txs` fill a block, i.e waiting for further transactions does not make it larger.
+
+        Args:
+            new_txs (list): txs not yet in a block.
+        """
+        return len(new_txs) >= self.max_count
+
+    def batch_size(self, new_txs):
+        """Returns how many transactions from the front of `new_txs` are included in the next block.
+
+        Args:
+            new_txs (list): txs not yet in a block.
+
+        Returns:
+            int: number of transactions.
+        """
+        return min(len(new_txs), self.max_count)
+
+
+class AdaptiveBatchingPolicy(FixedBatchingPolicy):
+    """Size blocks by both the number of transactions and their size in bytes and adapt the accumulation time to
+    the observed load.
+
+    A node only waits for further transactions if it expects at least one of them to arrive during the accumulation
+    time. It waits at most as long as it expects to need to fill a block, thus a deep queue is turned into a block
+    immediately.
+
+    Args:
+        max_count (int): maximal number of transactions in a block.
+        max_bytes (int): maximal size of the commands of all transactions in a block.
+        accumulation_time (float): upper bound of the accumulation time.
+        alpha (float): weight of a new sample in the moving average of the interarrival time.
+        clock (Callable): returns the current time in seconds (replaced by the virtual time in simulations).
+
+    Attributes:
+        mean_interval (float): moving average of the time between two received transactions (None if unknown).
+        last_arrival (float): time the last transaction was received.
+    """
+    def __init__(self, max_count=MAX_TXN_COUNT, max_bytes=64 * 1024, accumulation_time=ACCUMULATION_TIME,
+                 alpha=0.125, clock=time.time):
+        super().__init__(max_count, accumulation_time)
+        self.max_bytes = max_bytes
+        self.alpha = alpha
+        self.clock = clock
+        self.mean_interval = None
+        self.last_arrival = None
+
+    @staticmethod
+    def txn_size(txn):
+        """Returns the size of the command of `txn` in bytes."""
+        return len(str(txn.content).encode())
+
+    @property
+    def arrival_rate(self):
+        """float: estimated number of transactions received per second."""
+        if self.mean_interval is None:
+            return 0.
+        # a burst of txns received at once must not lead to a division by zero
+        return 1. / max(self.mean_interval, 1e-6)
+
+    def observe(self, txn):
+        now = self.clock()
+        if self.last_arrival is not None:
+            interval = now - self.last_arrival
+            if self.mean_interval is None:
+                self.mean_interval = interval
+            else:
+                self.mean_interval = (1 - self.alpha) * self.mean_interval + self.alpha * interval
+        self.last_arrival = now
+
+    def fill(self, new_txs):
+        """Returns how many transactions from the front of `new_txs` go into the next block and whether that block is
+        full, i.e no further transaction fits. The commands of a block are at most `max_bytes` long, a block reaching
+        exactly `max_bytes` is full. Looks at no more than `max_count` transactions.
+
+        Args:
+            new_txs (list): txs not yet in a block.
+
+        Returns:
+            tuple: (number of transactions, True if the block is full).
+        """
+        count = 0
+        size = 0
+        for txn in islice(new_txs, self.max_count):
+            size += self.txn_size(txn)
+            # a single txn larger than max_bytes still gets its own block
+            if size > self.max_bytes and count > 0:
+                return count, True
+            count += 1
+        return count, count >= self.max_count or size >= self.max_bytes
+
+    def get_accumulation_time(self, new_txs):
+        if self.is_full(new_txs):
+            # queue is deep enough to fill a block
+            return 0
+
+        # light load: not worth waiting for the next txn
+        if self.arrival_rate * self.accumulation_time < 1:
+            return 0
+
+        time_to_fill = (self.max_count - len(new_txs)) / self.arrival_rate
+        return min(self.accumulation_time, time_to_fill)
+
+    def is_full(self, new_txs):
+        return len(new_txs) >= self.max_count or self.fill(new_txs)[1]
+
+    def batch_size(self, new_txs):
+        return self.fill(new_txs)[0]
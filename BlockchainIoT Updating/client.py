@@ -0,0 +1,105 @@
+"""This module implements the admission control of commands submitted by clients of a node.
+The number of commands that are submitted but not yet committed is bounded, in total and per client. A command
+exceeding a bound is rejected immediately instead of being queued, s.t the latency of admitted commands stays
+predictable. Every admitted command gets a Deferred which fires once it is committed. Txns received from other nodes
+are bounded separately (see `PaxosLogic.MAX_NEW_TXS`).
+
+An asyncio app can wait for it with `Deferred.asFuture(loop)`.
+"""
+
+import logging
+
+from twisted.internet import defer
+
+logger = logging.getLogger(__name__)
+
+# default bounds of the commands in flight
+MAX_IN_FLIGHT = 1000
+MAX_IN_FLIGHT_PER_CLIENT = 100
+
+
+class QueueFull(Exception):
+    """Raised (through the returned Deferred) if a command is rejected because too many commands are in flight."""
+
+
+class SubmitTimeout(Exception):
+    """Raised (through the returned Deferred) if a command was not committed in time. It may still be committed."""
+
+
+class Admission:
+    """Admission control and commit notification of the commands submitted at a node.
+
+    Args:
+        node (Node): the node the commands are submitted to.
+        max_in_flight (int): maximal number of submitted but not committed commands.
+        max_per_client (int): maximal number of submitted but not committed commands of a single client.
+        timeout (float): seconds after which the Deferred of a not committed command fails (None: no timeout).
+
+    Attributes:
+        pending (dict): Mapping from txn_id to (client_id, Deferred, IDelayedCall of the timeout).
+        per_client (dict): Mapping from client_id to its number of commands in flight.
+    """
+    def __init__(self, node, max_in_flight=MAX_IN_FLIGHT, max_per_client=MAX_IN_FLIGHT_PER_CLIENT, timeout=None):
+        self.node = node
+        self.max_in_flight = max_in_flight
+        self.max_per_client = max_per_client
+        self.timeout = timeout
+        self.pending = {}
+        self.per_client = {}
+
+    def submit(self, command, client_id=None):
+        """Submit `command` if the bounds allow it.
+
+        Args:
+            command (str): command to be committed.
+            client_id: identifies the client for its quota.
+
+        Returns:
+            Deferred: fires with `command` once it is committed, fails with QueueFull if it was rejected.
+        """
+        if len(self.pending) >= self.max_in_flight:
+            return defer.fail(QueueFull('%d commands in flight' % len(self.pending)))
+        if self.per_client.get(client_id, 0) >= self.max_per_client:
+            return defer.fail(QueueFull('quota of client %s exhausted' % str(client_id)))
+
+        txn = self.node.make_txn(command)
+        d = defer.Deferred()
+        call = None
+        if self.timeout is not None:
+            call = self.node.reactor.callLater(self.timeout, self.timed_out, txn.txn_id)
+        self.pending.update({txn.txn_id: (client_id, d, call)})
+        self.per_client.update({client_id: self.per_client.get(client_id, 0) + 1})
+        return d
+
+    def release(self, txn_id):
+        """Free the slot of the command with `txn_id`.
+
+        Returns:
+            Deferred: the Deferred of the command or None if it is not in flight.
+        """
+        entry = self.pending.pop(txn_id, None)
+        if entry is None:
+            return None
+        client_id, d, call = entry
+        if call is not None and call.active():
+            call.cancel()
+        count = self.per_client[client_id] - 1
+        if count == 0:
+            del self.per_client[client_id]
+        else:
+            self.per_client[client_id] = count
+        return d
+
+    def committed(self, block):
+        """Is called for every committed `block`: fire the Deferreds of its commands submitted at this node."""
+        if not self.pending:
+            return
+        for txn in block.txs:
+            d = self.release(txn.txn_id)
+            if d is not None:
+                d.callback(txn.content)
+
+    def timed_out(self, txn_id):
+        d = self.release(txn_id)
+        if d is not None:
+            d.errback(SubmitTimeout('command not committed within %s seconds' % str(self.timeout)))
@@ -0,0 +1,421 @@
+"""This module implements a compact, versioned binary encoding of the messages exchanged between piChain nodes.
+
+Every encoded message starts with the format version and a type byte. Integers are zigzag varints, strings and
+bytes are prefixed by their length. Paxos messages only contain block ids, blocks are sent in full only if they are
+broadcast (BLK) or requested (RQB, RQR).
+
+The networking module sends the result of `serialize` of a message as one frame. `Encoded` wraps a message s.t its
+frame is `FRAME_PREFIX` followed by this encoding, `decode_frame` decodes such a frame (see
+`Node.enable_binary_codec`).
+
+Usage (benchmark):
+    python codec.py --txs 100 --rounds 10000
+"""
+
+import argparse
+import pickle
+import time
+
+from piChain.messages import PaxosMessage, Block, Transaction, RequestBlockMessage, RespondBlockMessage, \
+    AckCommitMessage
+from piChain.recovery import RequestRangeMessage, RespondRangeMessage
+from piChain.snapshot import SnapshotOfferMessage, RequestSnapshotMessage, SnapshotChunkMessage
+
+VERSION = 1
+
+# type bytes
+PAXOS = 1
+BLOCK = 2
+TXN = 3
+RQB = 4
+RSB = 5
+ACM = 6
+RQR = 7
+RSR = 8
+SNO = 9
+RQS = 10
+SNC = 11
+
+PAXOS_TYPES = ['TRY', 'TRY_OK', 'PROPOSE', 'PROPOSE_ACK', 'COMMIT']
+
+# optional int fields of a PaxosMessage (block ids, leader id and lease in ms), their presence is encoded in a bit mask
+PAXOS_FIELDS = ['last_committed_block', 'new_block', 'com_block', 'prop_block', 'supp_block', 'leader', 'lease']
+
+# first bytes of a frame carrying a message in this encoding (other frames start with the type of the message)
+FRAME_PREFIX = b'BIN'
+
+# classes of the messages this codec can encode
+MESSAGE_TYPES = (PaxosMessage, Block, Transaction, RequestBlockMessage, RespondBlockMessage, AckCommitMessage,
+                 RequestRangeMessage, RespondRangeMessage, SnapshotOfferMessage, RequestSnapshotMessage,
+                 SnapshotChunkMessage)
+
+# parent of the blocks used in the benchmark
+GENESIS_ID = -1
+
+
+class DecodeError(Exception):
+    """Raised if a message can not be decoded."""
+
+
+class Writer:
+    """Appends encoded values to a bytearray."""
+    __slots__ = ['buf']
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def uint(self, value):
+        while value > 0x7f:
+            self.buf.append((value & 0x7f) | 0x80)
+            value >>= 7
+        self.buf.append(value)
+
+    def int(self, value):
+        # zigzag encoding, works for arbitrarily large python ints
+        self.uint(value * 2 if value >= 0 else -value * 2 - 1)
+
+    def opt_int(self, value):
+        if value is None:
+            self.buf.append(0)
+        else:
+            self.buf.append(1)
+            self.int(value)
+
+    def bytes(self, value):
+        self.uint(len(value))
+        self.buf += value
+
+    def str(self, value):
+        self.bytes(value.encode())
+
+
+class Reader:
+    """Reads encoded values from bytes."""
+    __slots__ = ['data', 'pos']
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def byte(self):
+        if self.pos >= len(self.data):
+            raise DecodeError('truncated message')
+        b = self.data[self.pos]
+        self.pos += 1
+        return b
+
+    def uint(self):
+        value = 0
+        shift = 0
+        while True:
+            b = self.byte()
+            value |= (b & 0x7f) << shift
+            if b < 0x80:
+                return value
+            shift += 7
+
+    def int(self):
+        value = self.uint()
+        return value >> 1 if value & 1 == 0 else -(value >> 1) - 1
+
+    def opt_int(self):
+        return self.int() if self.byte() else None
+
+    def bytes(self):
+        length = self.uint()
+        if self.pos + length > len(self.data):
+            raise DecodeError('truncated message')
+        value = self.data[self.pos:self.pos + length].tobytes()
+        self.pos += length
+        return value
+
+    def str(self):
+        try:
+            return self.bytes().decode()
+        except UnicodeDecodeError:
+            raise DecodeError('invalid string')
+
+
+def write_txn(w, txn):
+    w.int(txn.creator_id)
+    w.int(txn.txn_id)
+    w.str(txn.content)
+
+
+def read_txn(r):
+    creator_id = r.int()
+    txn_id = r.int()
+    txn = Transaction(creator_id, r.str(), 0)
+    txn.txn_id = txn_id
+    return txn
+
+
+def write_block(w, block):
+    w.int(block.creator_id)
+    w.opt_int(block.parent_block_id)
+    w.int(block.block_id)
+    w.int(block.depth)
+    w.opt_int(getattr(block, 'creator_state', None))
+    w.uint(len(block.txs))
+    for txn in block.txs:
+        write_txn(w, txn)
+
+
+def read_block(r):
+    creator_id = r.int()
+    parent_block_id = r.opt_int()
+    block_id = r.int()
+    depth = r.int()
+    creator_state = r.opt_int()
+    txs = [read_txn(r) for _ in range(r.uint())]
+    block = Block(creator_id, parent_block_id, txs, 0)
+    block.block_id = block_id
+    block.depth = depth
+    if creator_state is not None:
+        block.creator_state = creator_state
+    return block
+
+
+def write_blocks(w, blocks):
+    w.uint(len(blocks))
+    for b in blocks:
+        write_block(w, b)
+
+
+def read_blocks(r):
+    return [read_block(r) for _ in range(r.uint())]
+
+
+def encode(obj):
+    """Encode a message.
+
+    Args:
+        obj: PaxosMessage, Block, Transaction, RequestBlockMessage, RespondBlockMessage, AckCommitMessage or one of
+            the range recovery and snapshot messages.
+
+    Returns:
+        bytes: the encoded message.
+    """
+    w = Writer()
+    w.buf.append(VERSION)
+    if isinstance(obj, PaxosMessage):
+        w.buf.append(PAXOS)
+        w.buf.append(PAXOS_TYPES.index(obj.msg_type))
+        w.int(obj.request_seq)
+        values = [getattr(obj, field, None) for field in PAXOS_FIELDS]
+        mask = 0
+        for i, value in enumerate(values):
+            if value is not None:
+                mask |= 1 << i
+        w.buf.append(mask)
+        for value in values:
+            if value is not None:
+                w.int(value)
+    elif isinstance(obj, Block):
+        w.buf.append(BLOCK)
+        write_block(w, obj)
+    elif isinstance(obj, Transaction):
+        w.buf.append(TXN)
+        write_txn(w, obj)
+    elif isinstance(obj, RequestBlockMessage):
+        w.buf.append(RQB)
+        w.int(obj.block_id)
+    elif isinstance(obj, RespondBlockMessage):
+        w.buf.append(RSB)
+        write_blocks(w, obj.blocks)
+    elif isinstance(obj, AckCommitMessage):
+        w.buf.append(ACM)
+        w.int(obj.block_id)
+    elif isinstance(obj, RequestRangeMessage):
+        w.buf.append(RQR)
+        w.uint(obj.recovery_id)
+        w.uint(len(obj.chunks))
+        for lo, hi, responder_id in obj.chunks:
+            w.int(lo)
+            w.int(hi)
+            w.int(responder_id)
+    elif isinstance(obj, RespondRangeMessage):
+        w.buf.append(RSR)
+        w.uint(obj.recovery_id)
+        w.int(obj.lo)
+        w.int(obj.hi)
+        w.buf.append(1 if obj.last else 0)
+        w.int(obj.responder_id)
+        write_blocks(w, obj.blocks)
+    elif isinstance(obj, SnapshotOfferMessage):
+        w.buf.append(SNO)
+        write_block(w, obj.block)
+        w.uint(obj.size)
+        w.str(obj.digest)
+    elif isinstance(obj, RequestSnapshotMessage):
+        w.buf.append(RQS)
+        w.int(obj.block_id)
+        w.uint(len(obj.indices))
+        for index in obj.indices:
+            w.uint(index)
+    elif isinstance(obj, SnapshotChunkMessage):
+        w.buf.append(SNC)
+        w.int(obj.block_id)
+        w.uint(obj.index)
+        w.bytes(obj.data)
+        w.str(obj.digest)
+    else:
+        raise TypeError('cannot encode ' + type(obj).__name__)
+    return bytes(w.buf)
+
+
+def decode(data):
+    """Decode a message encoded by `encode`.
+
+    Args:
+        data (bytes): the encoded message.
+
+    Returns:
+        the decoded message.
+
+    Raises:
+        DecodeError: if the version is not supported or the message is malformed.
+    """
+    r = Reader(data)
+    version = r.byte()
+    if version != VERSION:
+        raise DecodeError('unsupported version ' + str(version))
+    t = r.byte()
+    if t == PAXOS:
+        msg_type = r.byte()
+        if msg_type >= len(PAXOS_TYPES):
+            raise DecodeError('unknown paxos message type ' + str(msg_type))
+        msg = PaxosMessage(PAXOS_TYPES[msg_type], r.int())
+        mask = r.byte()
+        for i, field in enumerate(PAXOS_FIELDS):
+            if mask & (1 << i):
+                setattr(msg, field, r.int())
+        return msg
+    elif t == BLOCK:
+        return read_block(r)
+    elif t == TXN:
+        return read_txn(r)
+    elif t == RQB:
+        return RequestBlockMessage(r.int())
+    elif t == RSB:
+        return RespondBlockMessage(read_blocks(r))
+    elif t == ACM:
+        return AckCommitMessage(r.int())
+    elif t == RQR:
+        recovery_id = r.uint()
+        chunks = [[r.int(), r.int(), r.int()] for _ in range(r.uint())]
+        return RequestRangeMessage(recovery_id, chunks)
+    elif t == RSR:
+        recovery_id = r.uint()
+        lo = r.int()
+        hi = r.int()
+        last = r.byte() == 1
+        responder_id = r.int()
+        return RespondRangeMessage(recovery_id, lo, hi, read_blocks(r), last, responder_id)
+    elif t == SNO:
+        block = read_block(r)
+        return SnapshotOfferMessage(block, r.uint(), r.str())
+    elif t == RQS:
+        block_id = r.int()
+        return RequestSnapshotMessage(block_id, [r.uint() for _ in range(r.uint())])
+    elif t == SNC:
+        block_id = r.int()
+        index = r.uint()
+        return SnapshotChunkMessage(block_id, index, r.bytes(), r.str())
+    raise DecodeError('unknown message type ' + str(t))
+
+
+class Encoded:
+    """A message that is serialized in this encoding when the networking module sends it.
+
+    Args:
+        obj: a message of one of the `MESSAGE_TYPES`.
+    """
+    __slots__ = ['obj']
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def serialize(self):
+        return FRAME_PREFIX + encode(self.obj)
+
+
+def decode_frame(data):
+    """Decode a frame sent by the networking module for an `Encoded` message.
+
+    Args:
+        data (bytes): the received frame.
+
+    Returns:
+        the decoded message.
+
+    Raises:
+        DecodeError: if `data` does not start with `FRAME_PREFIX` or the message is malformed.
+    """
+    if not data.startswith(FRAME_PREFIX):
+        raise DecodeError('not a binary frame')
+    return decode(memoryview(data)[len(FRAME_PREFIX):])
+
+
+def default_encode(obj):
+    """Encoding used by the networking module without this codec."""
+    if hasattr(obj, 'serialize'):
+        return obj.serialize()
+    return pickle.dumps(obj)
+
+
+def commit_messages(n, txs):
+    """Returns (message, count) pairs of all messages sent by a full TRY/PROPOSE/COMMIT commit of a block with `txs`
+    transactions in a cluster of `n` nodes.
+    """
+    block = Block(0, GENESIS_ID, [Transaction(0, 'command %s' % i, i) for i in range(txs)], 1)
+    block.depth = txs
+    block.creator_state = 0
+
+    try_msg = PaxosMessage('TRY', 1)
+    try_msg.last_committed_block = GENESIS_ID
+    try_msg.new_block = block.block_id
+    try_ok = PaxosMessage('TRY_OK', 1)
+    propose = PaxosMessage('PROPOSE', 2)
+    propose.com_block = block.block_id
+    propose.new_block = block.block_id
+    propose_ack = PaxosMessage('PROPOSE_ACK', 2)
+    propose_ack.com_block = block.block_id
+    commit = PaxosMessage('COMMIT', 3)
+    commit.com_block = block.block_id
+    acm = AckCommitMessage(block.block_id)
+
+    peers = n - 1
+    return [(block.txs[0], txs * peers), (block, peers), (try_msg, peers), (try_ok, peers), (propose, peers),
+            (propose_ack, peers), (commit, peers), (acm, n * peers)]
+
+
+def benchmark(n, txs, rounds):
+    """Print encode/decode throughput and bytes on the wire per commit of both encodings."""
+    messages = commit_messages(n, txs)
+    block = messages[1][0]
+
+    for name, enc in [('default', default_encode), ('binary', encode)]:
+        per_commit = sum(len(enc(msg)) * count for msg, count in messages)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            data = enc(block)
+        encode_time = time.perf_counter() - start
+
+        line = '%-8s bytes/commit=%-8d block encode=%.0f/s' % (name, per_commit, rounds / encode_time)
+        if enc is encode:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                decode(data)
+            line += ' block decode=%.0f/s' % (rounds / (time.perf_counter() - start))
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', default=3, type=int, help='number of nodes')
+    parser.add_argument('--txs', default=100, type=int, help='transactions per block')
+    parser.add_argument('--rounds', default=10000, type=int, help='number of encoded/decoded blocks')
+    args = parser.parse_args()
+    benchmark(args.nodes, args.txs, args.rounds)
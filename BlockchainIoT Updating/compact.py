@@ -0,0 +1,191 @@
+"""This module implements a memory-compact representation of committed blocks.
+A Block keeps a list of Transaction objects, each with its own dict. Once a block is committed it is only read
+again to answer recovery requests, thus its transactions are packed into a table of arrays and a single bytes
+object. Transaction objects are only created again (lazily) if a transaction is accessed.
+
+Ids are packed into arrays of 64 bit integers, a table with an id that does not fit keeps its ids in a list instead.
+Commands may be str or bytes, bytes are stored as they are and returned as bytes.
+
+Usage (benchmark):
+    python compact.py --blocks 1000 --txs 100
+"""
+
+import argparse
+import tracemalloc
+from array import array
+
+from piChain.messages import Block, Transaction
+
+
+def append_id(ids, value):
+    """Append `value` to `ids` (an array of 64 bit integers or a list) and return `ids`. If `value` does not fit in
+    the array, a list with the same ids is returned instead.
+    """
+    try:
+        ids.append(value)
+    except OverflowError:
+        ids = list(ids)
+        ids.append(value)
+    return ids
+
+
+class TxnTable:
+    """Read-only sequence of transactions packed into arrays.
+
+    Args:
+        txs (list): the transactions to pack.
+
+    Attributes:
+        creator_ids (array): creator id of every transaction (a list if an id does not fit in 64 bits).
+        txn_ids (array): txn_id of every transaction (a list if an id does not fit in 64 bits).
+        offsets (array): start of the command of every transaction in `data`, followed by the length of `data`.
+        data (bytes): the commands, str commands are utf-8 encoded.
+        raw (frozenset): indices of the transactions whose command is bytes (None if there is none).
+        index (frozenset): txn ids for membership tests, built on first use.
+    """
+    __slots__ = ['creator_ids', 'txn_ids', 'offsets', 'data', 'raw', 'index']
+
+    def __init__(self, txs):
+        self.creator_ids = array('q')
+        self.txn_ids = array('q')
+        self.offsets = array('L', [0])
+        contents = []
+        raw = []
+        for i, txn in enumerate(txs):
+            self.creator_ids = append_id(self.creator_ids, txn.creator_id)
+            self.txn_ids = append_id(self.txn_ids, txn.txn_id)
+            content = txn.content
+            if isinstance(content, str):
+                content = content.encode()
+            else:
+                raw.append(i)
+            contents.append(content)
+            self.offsets.append(self.offsets[-1] + len(content))
+        self.data = b''.join(contents)
+        self.raw = frozenset(raw) if raw else None
+        self.index = None
+
+    def __len__(self):
+        return len(self.txn_ids)
+
+    def __contains__(self, txn):
+        """Membership by txn_id, the index is built on first use (most committed blocks are never searched)."""
+        if self.index is None:
+            self.index = frozenset(self.txn_ids)
+        return getattr(txn, 'txn_id', None) in self.index
+
+    def content(self, i):
+        """Returns the command of transaction `i` without creating a Transaction object."""
+        content = self.data[self.offsets[i]:self.offsets[i + 1]]
+        if self.raw is not None and i in self.raw:
+            return content
+        return content.decode()
+
+    def contents(self):
+        """Returns the commands of all transactions."""
+        return [self.content(i) for i in range(len(self))]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        txn = Transaction(self.creator_ids[i], self.content(i), 0)
+        txn.txn_id = self.txn_ids[i]
+        return txn
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class CompactBlock:
+    """A committed block whose transactions are stored in a `TxnTable`. Compares equal to the Block it was created
+    from.
+
+    Args:
+        block (Block): the block to pack.
+    """
+    __slots__ = ['creator_id', 'parent_block_id', 'block_id', 'depth', 'creator_state', 'txs']
+
+    def __init__(self, block):
+        self.creator_id = block.creator_id
+        self.parent_block_id = block.parent_block_id
+        self.block_id = block.block_id
+        self.depth = block.depth
+        self.creator_state = getattr(block, 'creator_state', None)
+        self.txs = TxnTable(block.txs)
+
+    def __eq__(self, other):
+        return other is not None and hasattr(other, 'block_id') and self.block_id == other.block_id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.block_id)
+
+    def __lt__(self, other):
+        return self.depth < other.depth
+
+    def __gt__(self, other):
+        return self.depth > other.depth
+
+    def expand(self):
+        """Returns a regular Block (e.g to send it to a peer)."""
+        block = Block(self.creator_id, self.parent_block_id, list(self.txs), 0)
+        block.block_id = self.block_id
+        block.depth = self.depth
+        if self.creator_state is not None:
+            block.creator_state = self.creator_state
+        return block
+
+
+def block_commands(block):
+    """Returns the commands of all transactions of `block` (a Block or a CompactBlock)."""
+    if isinstance(block.txs, TxnTable):
+        return block.txs.contents()
+    return [txn.content for txn in block.txs]
+
+
+def expand(block):
+    """Returns `block` as a regular Block."""
+    if isinstance(block, CompactBlock):
+        return block.expand()
+    return block
+
+
+def measure(make_blocks):
+    """Returns the number of bytes allocated by `make_blocks` and still alive afterwards."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    blocks = make_blocks()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del blocks
+    return size
+
+
+def benchmark(blocks, txs):
+    """Print the memory used by `blocks` blocks with `txs` transactions in both representations."""
+    def make_full():
+        result = []
+        for i in range(blocks):
+            b = Block(0, i - 1, [Transaction(0, 'set key%d %d' % (j, i), i * txs + j) for j in range(txs)], i)
+            b.depth = (i + 1) * txs
+            result.append(b)
+        return result
+
+    full = measure(make_full)
+    compact = measure(lambda: [CompactBlock(b) for b in make_full()])
+    print('full:    %d bytes (%.1f per txn)' % (full, full / (blocks * txs)))
+    print('compact: %d bytes (%.1f per txn)' % (compact, compact / (blocks * txs)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', default=1000, type=int, help='number of blocks')
+    parser.add_argument('--txs', default=100, type=int, help='transactions per block')
+    args = parser.parse_args()
+    benchmark(args.blocks, args.txs)
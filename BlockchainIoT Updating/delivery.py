@@ -0,0 +1,139 @@
+"""This module implements the delivery of committed commands to the app.
+Instead of calling the app once per committed block on the reactor thread, committed commands are queued and
+delivered in batches on a worker thread. The offset of the last delivered block is written to disk once the app
+returned, s.t after a restart all blocks that were not yet acknowledged are delivered again (at-least-once).
+"""
+
+import logging
+from collections import deque
+
+from twisted.internet import threads
+
+logger = logging.getLogger(__name__)
+
+
+class CommitDelivery:
+    """Bounded queue of committed commands which are delivered to the app in batches.
+
+    Args:
+        callback (Callable): called with a list of commands (runs on a worker thread).
+        reactor: reactor used to schedule the flush timeouts.
+        db: LevelDB of the node, the acknowledged offset is stored under the key b'delivered_offset'.
+        max_batch_count (int): a batch is delivered as soon as it contains this many commands.
+        max_batch_delay (float): a command waits at most this long (in seconds) before its batch is delivered.
+        max_pending (int): number of undelivered commands above which `is_full` returns True.
+        run_in_thread (Callable): runs a function on a worker thread and returns a Deferred firing with its result.
+        on_delivered (Callable): if not None, called on the reactor with the offsets (first, last) of the blocks
+            acknowledged by the app.
+
+    Attributes:
+        pending (deque): (offset, commands) tuples of committed blocks not yet handed to the app.
+        pending_count (int): number of commands in `pending`.
+        delivered_offset (int): number of committed blocks acknowledged by the app.
+        delivering (bool): True while a batch is being delivered (batches are delivered one after another).
+        flush_call (IDelayedCall): scheduled flush of a not yet full batch.
+    """
+    def __init__(self, callback, reactor, db, max_batch_count=1000, max_batch_delay=0.05, max_pending=10000,
+                 run_in_thread=threads.deferToThread, on_delivered=None):
+        self.callback = callback
+        self.reactor = reactor
+        self.db = db
+        self.max_batch_count = max_batch_count
+        self.max_batch_delay = max_batch_delay
+        self.max_pending = max_pending
+        self.run_in_thread = run_in_thread
+        self.on_delivered = on_delivered
+
+        self.pending = deque()
+        self.pending_count = 0
+        self.delivering = False
+        self.flush_call = None
+
+        offset = db.get(b'delivered_offset')
+        self.delivered_offset = 0 if offset is None else int(offset.decode())
+
+    def enqueue(self, offset, commands):
+        """Queue the `commands` of the committed block at position `offset` (1-based) of the committed blocks.
+
+        Args:
+            offset (int): position of the block in the list of committed blocks.
+            commands (list): commands of the block.
+        """
+        if offset <= self.delivered_offset:
+            # already acknowledged before a restart
+            return
+        self.pending.append((offset, commands))
+        self.pending_count += len(commands)
+
+        if self.pending_count >= self.max_batch_count:
+            self.flush()
+        elif self.flush_call is None:
+            self.flush_call = self.reactor.callLater(self.max_batch_delay, self.flush)
+
+    def is_full(self):
+        """Returns True if the app falls behind and no new blocks should be created."""
+        return self.pending_count >= self.max_pending
+
+    def flush(self):
+        """Deliver the next batch if no other batch is being delivered."""
+        if self.flush_call is not None and self.flush_call.active():
+            self.flush_call.cancel()
+        self.flush_call = None
+
+        if self.delivering or not self.pending:
+            return
+
+        # take whole blocks until the batch is full
+        commands = []
+        offset = self.delivered_offset
+        while self.pending and (not commands or len(commands) + len(self.pending[0][1]) <= self.max_batch_count):
+            offset, block_commands = self.pending.popleft()
+            commands.extend(block_commands)
+        self.pending_count -= len(commands)
+
+        self.delivering = True
+        d = self.run_in_thread(self.callback, commands)
+        # only a failure of the app puts the batch back, a failure in `acknowledge` must not deliver it twice
+        d.addCallbacks(self.acknowledge, self.delivery_failed, callbackArgs=(offset,), errbackArgs=(offset, commands))
+        d.addErrback(self.acknowledge_failed)
+
+    def acknowledge(self, result, offset):
+        """The app processed all blocks up to `offset`: continue with the next batch and write the offset to disk."""
+        first = self.delivered_offset + 1
+        self.delivered_offset = max(self.delivered_offset, offset)
+        self.delivering = False
+        self.schedule_next()
+        self.db.put(b'delivered_offset', str(self.delivered_offset).encode())
+        if self.on_delivered is not None and first <= self.delivered_offset:
+            self.on_delivered(first, self.delivered_offset)
+
+    def acknowledge_failed(self, failure):
+        """Writing the delivered offset failed: it is written again with the next acknowledgement, until then a
+        restart delivers the batch again (at-least-once).
+        """
+        logger.debug('storing the delivered offset failed: %s', failure.getErrorMessage())
+
+    def skip_to(self, offset):
+        """The app state already contains all blocks up to `offset` (e.g because a snapshot was installed): drop them
+        from the queue and mark them as acknowledged.
+        """
+        while self.pending and self.pending[0][0] <= offset:
+            self.pending_count -= len(self.pending.popleft()[1])
+        self.delivered_offset = max(self.delivered_offset, offset)
+        self.db.put(b'delivered_offset', str(self.delivered_offset).encode())
+
+    def delivery_failed(self, failure, offset, commands):
+        """The app raised an exception: put the batch back and retry it later."""
+        logger.debug('delivery of committed commands failed: %s', failure.getErrorMessage())
+        self.pending.appendleft((offset, commands))
+        self.pending_count += len(commands)
+        self.delivering = False
+        if self.flush_call is None:
+            self.flush_call = self.reactor.callLater(self.max_batch_delay, self.flush)
+
+    def schedule_next(self):
+        """Deliver the next batch immediately if it is full, otherwise after `max_batch_delay`."""
+        if self.pending_count >= self.max_batch_count:
+            self.flush()
+        elif self.pending and self.flush_call is None:
+            self.flush_call = self.reactor.callLater(self.max_batch_delay, self.flush)
@@ -0,0 +1,193 @@
+"""This module implements counters, gauges and histograms of a piChain node and their export in the Prometheus text
+format over a local HTTP endpoint.
+
+Metrics are disabled by default (`Node.metrics` is None). Every instrumented code path first checks if metrics are
+enabled, thus they cost a single attribute lookup when disabled.
+"""
+
+import functools
+import time
+from bisect import bisect_left
+
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+# upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.]
+
+# maximal number of txns whose receipt time is remembered to compute their commit latency
+MAX_TRACKED_TXNS = 100000
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets.
+
+    Args:
+        buckets (list): sorted upper bounds of the buckets.
+    """
+    __slots__ = ['buckets', 'counts', 'sum', 'count']
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, escape(v)) for k, v in labels) + '}'
+
+
+def escape(value):
+    """Returns `value` as a label value of the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Collection of all metrics of a node.
+
+    Attributes:
+        counters (dict): Mapping from (name, labels) to value.
+        gauges (dict): Mapping from (name, labels) to value.
+        histograms (dict): Mapping from (name, labels) to Histogram.
+        txn_receipt (dict): Mapping from txn_id to the time the txn was received.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.txn_receipt = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = Histogram()
+            self.histograms[key] = histogram
+        histogram.observe(value)
+
+    def txn_received(self, txn_id):
+        """Remember when the txn with `txn_id` was received."""
+        if len(self.txn_receipt) >= MAX_TRACKED_TXNS:
+            # forget the oldest txn (dicts keep insertion order)
+            del self.txn_receipt[next(iter(self.txn_receipt))]
+        self.txn_receipt[txn_id] = time.time()
+
+    def txns_committed(self, txn_ids):
+        """Observe the commit latency of all txns with id in `txn_ids` that were received by this node."""
+        now = time.time()
+        for txn_id in txn_ids:
+            received = self.txn_receipt.pop(txn_id, None)
+            if received is not None:
+                self.observe('pichain_commit_latency_seconds', now - received)
+
+    def render(self):
+        """Returns all metrics in the Prometheus text format, every metric preceded by its type."""
+        lines = []
+        typed = set()
+
+        def add_type(name, metric_type):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE %s %s' % (name, metric_type))
+
+        for (name, labels), value in sorted(self.counters.items()):
+            add_type(name, 'counter')
+            lines.append('%s%s %s' % (name, format_labels(labels), value))
+        for (name, labels), value in sorted(self.gauges.items()):
+            add_type(name, 'gauge')
+            lines.append('%s%s %s' % (name, format_labels(labels), value))
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            add_type(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, format_labels(labels + (('le', bound),)), cumulative))
+            lines.append('%s_sum%s %r' % (name, format_labels(labels), histogram.sum))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def timed(msg_type=None):
+    """Decorator for the receive methods of a Node: observe the time needed to handle a message per msg_type.
+
+    Args:
+        msg_type (str): label of the message, if None `message.msg_type` is used.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, message, *args):
+            if self.metrics is None:
+                return f(self, message, *args)
+            start = time.perf_counter()
+            try:
+                return f(self, message, *args)
+            finally:
+                self.metrics.observe('pichain_message_handling_seconds', time.perf_counter() - start,
+                                     msg_type=msg_type or message.msg_type)
+        return wrapper
+    return decorator
+
+
+class TimedDB:
+    """Wraps the LevelDB of a node and observes the latency of its writes.
+
+    Args:
+        db: the LevelDB (plyvel.DB) to wrap.
+        metrics (Metrics): where the latencies are recorded.
+    """
+    def __init__(self, db, metrics):
+        self._db = db
+        self._metrics = metrics
+
+    def put(self, key, value):
+        start = time.perf_counter()
+        self._db.put(key, value)
+        self._metrics.observe('pichain_db_write_seconds', time.perf_counter() - start, op='put')
+
+    def delete(self, key):
+        start = time.perf_counter()
+        self._db.delete(key)
+        self._metrics.observe('pichain_db_write_seconds', time.perf_counter() - start, op='delete')
+
+    def __iter__(self):
+        return iter(self._db)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+class MetricsResource(Resource):
+    """twisted.web resource serving the metrics of a node at /metrics."""
+    isLeaf = True
+
+    def __init__(self, metrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b'content-type', b'text/plain; version=0.0.4')
+        return self.metrics.render().encode()
+
+
+def listen(reactor, metrics, port, interface='127.0.0.1'):
+    """Serve `metrics` over HTTP on `interface`:`port`.
+
+    Returns:
+        IListeningPort: the listening port.
+    """
+    return reactor.listenTCP(port, Site(MetricsResource(metrics)), interface=interface)
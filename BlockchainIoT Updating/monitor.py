@@ -0,0 +1,109 @@
+"""This module implements the measurement of how long the reactor is stalled by work on the reactor thread.
+On a real reactor a call is scheduled every `interval` seconds, the time it is executed later than planned is the stall
+time (`ReactorStallMonitor`). A fake reactor with virtual time is never late, there the wall time of every call it runs
+is recorded instead (`TimedClock`): while a call runs, everything else waits for it.
+"""
+
+import time
+
+from twisted.internet.task import Clock, LoopingCall
+
+
+def summarize(durations, max_duration=None):
+    """Returns a dict with the number of `durations` (seconds) and their p50, p99 and max in milliseconds."""
+    durations = sorted(durations)
+    if not durations:
+        return {'count': 0, 'p50_ms': 0., 'p99_ms': 0., 'max_ms': 0.}
+    return {
+        'count': len(durations),
+        'p50_ms': durations[len(durations) // 2] * 1000,
+        'p99_ms': durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000,
+        'max_ms': (durations[-1] if max_duration is None else max_duration) * 1000,
+    }
+
+
+class ReactorStallMonitor:
+    """Measure stalls of the reactor loop.
+
+    Args:
+        reactor: the reactor to monitor.
+        interval (float): time between two measurements in seconds.
+
+    Attributes:
+        stalls (list): delay of every measurement in seconds.
+        max_stall (float): longest stall seen so far.
+    """
+    def __init__(self, reactor, interval=0.01):
+        self.reactor = reactor
+        self.interval = interval
+        self.stalls = []
+        self.max_stall = 0.
+        self.last = None
+        self.loop = LoopingCall(self.tick)
+        self.loop.clock = reactor
+
+    def start(self):
+        """Start measuring."""
+        self.last = time.time()
+        self.loop.start(self.interval, now=False)
+
+    def stop(self):
+        """Stop measuring."""
+        if self.loop.running:
+            self.loop.stop()
+
+    def tick(self):
+        """Is called every `interval` seconds by the reactor and records how late it is."""
+        now = time.time()
+        stall = max(0., now - self.last - self.interval)
+        self.last = now
+        self.stalls.append(stall)
+        self.max_stall = max(self.max_stall, stall)
+
+    def summary(self):
+        """Returns a dict with the number of measurements and the p50, p99 and max stall in milliseconds."""
+        return summarize(self.stalls, self.max_stall)
+
+
+class TimedClock(Clock):
+    """A fake reactor recording the wall time of every call it runs.
+
+    Work that would run on a worker thread of a real reactor is passed to `off_reactor`, its wall time is not
+    counted as part of the call.
+
+    Attributes:
+        durations (list): wall time of every call in seconds.
+        excluded (float): wall time spent in `off_reactor` during the running call.
+    """
+    def __init__(self):
+        super().__init__()
+        self.durations = []
+        self.excluded = 0.
+
+    def callLater(self, delay, f, *args, **kw):
+        return super().callLater(delay, self.timed, f, *args, **kw)
+
+    def timed(self, f, *args, **kw):
+        """Run `f` and record its wall time."""
+        self.excluded = 0.
+        start = time.perf_counter()
+        try:
+            return f(*args, **kw)
+        finally:
+            self.durations.append(max(0., time.perf_counter() - start - self.excluded))
+
+    def off_reactor(self, f, *args):
+        """Run `f` synchronously, its wall time is not counted as part of the running call.
+
+        Returns:
+            the result of `f`.
+        """
+        start = time.perf_counter()
+        try:
+            return f(*args)
+        finally:
+            self.excluded += time.perf_counter() - start
+
+    def summary(self):
+        """Returns a dict with the number of calls and the p50, p99 and max wall time of a call in milliseconds."""
+        return summarize(self.durations)
@@ -0,0 +1,113 @@
+"""This module implements the deletion of pruned blocks from LevelDB in the background.
+Deleting the blocks below a new genesis block and compacting the whole db on the reactor thread stalls all message
+handling on a large db. Instead, the keys of pruned blocks are handed to a worker thread which deletes them in
+small, rate-limited write batches and afterwards compacts only the ranges of deleted keys. A synchronous pruner
+deletes on the calling thread instead, it is used to compare the stalls of both variants (see simulation module).
+
+Keys are decimal block ids compared as bytes, thus the pruned keys are spread over the whole keyspace. Only runs of
+deleted keys without a remaining key in between are compacted, one range per run.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# number of keys deleted in one write batch
+PRUNE_BATCH_SIZE = 500
+
+# maximal number of keys deleted per second
+PRUNE_RATE = 20000
+
+
+class Pruner:
+    """Deletes keys from a LevelDB on a background thread.
+
+    Args:
+        db: the LevelDB (plyvel.DB) of the node.
+        batch_size (int): number of keys deleted in one write batch.
+        rate (float): maximal number of keys deleted per second.
+        synchronous (bool): delete the keys on the calling (reactor) thread instead of on the worker thread.
+
+    Attributes:
+        jobs (Queue): lists of keys still to be deleted.
+        thread (Thread): the worker thread (started with the first job).
+        deleted (int): number of keys deleted so far.
+    """
+    def __init__(self, db, batch_size=PRUNE_BATCH_SIZE, rate=PRUNE_RATE, synchronous=False):
+        self.db = db
+        self.batch_size = batch_size
+        self.rate = rate
+        self.synchronous = synchronous
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.deleted = 0
+
+    def delete(self, keys):
+        """Delete `keys` from the db in the background.
+
+        Args:
+            keys (list): keys (bytes) of the pruned blocks.
+        """
+        if not keys:
+            return
+        if self.synchronous:
+            self.prune(keys)
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='pruner', daemon=True)
+            self.thread.start()
+        self.jobs.put(keys)
+
+    def run(self):
+        """Main loop of the worker thread."""
+        while True:
+            keys = self.jobs.get()
+            try:
+                self.prune(keys)
+            except Exception:
+                logger.exception('pruning of %s keys failed', str(len(keys)))
+            finally:
+                self.jobs.task_done()
+
+    def prune(self, keys):
+        """Delete `keys` in rate-limited write batches and compact the range they covered."""
+        for i in range(0, len(keys), self.batch_size):
+            start = time.time()
+            batch = keys[i:i + self.batch_size]
+            with self.db.write_batch() as wb:
+                for key in batch:
+                    wb.delete(key)
+            self.deleted += len(batch)
+
+            # stay below the configured rate s.t the disk is not saturated (never sleep on the reactor thread)
+            wait = len(batch) / self.rate - (time.time() - start)
+            if wait > 0 and not self.synchronous:
+                time.sleep(wait)
+
+        # force deletion in leveldb, but only of the ranges that changed
+        for start, stop in self.deleted_runs(keys):
+            self.db.compact_range(start=start, stop=stop)
+
+    def deleted_runs(self, keys):
+        """Returns (first, last) of every run of deleted `keys` with no remaining key of the db in between."""
+        keys = sorted(keys)
+        runs = []
+        with self.db.iterator(include_value=False) as it:
+            i = 0
+            while i < len(keys):
+                # first remaining key after the start of the run
+                it.seek(keys[i])
+                remaining = next(it, None)
+                j = i
+                while j + 1 < len(keys) and (remaining is None or keys[j + 1] < remaining):
+                    j += 1
+                runs.append((keys[i], keys[j]))
+                i = j + 1
+        return runs
+
+    def join(self):
+        """Block until all queued keys are deleted (used in tests and on shutdown)."""
+        self.jobs.join()
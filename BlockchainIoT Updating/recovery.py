@@ -0,0 +1,231 @@
+"""This module implements the catch-up of a node that is missing many blocks.
+Instead of requesting the missing blocks one by one (RequestBlockMessage), the missing depth range is split into
+chunks which are answered in parallel by different peers. A peer streams the blocks of a chunk in several
+RespondRangeMessages. The received blocks are added to the blocktree in the order of their depth. A chunk whose
+blocks do not form a path continuing the previous chunk (the responder is behind or on another fork) is requested
+from another peer.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# minimal depth gap (number of txns) for which a range recovery is started instead of requesting single blocks
+MIN_RANGE_DEPTH = 1000
+
+# maximal number of blocks in a single RespondRangeMessage
+RANGE_RESPONSE_BLOCKS = 100
+
+# a chunk which is not complete after this many rtts is requested from another peer
+RANGE_TIMEOUT_RTTS = 10
+
+# number of times a chunk is requested before the recovery is given up
+MAX_RANGE_ATTEMPTS = 3
+
+
+class RequestRangeMessage:
+    """Request the blocks on the path to the head block of the responder with lo < depth <= hi.
+
+    Args:
+        recovery_id (int): id of the recovery, responses carry it s.t outdated ones can be ignored.
+        chunks (list): [lo, hi, responder_id] lists. A peer only answers the chunks assigned to it.
+    """
+    __slots__ = ['msg_type', 'recovery_id', 'chunks']
+
+    def __init__(self, recovery_id, chunks):
+        self.msg_type = 'RQR'
+        self.recovery_id = recovery_id
+        self.chunks = chunks
+
+
+class RespondRangeMessage:
+    """Part of the blocks of the chunk (lo, hi] sorted by depth.
+
+    Args:
+        recovery_id (int): id of the recovery this message answers.
+        lo (int): lower bound (exclusive) of the chunk.
+        hi (int): upper bound (inclusive) of the chunk.
+        blocks (list): blocks of the chunk.
+        last (bool): True if this is the last message of the chunk.
+        responder_id (int): id of the node answering the chunk.
+    """
+    __slots__ = ['msg_type', 'recovery_id', 'lo', 'hi', 'blocks', 'last', 'responder_id']
+
+    def __init__(self, recovery_id, lo, hi, blocks, last, responder_id):
+        self.msg_type = 'RSR'
+        self.recovery_id = recovery_id
+        self.lo = lo
+        self.hi = hi
+        self.blocks = blocks
+        self.last = last
+        self.responder_id = responder_id
+
+
+def collect_range(blocktree, lo, hi):
+    """Returns the blocks on the path from `blocktree.head_block` to the genesis block with lo < depth <= hi,
+    sorted by depth.
+    """
+    blocks = []
+    b = blocktree.head_block
+    while b is not None and b != blocktree.genesis and b.depth > lo:
+        if b.depth <= hi:
+            blocks.append(b)
+        b = blocktree.nodes.get(b.parent_block_id)
+    blocks.reverse()
+    return blocks
+
+
+def split_range(lo, hi, responders):
+    """Split the depth range (lo, hi] into one chunk per responder.
+
+    Args:
+        lo (int): lower bound (exclusive).
+        hi (int): upper bound (inclusive).
+        responders (list): ids of the peers answering the chunks.
+
+    Returns:
+        list: [lo, hi, responder_id] lists covering (lo, hi].
+    """
+    count = max(1, min(len(responders), (hi - lo) // MIN_RANGE_DEPTH))
+    size = (hi - lo) // count
+    chunks = []
+    for i in range(count):
+        chunk_hi = hi if i == count - 1 else lo + (i + 1) * size
+        chunks.append([lo + i * size, chunk_hi, responders[i]])
+    return chunks
+
+
+class RangeRecovery:
+    """State of a running range recovery of a node.
+
+    Args:
+        recovery_id (int): id of this recovery.
+        chunks (list): [lo, hi, responder_id] lists requested from the peers.
+        responders (list): peers which may be asked for a chunk.
+        root_id (int): id of the block at depth lo of the first chunk, the recovered blocks continue it.
+
+    Attributes:
+        received (dict): Mapping from chunk lo to the blocks received so far for this chunk.
+        complete (set): lo of all chunks which have been received completely.
+        applied (int): number of chunks (sorted by lo) that have been added to the blocktree.
+        attempts (dict): Mapping from chunk lo to the number of times it was requested.
+        last_block_id (int): id of the deepest block added to the blocktree so far (`root_id` before).
+        retries (list): chunks reassigned to another responder which still have to be requested.
+        failed (bool): True if a chunk was requested too often, the recovery is given up.
+    """
+    def __init__(self, recovery_id, chunks, responders, root_id):
+        self.recovery_id = recovery_id
+        self.chunks = sorted(chunks)
+        self.responders = responders
+        self.received = {}
+        self.complete = set()
+        self.applied = 0
+        self.attempts = {}
+        self.last_block_id = root_id
+        self.retries = []
+        self.failed = False
+        for chunk in self.chunks:
+            self.received.update({chunk[0]: []})
+            self.attempts.update({chunk[0]: 1})
+
+    def add(self, resp):
+        """Store the blocks of a RespondRangeMessage.
+
+        Returns:
+            list: blocks that can now be added to the blocktree, sorted by depth.
+        """
+        blocks = self.received.get(resp.lo)
+        if blocks is None or resp.lo in self.complete:
+            return []
+
+        # ignore late answers of a peer the chunk is no longer assigned to
+        chunk = [c for c in self.chunks if c[0] == resp.lo][0]
+        if chunk[2] != resp.responder_id:
+            return []
+        blocks.extend(resp.blocks)
+        if resp.last:
+            if self.contiguous(chunk, blocks):
+                self.complete.add(resp.lo)
+            else:
+                logger.debug('chunk %s to %s is not contiguous', str(chunk[0]), str(chunk[1]))
+                self.retry(chunk)
+
+        # apply complete chunks in order
+        ready = []
+        while self.applied < len(self.chunks) and self.chunks[self.applied][0] in self.complete:
+            chunk = self.chunks[self.applied]
+            blocks = sorted(self.received[chunk[0]], key=lambda b: b.depth)
+            if blocks and blocks[0].parent_block_id != self.last_block_id:
+                # the chunk does not continue the blocks added so far
+                logger.debug('chunk %s to %s does not continue the recovered path', str(chunk[0]), str(chunk[1]))
+                self.retry(chunk)
+                break
+            del self.received[chunk[0]]
+            ready.extend(blocks)
+            if blocks:
+                self.last_block_id = blocks[-1].block_id
+            self.applied += 1
+        return ready
+
+    def contiguous(self, chunk, blocks):
+        """Returns True if `blocks` are not empty, form a path and, for the last chunk, reach its upper bound (the
+        depth of the parent of the block which started the recovery). A chunk spans at least `MIN_RANGE_DEPTH` txns,
+        thus it contains at least one block, an empty answer comes from a responder whose head is below the chunk.
+        """
+        if not blocks:
+            return False
+        blocks = sorted(blocks, key=lambda b: b.depth)
+        if any(b.parent_block_id != a.block_id for a, b in zip(blocks, blocks[1:])):
+            return False
+        return chunk is not self.chunks[-1] or blocks[-1].depth == chunk[1]
+
+    def covers(self, depth):
+        """Returns True if a block with `depth` is recovered by this recovery."""
+        return self.chunks[0][0] < depth <= self.chunks[-1][1]
+
+    def done(self):
+        """Returns True if all chunks have been added to the blocktree."""
+        return self.applied == len(self.chunks)
+
+    def retry(self, chunk):
+        """Reassign `chunk` to the next responder and queue it in `retries`, or set `failed` if it was requested
+        too often.
+        """
+        if self.reassign(chunk):
+            self.retries.append(chunk)
+        else:
+            self.failed = True
+
+    def reassign(self, chunk):
+        """Assign `chunk` to the next responder and drop the blocks received for it.
+
+        Returns:
+            bool: False if the chunk was requested too often.
+        """
+        lo = chunk[0]
+        if self.attempts[lo] >= MAX_RANGE_ATTEMPTS:
+            return False
+        self.attempts[lo] += 1
+        index = self.responders.index(chunk[2]) if chunk[2] in self.responders else -1
+        chunk[2] = self.responders[(index + 1) % len(self.responders)]
+        self.received.update({lo: []})
+        self.complete.discard(lo)
+        return True
+
+    def retry_chunks(self):
+        """Reassign all incomplete chunks to the next responder.
+
+        Returns:
+            list: the reassigned chunks or None if a chunk was requested too often.
+        """
+        chunks = []
+        for chunk in self.chunks:
+            if chunk[0] in self.complete:
+                continue
+            # blocks of an incomplete chunk are requested again
+            if not self.reassign(chunk):
+                return None
+            chunks.append(chunk)
+        # the reassigned chunks are requested now
+        self.retries = []
+        return chunks
@@ -0,0 +1,77 @@
+"""This module implements the estimation of round trip times to the peers of a node.
+The per peer estimation follows RFC 6298: a smoothed RTT and the RTT variation are updated with every new sample.
+The expected latency of a Paxos round is not bounded by the slowest peer but by the fastest majority.
+"""
+
+# gains and variance factor as given in RFC 6298
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+
+# safety margin added to every estimate (in seconds)
+MARGIN = 0.1
+
+
+class RttEstimator:
+    """Keeps a smoothed RTT and the RTT variation for every peer.
+
+    Args:
+        n (int): total number of nodes (including the owner of the estimator).
+        default_rtt (float): rtt assumed as long as there are not enough samples.
+
+    Attributes:
+        srtts (dict): Mapping from peer_node_id to smoothed RTT.
+        rttvars (dict): Mapping from peer_node_id to RTT variation.
+    """
+    def __init__(self, n, default_rtt=1):
+        self.n = n
+        self.default_rtt = default_rtt
+        self.srtts = {}
+        self.rttvars = {}
+
+    def add_sample(self, peer_node_id, rtt):
+        """Update the estimation of `peer_node_id` with a new `rtt` sample.
+
+        Args:
+            peer_node_id (str): uuid of the peer.
+            rtt (float): measured round trip time in seconds.
+        """
+        srtt = self.srtts.get(peer_node_id)
+        if srtt is None:
+            self.srtts.update({peer_node_id: rtt})
+            self.rttvars.update({peer_node_id: rtt / 2})
+        else:
+            rttvar = (1 - BETA) * self.rttvars[peer_node_id] + BETA * abs(srtt - rtt)
+            self.rttvars.update({peer_node_id: rttvar})
+            self.srtts.update({peer_node_id: (1 - ALPHA) * srtt + ALPHA * rtt})
+
+    def remove_peer(self, peer_node_id):
+        """Forget the estimation of `peer_node_id` (e.g because the connection was lost)."""
+        self.srtts.pop(peer_node_id, None)
+        self.rttvars.pop(peer_node_id, None)
+
+    def quorum_value(self, values):
+        """Returns the k-th smallest of `values` where k is the number of peers needed for a majority, i.e a node
+        has to wait this long until a majority (including itself) answered.
+
+        Args:
+            values (list): one value per peer.
+
+        Returns:
+            float: the k-th smallest value or `default_rtt` if there are less than k values.
+        """
+        k = self.n // 2
+        if k == 0:
+            return 0
+        if len(values) < k:
+            return self.default_rtt
+        return sorted(values)[k - 1]
+
+    def expected_rtt(self):
+        """Returns the expected time until a majority answered a request, based on the smoothed RTTs."""
+        return self.quorum_value(list(self.srtts.values())) + MARGIN
+
+    def timeout(self):
+        """Returns a conservative round trip timeout of a majority (smoothed RTT + K * variation)."""
+        rtos = [srtt + K * self.rttvars[peer] for peer, srtt in self.srtts.items()]
+        return self.quorum_value(rtos) + MARGIN
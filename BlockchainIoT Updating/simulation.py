@@ -0,0 +1,333 @@
+"""This module implements a deterministic in-process simulation of a piChain cluster.
+The nodes are driven by a fake reactor with virtual time (twisted.internet.task.Clock) instead of the networking
+module, messages are delivered through a simulated network with configurable latency, loss and partitions. It is
+used to measure commit latency, throughput and message overhead reproducibly. Every node of every run starts from an
+empty blocktree in a temporary db which is removed by `Simulation.close`.
+
+All nodes share one fake reactor (`TimedClock`) which records the wall time of every call it runs: the delivery of a
+message, a timeout, a client submission. A real reactor running the same call would have been stalled for that time
+(e.g by pruning or validation on the reactor thread). Virtual time does not advance during a call, thus the wall time
+of the simulation itself is not part of the measurement. The fake reactor has no threads, work a real node runs on a
+worker thread (block validation) is run synchronously but not counted.
+
+Usage:
+    python simulation.py --nodes 3 --duration 60 --rates 10,100,1000
+"""
+
+import argparse
+import math
+import random
+import shutil
+import tempfile
+
+from twisted.internet import defer
+
+from piChain.PaxosLogic import Node
+from piChain.batching import AdaptiveBatchingPolicy
+from piChain.codec import encode, decode, default_encode
+from piChain.monitor import TimedClock
+
+
+def percentile(values, p):
+    """Returns the `p`-th percentile (nearest rank) of `values` or None if `values` is empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, math.ceil(p / 100. * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+class SimNetwork:
+    """Delivers messages between simulated nodes after a virtual delay.
+
+    Args:
+        clock (Clock): fake reactor providing the virtual time.
+        rng (random.Random): source of randomness for jitter and loss.
+        latency (float): default one way latency of a link in seconds.
+        jitter (float): maximal additional random one way latency in seconds.
+        loss (float): default probability that a message on a link is dropped.
+        encoder (Callable): encodes a message, used to count the bytes on the wire.
+        decoder (Callable): if not None, nodes receive the message decoded from the output of `encoder` instead of the
+            sent object.
+
+    Attributes:
+        nodes (list): the simulated nodes, indexed by node index.
+        links (dict): Mapping from (src, dst) to (latency, loss) overriding the defaults.
+        partitioned (set): (src, dst) pairs that can currently not communicate.
+        messages (int): number of messages sent so far.
+        bytes (int): number of bytes sent so far.
+    """
+    def __init__(self, clock, rng, latency=0.01, jitter=0., loss=0., encoder=default_encode, decoder=None):
+        self.clock = clock
+        self.encoder = encoder
+        self.decoder = decoder
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.nodes = []
+        self.links = {}
+        self.partitioned = set()
+        self.messages = 0
+        self.bytes = 0
+
+    def set_link(self, src, dst, latency=None, loss=None):
+        """Override latency and/or loss of the link between `src` and `dst` (both directions)."""
+        for pair in [(src, dst), (dst, src)]:
+            old_latency, old_loss = self.links.get(pair, (self.latency, self.loss))
+            self.links.update({pair: (old_latency if latency is None else latency,
+                                      old_loss if loss is None else loss)})
+
+    def partition(self, group_a, group_b):
+        """Drop all messages between nodes of `group_a` and nodes of `group_b` until `heal` is called."""
+        for a in group_a:
+            for b in group_b:
+                self.partitioned.add((a, b))
+                self.partitioned.add((b, a))
+
+    def heal(self):
+        """Remove all partitions."""
+        self.partitioned.clear()
+
+    def link_latency(self, src, dst):
+        """Returns the configured one way latency between `src` and `dst`."""
+        return self.links.get((src, dst), (self.latency, self.loss))[0]
+
+    def send(self, src, dst, obj):
+        """Send `obj` from node `src` to node `dst`."""
+        self.messages += 1
+        data = self.encoder(obj)
+        self.bytes += len(data)
+
+        latency, loss = self.links.get((src, dst), (self.latency, self.loss))
+        if (src, dst) in self.partitioned or self.rng.random() < loss:
+            return
+        delay = latency + self.rng.uniform(0, self.jitter)
+        self.clock.callLater(delay, self.deliver, src, dst, obj if self.decoder is None else data)
+
+    def deliver(self, src, dst, obj):
+        """Hand `obj` (decoded first if there is a `decoder`) to node `dst`."""
+        if self.decoder is not None:
+            obj = self.decoder(obj)
+        self.nodes[dst].dispatch(obj, src)
+
+
+class SimNode(Node):
+    """A piChain node whose reactor and network are replaced by the simulation.
+    `broadcast` and `respond` are overridden, the `sender` of a message is the index of the sending node.
+
+    Args:
+        node_index (int): index of this node in the simulated network.
+        peers_dict (dict): a dict containing the (ip, port) pairs for all nodes (not used to connect).
+        network (SimNetwork): network used to send messages.
+
+    Attributes:
+        db_path (str): temporary directory of the LevelDB of this node.
+    """
+    def __init__(self, node_index, peers_dict, network):
+        self.db_path = tempfile.mkdtemp(prefix='pichain-sim-%s-' % node_index)
+        super().__init__(node_index, peers_dict, db_path=self.db_path)
+        self.index = node_index
+        self.network = network
+        self.reactor = network.clock
+
+    def close(self):
+        """Wait for the pending deletions of the pruner, then close and remove the db of this node."""
+        self.pruner.join()
+        self.blocktree.db.close()
+        shutil.rmtree(self.db_path, ignore_errors=True)
+
+    def broadcast(self, obj, msg_type):
+        # a node receives its own txns as well
+        if msg_type == 'TXN':
+            self.receive_transaction(obj)
+        for dst in range(len(self.network.nodes)):
+            if dst != self.index:
+                self.network.send(self.index, dst, obj)
+
+    def respond(self, obj, sender):
+        self.network.send(self.index, sender, obj)
+
+
+class Simulation:
+    """A cluster of `n` simulated nodes and a client workload.
+
+    Args:
+        n (int): number of nodes.
+        seed (int): seed making a run reproducible.
+        latency (float): default one way latency of a link in seconds.
+        jitter (float): maximal additional random one way latency in seconds.
+        loss (float): default probability that a message is dropped.
+        commit_window (int): maximal number of pipelined commit rounds per node (see PaxosLogic.COMMIT_WINDOW).
+        adaptive_batching (bool): use `AdaptiveBatchingPolicy` instead of the fixed policy.
+        lease_rtts (float): duration of leader leases in rtts, 0 disables leases (see PaxosLogic.LEASE_RTTS).
+        binary (bool): send messages in the compact binary encoding (codec module) instead of the default one, nodes
+            receive the decoded messages.
+        sync_pruning (bool): delete pruned blocks on the reactor thread instead of in the background (see pruning
+            module).
+        block_validation (bool): validate received blocks in the validation pipeline (see validation module) instead
+            of on the reactor thread.
+
+    Attributes:
+        clock (TimedClock): the fake reactor shared by all nodes, measures the wall time of every call.
+        network (SimNetwork): the simulated network.
+        submit_times (dict): Mapping from command to (submitting node index, virtual submit time).
+        commit_latencies (list): latency of every txn committed at its submitting node.
+        committed_blocks (int): number of blocks delivered to the app of node 0.
+    """
+    def __init__(self, n=3, seed=0, latency=0.01, jitter=0., loss=0., commit_window=1, adaptive_batching=False,
+                 lease_rtts=0, binary=False, sync_pruning=False, block_validation=False):
+        # Node itself uses the global random module
+        random.seed(seed)
+        self.rng = random.Random(seed)
+        self.clock = TimedClock()
+        if binary:
+            self.network = SimNetwork(self.clock, self.rng, latency, jitter, loss, encode, decode)
+        else:
+            self.network = SimNetwork(self.clock, self.rng, latency, jitter, loss)
+
+        peers_dict = {}
+        for i in range(n):
+            peers_dict.update({str(i): {'ip': '127.0.0.1', 'port': 7000 + i}})
+
+        for i in range(n):
+            node = SimNode(i, peers_dict, self.network)
+            node.commit_window = commit_window
+            node.lease_rtts = lease_rtts
+            node.pruner.synchronous = sync_pruning
+            if adaptive_batching:
+                node.batching_policy = AdaptiveBatchingPolicy(clock=self.clock.seconds)
+            node.tx_committed = self.make_tx_committed(i)
+            if block_validation:
+                node.enable_block_validation(run_in_thread=self.run_in_thread)
+            self.network.nodes.append(node)
+
+        self.submit_times = {}
+        self.commit_latencies = []
+        self.committed_blocks = 0
+        self.txn_counter = 0
+        self.seed_rtts()
+
+    def close(self):
+        """Remove the dbs of all nodes, the simulation cannot be run afterwards."""
+        for node in self.network.nodes:
+            node.close()
+
+    def run_in_thread(self, f, *args):
+        """Replaces `threads.deferToThread`: runs `f` synchronously without counting it as work of the reactor."""
+        return defer.maybeDeferred(self.clock.off_reactor, f, *args)
+
+    def seed_rtts(self):
+        """There are no pings in the simulation, feed the rtt estimators with the configured link latencies."""
+        for node in self.network.nodes:
+            for peer in self.network.nodes:
+                if peer is not node:
+                    rtt = 2 * self.network.link_latency(node.index, peer.index)
+                    node.rtt_estimator.add_sample(peer.index, rtt)
+            node.expected_rtt = node.rtt_estimator.expected_rtt()
+            node.commit_rtt = node.rtt_estimator.timeout()
+
+    def make_tx_committed(self, index):
+        """Returns the tx_committed callable of node `index`."""
+        def tx_committed(commands):
+            if index == 0:
+                self.committed_blocks += 1
+            now = self.clock.seconds()
+            for command in commands:
+                submitter, submit_time = self.submit_times.get(command, (None, None))
+                if submitter == index:
+                    self.commit_latencies.append(now - submit_time)
+        return tx_committed
+
+    def submit(self, index):
+        """Let the app of node `index` submit a new command."""
+        self.txn_counter += 1
+        command = 'cmd' + str(self.txn_counter)
+        self.submit_times.update({command: (index, self.clock.seconds())})
+        self.network.nodes[index].make_txn(command)
+
+    def schedule_load(self, rate, duration):
+        """Schedule Poisson arrivals of commands with `rate` per second at random nodes during `duration` seconds."""
+        t = self.rng.expovariate(rate)
+        while t < duration:
+            self.clock.callLater(t, self.submit, self.rng.randrange(len(self.network.nodes)))
+            t += self.rng.expovariate(rate)
+
+    def run(self, duration, step=0.001):
+        """Advance the virtual time by `duration` seconds."""
+        end = self.clock.seconds() + duration
+        while self.clock.seconds() < end:
+            self.clock.advance(step)
+
+    def report(self, duration):
+        """Returns a dict summarizing the measurements of a run lasting `duration` virtual seconds."""
+        blocks = max(self.committed_blocks, 1)
+        calls = self.clock.summary()
+        return {
+            'submitted': self.txn_counter,
+            'committed': len(self.commit_latencies),
+            'txns_per_sec': len(self.commit_latencies) / duration,
+            'blocks_per_sec': self.committed_blocks / duration,
+            'latency_p50': percentile(self.commit_latencies, 50),
+            'latency_p90': percentile(self.commit_latencies, 90),
+            'latency_p99': percentile(self.commit_latencies, 99),
+            'messages_per_commit': self.network.messages / blocks,
+            'bytes_per_commit': self.network.bytes / blocks,
+            'call_p50_ms': calls['p50_ms'],
+            'call_p99_ms': calls['p99_ms'],
+            'call_max_ms': calls['max_ms'],
+            'reactor_busy_sec': sum(self.clock.durations),
+        }
+
+
+def run_load(rate, duration, drain=10., **kwargs):
+    """Run a simulation with a load of `rate` txns per second for `duration` seconds and return its report. The
+    simulation continues for `drain` seconds without load s.t the last txns can be committed.
+    """
+    sim = Simulation(**kwargs)
+    try:
+        sim.schedule_load(rate, duration)
+        sim.run(duration + drain)
+        return sim.report(duration + drain)
+    finally:
+        sim.close()
+
+
+def load_sweep(rates, duration, **kwargs):
+    """Run `run_load` for every rate in `rates` and return the list of (rate, report) pairs."""
+    return [(rate, run_load(rate, duration, **kwargs)) for rate in rates]
+
+
+def format_ms(value):
+    return '-' if value is None else '%.1f' % (value * 1000)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', default=3, type=int, help='number of nodes')
+    parser.add_argument('--duration', default=60., type=float, help='virtual seconds of load')
+    parser.add_argument('--rates', default='10,100,1000', help='comma separated txn rates (txns per second)')
+    parser.add_argument('--latency', default=0.01, type=float, help='one way link latency in seconds')
+    parser.add_argument('--jitter', default=0., type=float, help='maximal additional one way latency in seconds')
+    parser.add_argument('--loss', default=0., type=float, help='message loss probability')
+    parser.add_argument('--window', default=1, type=int, help='maximal number of pipelined commit rounds')
+    parser.add_argument('--adaptive', action='store_true', help='use adaptive transaction batching')
+    parser.add_argument('--lease', default=0, type=float, help='leader lease duration in rtts (0 disables leases)')
+    parser.add_argument('--binary', action='store_true', help='send messages in the compact binary encoding')
+    parser.add_argument('--sync-pruning', action='store_true', help='delete pruned blocks on the reactor thread')
+    parser.add_argument('--validation', action='store_true', help='validate received blocks off the reactor thread')
+    parser.add_argument('--seed', default=0, type=int, help='seed of the simulation')
+    args = parser.parse_args()
+
+    rates = [float(r) for r in args.rates.split(',')]
+    results = load_sweep(rates, args.duration, n=args.nodes, seed=args.seed, latency=args.latency,
+                         jitter=args.jitter, loss=args.loss, commit_window=args.window,
+                         adaptive_batching=args.adaptive, lease_rtts=args.lease, binary=args.binary,
+                         sync_pruning=args.sync_pruning, block_validation=args.validation)
+
+    print('rate    txns/s   blocks/s  p50(ms)  p90(ms)  p99(ms)  msgs/commit  bytes/commit  call p99/max(ms)')
+    for rate, r in results:
+        print('%-7g %-8.1f %-9.2f %-8s %-8s %-8s %-12.1f %-13.0f %.1f/%.1f' % (
+            rate, r['txns_per_sec'], r['blocks_per_sec'], format_ms(r['latency_p50']), format_ms(r['latency_p90']),
+            format_ms(r['latency_p99']), r['messages_per_commit'], r['bytes_per_commit'], r['call_p99_ms'],
+            r['call_max_ms']))
@@ -0,0 +1,138 @@
+"""This module implements snapshots of the app state and their transfer to lagging nodes.
+A node takes a snapshot of the app state whenever its genesis block moved far enough since the last snapshot. Blocks
+above the snapshot block are kept, thus a node that missed blocks which have already been deleted by its peers can
+install the snapshot and only needs to recover the blocks above the snapshot block.
+
+The snapshot is transferred in chunks, every chunk and the whole snapshot are protected by a checksum.
+"""
+
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# a new snapshot is taken once the genesis block is this much deeper (number of txns) than the snapshot block
+SNAPSHOT_INTERVAL = 10000
+
+# size of a chunk of a transferred snapshot in bytes
+SNAPSHOT_CHUNK_SIZE = 64 * 1024
+
+# a snapshot transfer is given up after the missing chunks were requested this many times
+MAX_SNAPSHOT_ATTEMPTS = 5
+
+
+def checksum(data):
+    """Returns the sha256 hex digest of `data`."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class SnapshotOfferMessage:
+    """Offer the latest snapshot to a node that requested blocks which have already been deleted.
+
+    Args:
+        block (Block): block up to which (inclusive) all commands are contained in the snapshot.
+        size (int): size of the snapshot in bytes.
+        digest (str): checksum of the whole snapshot.
+    """
+    __slots__ = ['msg_type', 'block', 'size', 'digest']
+
+    def __init__(self, block, size, digest):
+        self.msg_type = 'SNO'
+        self.block = block
+        self.size = size
+        self.digest = digest
+
+
+class RequestSnapshotMessage:
+    """Request chunks of the snapshot taken at block `block_id`.
+
+    Args:
+        block_id (int): id of the snapshot block.
+        indices (list): indices of the requested chunks.
+    """
+    __slots__ = ['msg_type', 'block_id', 'indices']
+
+    def __init__(self, block_id, indices):
+        self.msg_type = 'RQS'
+        self.block_id = block_id
+        self.indices = indices
+
+
+class SnapshotChunkMessage:
+    """A chunk of the snapshot taken at block `block_id`.
+
+    Args:
+        block_id (int): id of the snapshot block.
+        index (int): index of the chunk.
+        data (bytes): content of the chunk.
+        digest (str): checksum of `data`.
+    """
+    __slots__ = ['msg_type', 'block_id', 'index', 'data', 'digest']
+
+    def __init__(self, block_id, index, data, digest):
+        self.msg_type = 'SNC'
+        self.block_id = block_id
+        self.index = index
+        self.data = data
+        self.digest = digest
+
+
+def chunk_count(size):
+    """Returns the number of chunks of a snapshot of `size` bytes."""
+    return max(1, -(-size // SNAPSHOT_CHUNK_SIZE))
+
+
+def get_chunk(snapshot, index):
+    """Returns chunk `index` of `snapshot` (bytes) or None if out of range."""
+    if index < 0 or index >= chunk_count(len(snapshot)):
+        return None
+    return snapshot[index * SNAPSHOT_CHUNK_SIZE:(index + 1) * SNAPSHOT_CHUNK_SIZE]
+
+
+class SnapshotTransfer:
+    """State of a node receiving a snapshot.
+
+    Args:
+        offer (SnapshotOfferMessage): the accepted offer.
+        target_depth (int): depth up to which blocks have to be recovered once the snapshot is installed.
+
+    Attributes:
+        chunks (dict): Mapping from index to the data of the chunks received so far.
+        attempts (int): number of times the missing chunks were requested.
+    """
+    def __init__(self, offer, target_depth):
+        self.block = offer.block
+        self.size = offer.size
+        self.digest = offer.digest
+        self.target_depth = target_depth
+        self.chunks = {}
+        self.attempts = 1
+
+    def missing(self):
+        """Returns the indices of all chunks not received yet."""
+        return [i for i in range(chunk_count(self.size)) if i not in self.chunks]
+
+    def add(self, msg):
+        """Store a SnapshotChunkMessage if its checksum is correct.
+
+        Returns:
+            bool: True if the chunk was accepted.
+        """
+        if msg.block_id != self.block.block_id or msg.index in self.chunks:
+            return False
+        if checksum(msg.data) != msg.digest:
+            logger.debug('snapshot chunk %s corrupted', str(msg.index))
+            return False
+        self.chunks.update({msg.index: msg.data})
+        return True
+
+    def assemble(self):
+        """Returns the whole snapshot if all chunks are received and its checksum is correct, None otherwise."""
+        if self.missing():
+            return None
+        snapshot = b''.join(self.chunks[i] for i in range(chunk_count(self.size)))
+        if len(snapshot) != self.size or checksum(snapshot) != self.digest:
+            logger.debug('snapshot corrupted, request it again')
+            self.chunks.clear()
+            return None
+        return snapshot
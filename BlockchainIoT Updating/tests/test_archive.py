@@ -0,0 +1,74 @@
+"""Tests of the archive of pruned blocks (archive module)."""
+
+import shutil
+import tempfile
+
+import plyvel
+from twisted.trial.unittest import TestCase
+
+from piChain.archive import BlockArchive
+from piChain.messages import Block, Transaction
+
+ROOT_ID = -1
+
+
+def make_path(count, txs_per_block=5):
+    """Returns `count` blocks on a path above the block ROOT_ID (depth 0)."""
+    blocks = []
+    parent_id = ROOT_ID
+    for i in range(count):
+        txs = [Transaction(i % 3, 'command %s %s' % (i, j), j) for j in range(txs_per_block)]
+        block = Block(i % 3, parent_id, txs, i)
+        block.depth = (i + 1) * txs_per_block
+        blocks.append(block)
+        parent_id = block.block_id
+    return blocks
+
+
+class TestBlockArchive(TestCase):
+
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, True)
+        self.db = plyvel.DB(path, create_if_missing=True)
+        self.addCleanup(self.db.close)
+        self.blocks = make_path(30)
+
+    def test_get(self):
+        archive = BlockArchive(self.db, ROOT_ID)
+        archive.add(self.blocks[:10])
+        archive.add(self.blocks[10:20])
+        for block in self.blocks[:20]:
+            archived = archive.get(block.block_id)
+            self.assertEqual(archived.block_id, block.block_id)
+            self.assertEqual(archived.depth, block.depth)
+            self.assertEqual([txn.content for txn in archived.txs], [txn.content for txn in block.txs])
+        self.assertIsNone(archive.get(self.blocks[25].block_id))
+
+    def test_collect_and_covers(self):
+        archive = BlockArchive(self.db, ROOT_ID)
+        self.assertFalse(archive.covers(0))
+        archive.add(self.blocks[:10])
+        archive.add(self.blocks[10:20])
+        self.assertTrue(archive.complete)
+        self.assertTrue(archive.covers(0))
+
+        collected = archive.collect(self.blocks[3].depth, self.blocks[14].depth)
+        self.assertEqual([b.block_id for b in collected], [b.block_id for b in self.blocks[4:15]])
+
+    def test_reopen(self):
+        archive = BlockArchive(self.db, ROOT_ID)
+        archive.add(self.blocks[:10])
+        reopened = BlockArchive(self.db, ROOT_ID)
+        self.assertEqual(reopened.segments, archive.segments)
+        self.assertEqual(reopened.dictionary, archive.dictionary)
+        self.assertTrue(reopened.complete)
+        self.assertEqual(reopened.get(self.blocks[7].block_id).depth, self.blocks[7].depth)
+
+    def test_incomplete_archive(self):
+        # the archive of a node that started from a snapshot does not reach the initial genesis block
+        archive = BlockArchive(self.db, ROOT_ID)
+        archive.add(self.blocks[10:20])
+        self.assertFalse(archive.complete)
+        self.assertFalse(archive.covers(self.blocks[5].depth))
+        self.assertTrue(archive.covers(self.blocks[10].depth))
@@ -0,0 +1,108 @@
+"""Tests of the batching policies (batching module)."""
+
+from twisted.trial.unittest import TestCase
+
+from piChain.batching import FixedBatchingPolicy, AdaptiveBatchingPolicy
+
+
+class FakeTxn:
+    def __init__(self, size):
+        self.content = 'x' * size
+
+
+class CountingList(list):
+    """List counting how many of its items were iterated over."""
+    iterated = 0
+
+    def __iter__(self):
+        for item in super().__iter__():
+            self.iterated += 1
+            yield item
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def txs(*sizes):
+    return [FakeTxn(size) for size in sizes]
+
+
+class TestFixedBatchingPolicy(TestCase):
+
+    def test_fixed(self):
+        policy = FixedBatchingPolicy(max_count=3, accumulation_time=0.5)
+        self.assertEqual(policy.get_accumulation_time(txs(1)), 0.5)
+        self.assertFalse(policy.is_full(txs(1, 1)))
+        self.assertTrue(policy.is_full(txs(1, 1, 1)))
+        self.assertEqual(policy.batch_size(txs(1, 1)), 2)
+        self.assertEqual(policy.batch_size(txs(1, 1, 1, 1)), 3)
+
+
+class TestAdaptiveBatchingPolicy(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.policy = AdaptiveBatchingPolicy(max_count=4, max_bytes=10, accumulation_time=0.5, alpha=0.5,
+                                             clock=self.clock)
+
+    def arrive(self, count, interval):
+        for _ in range(count):
+            self.clock.now += interval
+            self.policy.observe(FakeTxn(1))
+
+    def test_batch_size_by_count_and_bytes(self):
+        self.assertEqual(self.policy.batch_size(txs(1, 1, 1, 1, 1)), 4)
+        self.assertEqual(self.policy.batch_size(txs(4, 4, 4)), 2)
+        self.assertEqual(self.policy.batch_size(txs(5, 5, 1)), 2)
+        self.assertEqual(self.policy.batch_size([]), 0)
+
+    def test_oversized_txn_own_block(self):
+        self.assertEqual(self.policy.batch_size(txs(20, 1)), 1)
+        self.assertTrue(self.policy.is_full(txs(20)))
+
+    def test_is_full_agrees_with_batch_size(self):
+        # a block reaching exactly max_bytes is full, the batch contains all of its txns
+        for sizes in [(5, 5), (5, 4), (4, 4, 4), (1, 1, 1), (1, 1, 1, 1), (10,), (9, 2)]:
+            new_txs = txs(*sizes)
+            count = self.policy.batch_size(new_txs)
+            size = sum(sizes[:count])
+            fits_more = count < self.policy.max_count and size < self.policy.max_bytes and count == len(new_txs)
+            self.assertEqual(self.policy.is_full(new_txs), not fits_more, sizes)
+        self.assertTrue(self.policy.is_full(txs(5, 5)))
+        self.assertEqual(self.policy.batch_size(txs(5, 5)), 2)
+        self.assertFalse(self.policy.is_full(txs(5, 4)))
+
+    def test_no_wait_at_light_load(self):
+        self.assertEqual(self.policy.get_accumulation_time(txs(1)), 0)
+        self.arrive(5, 1.)
+        self.assertEqual(self.policy.get_accumulation_time(txs(1)), 0)
+
+    def test_wait_bounded_by_time_to_fill(self):
+        self.arrive(10, 0.1)
+        self.assertAlmostEqual(self.policy.arrival_rate, 10.)
+        self.assertAlmostEqual(self.policy.get_accumulation_time(txs(1)), 0.3)
+        self.arrive(10, 0.01)
+        self.assertAlmostEqual(self.policy.get_accumulation_time(txs(1)), 0.03, places=3)
+        self.assertEqual(self.policy.get_accumulation_time(txs(5, 5)), 0)
+
+    def test_deep_queue_not_scanned(self):
+        self.arrive(10, 0.01)
+        new_txs = CountingList(txs(*[1] * 1000))
+        self.assertEqual(self.policy.get_accumulation_time(new_txs), 0)
+        self.assertTrue(self.policy.is_full(new_txs))
+        self.assertEqual(new_txs.iterated, 0)
+        self.assertEqual(self.policy.batch_size(new_txs), 4)
+        self.assertLessEqual(new_txs.iterated, 4)
+
+    def test_moving_average(self):
+        self.arrive(1, 0.)
+        self.assertIsNone(self.policy.mean_interval)
+        self.arrive(1, 1.)
+        self.assertEqual(self.policy.mean_interval, 1.)
+        self.arrive(1, 3.)
+        self.assertEqual(self.policy.mean_interval, 2.)
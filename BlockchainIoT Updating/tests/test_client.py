@@ -0,0 +1,90 @@
+"""Tests of the admission control of submitted commands (client module)."""
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from piChain.client import Admission, QueueFull, SubmitTimeout
+
+
+class FakeTxn:
+    def __init__(self, txn_id, content):
+        self.txn_id = txn_id
+        self.content = content
+
+
+class FakeBlock:
+    def __init__(self, txs):
+        self.txs = txs
+
+
+class FakeNode:
+    """Records the txns created by `make_txn`."""
+    def __init__(self):
+        self.reactor = Clock()
+        self.txs = []
+
+    def make_txn(self, command):
+        txn = FakeTxn(len(self.txs) + 1, command)
+        self.txs.append(txn)
+        return txn
+
+
+class TestAdmission(TestCase):
+
+    def setUp(self):
+        self.node = FakeNode()
+        self.admission = Admission(self.node, max_in_flight=3, max_per_client=2, timeout=5.)
+
+    def test_resolved_on_commit(self):
+        d = self.admission.submit('set a 1', 'alice')
+        results = []
+        d.addCallback(results.append)
+        self.assertEqual(results, [])
+
+        # txns of other nodes in the block are ignored
+        self.admission.committed(FakeBlock([FakeTxn(100, 'other'), self.node.txs[0]]))
+        self.assertEqual(results, ['set a 1'])
+        self.assertEqual(self.admission.pending, {})
+        self.assertEqual(self.admission.per_client, {})
+
+    def test_client_quota(self):
+        self.admission.submit('1', 'alice')
+        self.admission.submit('2', 'alice')
+        self.failureResultOf(self.admission.submit('3', 'alice'), QueueFull)
+        self.assertEqual(len(self.node.txs), 2)
+        # other clients are not affected
+        self.assertNoResult(self.admission.submit('4', 'bob'))
+
+    def test_in_flight_bound(self):
+        ds = [self.admission.submit(str(i), client) for i, client in enumerate(['a', 'b', 'c'])]
+        self.failureResultOf(self.admission.submit('3', 'd'), QueueFull)
+        self.assertEqual(len(self.node.txs), 3)
+
+        # a committed command frees its slot
+        self.admission.committed(FakeBlock(self.node.txs[:1]))
+        self.assertEqual(self.successResultOf(ds[0]), '0')
+        self.assertNoResult(self.admission.submit('4', 'd'))
+
+    def test_timeout(self):
+        d = self.admission.submit('1', 'alice')
+        self.node.reactor.advance(4.9)
+        self.assertNoResult(d)
+        self.node.reactor.advance(0.1)
+        self.failureResultOf(d, SubmitTimeout)
+        self.assertEqual(self.admission.pending, {})
+        self.assertEqual(self.admission.per_client, {})
+
+        # committing the command afterwards does not fire the Deferred again
+        self.admission.committed(FakeBlock(self.node.txs))
+
+    def test_commit_cancels_timeout(self):
+        d = self.admission.submit('1', 'alice')
+        self.admission.committed(FakeBlock(self.node.txs))
+        self.assertEqual(self.successResultOf(d), '1')
+        self.assertEqual(self.node.reactor.getDelayedCalls(), [])
+
+    def test_no_timeout(self):
+        admission = Admission(self.node)
+        d = admission.submit('1')
+        self.assertEqual(self.node.reactor.getDelayedCalls(), [])
+        self.assertNoResult(d)
@@ -0,0 +1,135 @@
+"""Tests of the binary encoding of messages (codec module)."""
+
+from twisted.trial.unittest import TestCase
+
+from piChain.codec import encode, decode, decode_frame, Encoded, DecodeError, FRAME_PREFIX, VERSION, PAXOS, BLOCK, \
+    TXN, RQB, RSB, ACM, RQR, RSR, SNO, RQS, SNC, PAXOS_FIELDS
+from piChain.messages import PaxosMessage, Block, Transaction, RequestBlockMessage, RespondBlockMessage, \
+    AckCommitMessage
+from piChain.recovery import RequestRangeMessage, RespondRangeMessage
+from piChain.snapshot import SnapshotOfferMessage, RequestSnapshotMessage, SnapshotChunkMessage
+
+
+def make_block(txs=3, parent_block_id=-1):
+    block = Block(1, parent_block_id, [Transaction(2, 'command %s é' % i, i) for i in range(txs)], 7)
+    block.depth = 42
+    block.creator_state = 2
+    return block
+
+
+class TestRoundTrip(TestCase):
+
+    def round_trip(self, obj, type_byte):
+        data = encode(obj)
+        self.assertEqual(data[0], VERSION)
+        self.assertEqual(data[1], type_byte)
+        decoded = decode(data)
+        self.assertIs(type(decoded), type(obj))
+        return decoded
+
+    def assert_same_txn(self, a, b):
+        self.assertEqual((a.creator_id, a.txn_id, a.content), (b.creator_id, b.txn_id, b.content))
+
+    def assert_same_block(self, a, b):
+        self.assertEqual((a.creator_id, a.parent_block_id, a.block_id, a.depth, getattr(a, 'creator_state', None)),
+                         (b.creator_id, b.parent_block_id, b.block_id, b.depth, getattr(b, 'creator_state', None)))
+        self.assertEqual(len(a.txs), len(b.txs))
+        for x, y in zip(a.txs, b.txs):
+            self.assert_same_txn(x, y)
+
+    def test_paxos(self):
+        for i, field in enumerate(PAXOS_FIELDS):
+            msg = PaxosMessage('PROPOSE_ACK', 5)
+            setattr(msg, field, -i - 1 if i % 2 else 2 ** 70 + i)
+            decoded = self.round_trip(msg, PAXOS)
+            self.assertEqual((decoded.msg_type, decoded.request_seq), ('PROPOSE_ACK', 5))
+            self.assertEqual(getattr(decoded, field), getattr(msg, field))
+            for other in PAXOS_FIELDS:
+                if other != field:
+                    self.assertIsNone(getattr(decoded, other, None))
+
+    def test_block(self):
+        block = make_block()
+        self.assert_same_block(self.round_trip(block, BLOCK), block)
+
+    def test_genesis_block(self):
+        block = Block(-1, None, [], 0)
+        self.assert_same_block(self.round_trip(block, BLOCK), block)
+
+    def test_txn(self):
+        txn = Transaction(3, '', 2 ** 40)
+        self.assert_same_txn(self.round_trip(txn, TXN), txn)
+
+    def test_request_blocks(self):
+        self.assertEqual(self.round_trip(RequestBlockMessage(-123), RQB).block_id, -123)
+
+    def test_respond_blocks(self):
+        blocks = [make_block(), make_block(0)]
+        decoded = self.round_trip(RespondBlockMessage(blocks), RSB)
+        self.assertEqual(len(decoded.blocks), 2)
+        for a, b in zip(decoded.blocks, blocks):
+            self.assert_same_block(a, b)
+
+    def test_ack_commit(self):
+        self.assertEqual(self.round_trip(AckCommitMessage(99), ACM).block_id, 99)
+
+    def test_request_range(self):
+        decoded = self.round_trip(RequestRangeMessage(4, [[0, 1000, 1], [1000, 2000, 2]]), RQR)
+        self.assertEqual((decoded.recovery_id, decoded.chunks), (4, [[0, 1000, 1], [1000, 2000, 2]]))
+
+    def test_respond_range(self):
+        block = make_block()
+        for last in [True, False]:
+            decoded = self.round_trip(RespondRangeMessage(4, 1000, 2000, [block], last, 2), RSR)
+            self.assertEqual((decoded.recovery_id, decoded.lo, decoded.hi, decoded.last, decoded.responder_id),
+                             (4, 1000, 2000, last, 2))
+            self.assert_same_block(decoded.blocks[0], block)
+
+    def test_snapshot_offer(self):
+        block = make_block()
+        decoded = self.round_trip(SnapshotOfferMessage(block, 12345, 'abc123'), SNO)
+        self.assert_same_block(decoded.block, block)
+        self.assertEqual((decoded.size, decoded.digest), (12345, 'abc123'))
+
+    def test_request_snapshot(self):
+        decoded = self.round_trip(RequestSnapshotMessage(8, [0, 3, 200]), RQS)
+        self.assertEqual((decoded.block_id, decoded.indices), (8, [0, 3, 200]))
+
+    def test_snapshot_chunk(self):
+        decoded = self.round_trip(SnapshotChunkMessage(8, 3, b'\x00\xff' * 100, 'abc123'), SNC)
+        self.assertEqual((decoded.block_id, decoded.index, decoded.data, decoded.digest),
+                         (8, 3, b'\x00\xff' * 100, 'abc123'))
+
+    def test_frame(self):
+        block = make_block()
+        frame = Encoded(block).serialize()
+        self.assertTrue(frame.startswith(FRAME_PREFIX))
+        self.assert_same_block(decode_frame(frame), block)
+
+
+class TestDecodeError(TestCase):
+
+    def test_unsupported_version(self):
+        data = bytearray(encode(AckCommitMessage(1)))
+        data[0] = VERSION + 1
+        self.assertRaises(DecodeError, decode, bytes(data))
+
+    def test_unknown_type(self):
+        self.assertRaises(DecodeError, decode, bytes([VERSION, 200]))
+
+    def test_unknown_paxos_type(self):
+        self.assertRaises(DecodeError, decode, bytes([VERSION, PAXOS, 9, 0, 0]))
+
+    def test_truncated(self):
+        data = encode(make_block())
+        for end in [0, 1, 2, len(data) // 2, len(data) - 1]:
+            self.assertRaises(DecodeError, decode, data[:end])
+
+    def test_invalid_string(self):
+        self.assertRaises(DecodeError, decode, bytes([VERSION, TXN, 0, 0, 2, 0xff, 0xfe]))
+
+    def test_not_a_frame(self):
+        self.assertRaises(DecodeError, decode_frame, b'TXN' + encode(AckCommitMessage(1)))
+
+    def test_unknown_object(self):
+        self.assertRaises(TypeError, encode, object())
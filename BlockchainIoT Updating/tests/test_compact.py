@@ -0,0 +1,63 @@
+"""Tests of the compact representation of committed blocks (compact module)."""
+
+from twisted.trial.unittest import TestCase
+
+from piChain.compact import CompactBlock, TxnTable, block_commands, expand
+from piChain.messages import Block, Transaction
+
+
+def make_block(contents, txn_ids=None):
+    txs = [Transaction(i % 3, content, i) for i, content in enumerate(contents)]
+    if txn_ids is not None:
+        for txn, txn_id in zip(txs, txn_ids):
+            txn.txn_id = txn_id
+    block = Block(1, -1, txs, 5)
+    block.depth = len(txs)
+    block.creator_state = 2
+    return block
+
+
+class TestCompactBlock(TestCase):
+
+    def assert_same_block(self, a, b):
+        self.assertEqual((a.creator_id, a.parent_block_id, a.block_id, a.depth, a.creator_state),
+                         (b.creator_id, b.parent_block_id, b.block_id, b.depth, b.creator_state))
+        self.assertEqual([(t.creator_id, t.txn_id, t.content) for t in a.txs],
+                         [(t.creator_id, t.txn_id, t.content) for t in b.txs])
+
+    def test_expand_round_trip(self):
+        block = make_block(['set a 1', '', 'set ü 2'])
+        compact = CompactBlock(block)
+        self.assertEqual(compact, block)
+        self.assertEqual(hash(compact), hash(block.block_id))
+
+        expanded = compact.expand()
+        self.assertIsInstance(expanded, Block)
+        self.assertEqual(expanded, block)
+        self.assert_same_block(expanded, block)
+        self.assertIs(expand(block), block)
+
+    def test_large_ids(self):
+        ids = [1, 2 ** 63, -2 ** 63 - 1, 2 ** 100]
+        block = make_block(['a', 'b', 'c', 'd'], ids)
+        compact = CompactBlock(block)
+        self.assertIsInstance(compact.txs.txn_ids, list)
+        self.assertEqual([txn.txn_id for txn in compact.txs], ids)
+        self.assertIn(block.txs[1], compact.txs)
+        self.assert_same_block(compact.expand(), block)
+
+    def test_bytes_commands(self):
+        block = make_block([b'\x00\xff', 'text', b''])
+        compact = CompactBlock(block)
+        self.assertEqual(block_commands(compact), [b'\x00\xff', 'text', b''])
+        self.assertEqual(compact.txs[-3].content, b'\x00\xff')
+        self.assert_same_block(compact.expand(), block)
+
+    def test_table(self):
+        block = make_block(['x%s' % i for i in range(10)])
+        table = TxnTable(block.txs)
+        self.assertEqual(len(table), 10)
+        self.assertIsNone(table.raw)
+        self.assertEqual([txn.txn_id for txn in table[2:5]], [2, 3, 4])
+        self.assertIn(block.txs[7], table)
+        self.assertNotIn(Transaction(0, 'y', 99), table)
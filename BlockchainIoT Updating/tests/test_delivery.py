@@ -0,0 +1,86 @@
+"""Tests of the batched delivery of committed commands (delivery module)."""
+
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from piChain.delivery import CommitDelivery
+
+
+class FakeDB:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def put(self, key, value):
+        self.data[key] = value
+
+
+class TestCommitDelivery(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.db = FakeDB()
+        self.batches = []
+        self.acknowledged = []
+        self.results = []
+
+    def make_delivery(self, **kwargs):
+        def run_in_thread(f, *args):
+            d = defer.Deferred()
+            self.results.append((d, f, args))
+            return d
+        return CommitDelivery(self.batches.append, self.clock, self.db, run_in_thread=run_in_thread,
+                              on_delivered=lambda first, last: self.acknowledged.append((first, last)), **kwargs)
+
+    def finish(self):
+        """The app returns from the oldest batch."""
+        d, f, args = self.results.pop(0)
+        d.callback(f(*args))
+
+    def test_batch_delay(self):
+        delivery = self.make_delivery(max_batch_count=10, max_batch_delay=0.05)
+        delivery.enqueue(1, ['a', 'b'])
+        delivery.enqueue(2, ['c'])
+        self.assertEqual(self.results, [])
+        self.clock.advance(0.05)
+        self.finish()
+        self.assertEqual(self.batches, [['a', 'b', 'c']])
+        self.assertEqual(delivery.delivered_offset, 2)
+        self.assertEqual(self.db.get(b'delivered_offset'), b'2')
+
+    def test_on_delivered_after_app_returned(self):
+        delivery = self.make_delivery(max_batch_count=2)
+        delivery.enqueue(1, ['a', 'b'])
+        delivery.enqueue(2, ['c', 'd'])
+        delivery.enqueue(3, ['e', 'f'])
+        # the first batch is handed to the app, it is not acknowledged before the app returned
+        self.assertEqual(self.acknowledged, [])
+        self.finish()
+        self.assertEqual(self.acknowledged, [(1, 1)])
+        self.finish()
+        self.finish()
+        self.assertEqual(self.acknowledged, [(1, 1), (2, 2), (3, 3)])
+
+    def test_failed_batch_not_acknowledged(self):
+        delivery = self.make_delivery(max_batch_count=1)
+        delivery.enqueue(1, ['a'])
+        d, f, args = self.results.pop(0)
+        d.errback(RuntimeError('app failed'))
+        self.assertEqual(self.acknowledged, [])
+        self.assertEqual(delivery.pending_count, 1)
+
+        self.clock.advance(delivery.max_batch_delay)
+        self.finish()
+        self.assertEqual(self.acknowledged, [(1, 1)])
+
+    def test_restart_skips_acknowledged_blocks(self):
+        self.db.put(b'delivered_offset', b'2')
+        delivery = self.make_delivery(max_batch_count=1)
+        delivery.enqueue(2, ['b'])
+        delivery.enqueue(3, ['c'])
+        self.finish()
+        self.assertEqual(self.batches, [['c']])
+        self.assertEqual(self.acknowledged, [(3, 3)])
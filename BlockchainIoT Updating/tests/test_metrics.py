@@ -0,0 +1,60 @@
+"""Tests of the Prometheus text format export (metrics module)."""
+
+from twisted.trial.unittest import TestCase
+
+from piChain.metrics import Metrics, Histogram
+
+
+class TestHistogram(TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram([0.1, 1.])
+        for value in [0.05, 0.1, 0.5, 2.]:
+            histogram.observe(value)
+        # a value equal to an upper bound falls into that bucket, the last count is the +Inf bucket
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+
+class TestRender(TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_counters_and_gauges(self):
+        self.metrics.inc('pichain_votes_total', type='TRY_OK')
+        self.metrics.inc('pichain_votes_total', 2, type='PROPOSE_ACK')
+        self.metrics.set('pichain_state', 2)
+        self.assertEqual(self.metrics.render(), '\n'.join([
+            '# TYPE pichain_votes_total counter',
+            'pichain_votes_total{type="PROPOSE_ACK"} 2',
+            'pichain_votes_total{type="TRY_OK"} 1',
+            '# TYPE pichain_state gauge',
+            'pichain_state 2',
+        ]) + '\n')
+
+    def test_histogram(self):
+        for value in [0.00005, 0.003, 0.003, 20.]:
+            self.metrics.observe('pichain_commit_latency_seconds', value)
+        lines = self.metrics.render().splitlines()
+        self.assertEqual(lines[0], '# TYPE pichain_commit_latency_seconds histogram')
+        self.assertIn('pichain_commit_latency_seconds_bucket{le="0.0001"} 1', lines)
+        self.assertIn('pichain_commit_latency_seconds_bucket{le="0.0025"} 1', lines)
+        self.assertIn('pichain_commit_latency_seconds_bucket{le="0.005"} 3', lines)
+        self.assertIn('pichain_commit_latency_seconds_bucket{le="10.0"} 3', lines)
+        self.assertIn('pichain_commit_latency_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('pichain_commit_latency_seconds_count 4', lines)
+        sum_line = [line for line in lines if line.startswith('pichain_commit_latency_seconds_sum')][0]
+        self.assertAlmostEqual(float(sum_line.split()[1]), 20.00605)
+
+    def test_label_escaping(self):
+        self.metrics.inc('pichain_errors_total', reason='bad "quote"\\\n')
+        self.assertIn('pichain_errors_total{reason="bad \\"quote\\"\\\\\\n"} 1', self.metrics.render())
+
+    def test_commit_latency(self):
+        self.metrics.txn_received(1)
+        self.metrics.txns_committed([1, 2])
+        # the txn 2 was not received by this node
+        self.assertEqual(self.metrics.histograms[('pichain_commit_latency_seconds', ())].count, 1)
+        self.assertEqual(self.metrics.txn_receipt, {})
@@ -0,0 +1,48 @@
+"""Tests of the measurement of reactor stalls (monitor module)."""
+
+import time
+
+from twisted.trial.unittest import TestCase
+
+from piChain.monitor import TimedClock, summarize
+
+
+class TestTimedClock(TestCase):
+
+    def test_records_every_call(self):
+        clock = TimedClock()
+        clock.callLater(1, time.sleep, 0.02)
+        clock.callLater(2, lambda: None)
+        clock.advance(1)
+        self.assertEqual(len(clock.durations), 1)
+        self.assertGreaterEqual(clock.durations[0], 0.02)
+        clock.advance(1)
+        self.assertEqual(len(clock.durations), 2)
+        self.assertLess(clock.durations[1], 0.02)
+
+    def test_off_reactor_excluded(self):
+        clock = TimedClock()
+        results = []
+        clock.callLater(1, lambda: results.append(clock.off_reactor(lambda: time.sleep(0.05) or 'done')))
+        clock.advance(1)
+        self.assertEqual(results, ['done'])
+        self.assertLess(clock.durations[0], 0.05)
+
+    def test_call_raising(self):
+        clock = TimedClock()
+        clock.callLater(1, lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, clock.advance, 1)
+        self.assertEqual(len(clock.durations), 1)
+
+
+class TestSummarize(TestCase):
+
+    def test_empty(self):
+        self.assertEqual(summarize([]), {'count': 0, 'p50_ms': 0., 'p99_ms': 0., 'max_ms': 0.})
+
+    def test_percentiles(self):
+        summary = summarize([i / 1000. for i in range(100, 0, -1)])
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50_ms'], 51.)
+        self.assertAlmostEqual(summary['p99_ms'], 100.)
+        self.assertAlmostEqual(summary['max_ms'], 100.)
@@ -0,0 +1,56 @@
+"""Tests of pipelined commit rounds (PaxosLogic.COMMIT_WINDOW) in the simulation harness."""
+
+from twisted.trial.unittest import TestCase
+
+from piChain.simulation import Simulation, run_load
+
+
+def assert_same_committed_chain(test, sim):
+    """All nodes committed the same block and their lists of committed blocks do not diverge."""
+    nodes = sim.network.nodes
+    committed = [node.blocktree.committed_blocks for node in nodes]
+    longest = max(committed, key=len)
+    for node, blocks in zip(nodes, committed):
+        test.assertEqual(blocks, longest[:len(blocks)], 'committed chain of node %s diverged' % node.index)
+        test.assertEqual(node.blocktree.committed_block.block_id, nodes[0].blocktree.committed_block.block_id)
+
+
+class TestPipelining(TestCase):
+
+    def test_window_throughput(self):
+        """Pipelining commits more blocks per second than one round at a time and every txn is still committed."""
+        reports = {}
+        for window in [1, 4]:
+            reports[window] = run_load(1000, 20., n=3, seed=1, latency=0.02, commit_window=window)
+
+        for report in reports.values():
+            self.assertEqual(report['committed'], report['submitted'])
+        self.assertGreater(reports[1]['blocks_per_sec'], 0)
+        self.assertGreater(reports[4]['blocks_per_sec'], reports[1]['blocks_per_sec'])
+
+    def test_aborted_pipeline_same_chain(self):
+        """Rounds in flight are aborted while the quick node is partitioned, afterwards all nodes still agree on the
+        committed chain. Jitter reorders the PROPOSE messages of the pipelined rounds.
+        """
+        sim = Simulation(n=3, seed=2, latency=0.02, jitter=0.02, commit_window=4)
+        self.addCleanup(sim.close)
+
+        aborted = []
+        leader = sim.network.nodes[0]
+        abort_pipeline = leader.abort_pipeline
+
+        def count_abort():
+            aborted.append(len(leader.c_pipeline))
+            abort_pipeline()
+        leader.abort_pipeline = count_abort
+
+        sim.schedule_load(500, 15.)
+        sim.run(5.)
+        sim.network.partition([0], [1, 2])
+        sim.run(3.)
+        sim.network.heal()
+        sim.run(27.)
+
+        self.assertTrue(any(aborted), 'no pipelined round was aborted')
+        self.assertGreater(len(leader.blocktree.committed_blocks), 1)
+        assert_same_committed_chain(self, sim)
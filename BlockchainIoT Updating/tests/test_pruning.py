@@ -0,0 +1,108 @@
+"""Tests of the deletion of pruned blocks (pruning module)."""
+
+import bisect
+
+from twisted.trial.unittest import TestCase
+
+from piChain.pruning import Pruner
+
+
+class FakeIterator:
+    """Key iterator of `FakeDB` supporting `seek`."""
+    def __init__(self, keys):
+        self.keys = keys
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position >= len(self.keys):
+            raise StopIteration
+        self.position += 1
+        return self.keys[self.position - 1]
+
+    def seek(self, key):
+        self.position = bisect.bisect_left(self.keys, key)
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def delete(self, key):
+        self.db.keys.discard(key)
+
+
+class FakeDB:
+    """The parts of plyvel.DB used by the pruner, keys are kept in a set."""
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.compacted = []
+
+    def iterator(self, include_value=True):
+        assert not include_value
+        return FakeIterator(sorted(self.keys))
+
+    def write_batch(self):
+        return FakeWriteBatch(self)
+
+    def compact_range(self, start=None, stop=None):
+        self.compacted.append((start, stop))
+
+
+def keys(*block_ids):
+    return [str(block_id).encode() for block_id in block_ids]
+
+
+class TestDeletedRuns(TestCase):
+
+    def test_one_run(self):
+        pruner = Pruner(FakeDB(keys(1, 2, 7, 8)))
+        self.assertEqual(pruner.deleted_runs(keys(3, 4, 5)), [(b'3', b'5')])
+
+    def test_runs_split_by_remaining_keys(self):
+        # decimal ids compared as bytes: b'10' < b'2'
+        pruner = Pruner(FakeDB(keys(15, 3, 99)))
+        runs = pruner.deleted_runs(keys(10, 12, 2, 20, 4, 5))
+        self.assertEqual(runs, [(b'10', b'12'), (b'2', b'20'), (b'4', b'5')])
+
+    def test_run_up_to_end_of_keyspace(self):
+        pruner = Pruner(FakeDB(keys(1)))
+        self.assertEqual(pruner.deleted_runs(keys(7, 8, 9)), [(b'7', b'9')])
+
+    def test_no_keys(self):
+        self.assertEqual(Pruner(FakeDB(keys(1))).deleted_runs([]), [])
+
+
+class TestPruner(TestCase):
+
+    def test_synchronous_delete(self):
+        db = FakeDB(keys(*range(10)))
+        pruner = Pruner(db, batch_size=3, synchronous=True)
+        pruner.delete(keys(2, 3, 4, 7))
+        # deleted before `delete` returns, no worker thread is started
+        self.assertEqual(db.keys, set(keys(0, 1, 5, 6, 8, 9)))
+        self.assertIsNone(pruner.thread)
+        self.assertEqual(pruner.deleted, 4)
+        self.assertEqual(db.compacted, [(b'2', b'4'), (b'7', b'7')])
+
+    def test_background_delete(self):
+        db = FakeDB(keys(*range(10)))
+        pruner = Pruner(db, batch_size=3)
+        pruner.delete(keys(2, 3, 4))
+        pruner.join()
+        self.assertEqual(db.keys, set(keys(0, 1, *range(5, 10))))
+        self.assertEqual(db.compacted, [(b'2', b'4')])
@@ -0,0 +1,121 @@
+"""Tests of the range recovery bookkeeping (recovery module)."""
+
+from twisted.trial.unittest import TestCase
+
+from piChain.recovery import RangeRecovery, RespondRangeMessage, split_range, MAX_RANGE_ATTEMPTS, MIN_RANGE_DEPTH
+
+
+class FakeBlock:
+    def __init__(self, block_id, parent_block_id, depth):
+        self.block_id = block_id
+        self.parent_block_id = parent_block_id
+        self.depth = depth
+
+
+def make_path(count, txs_per_block=100, root_id=0):
+    """Returns `count` blocks with ids 1..count on a path above the block `root_id` (depth 0)."""
+    return [FakeBlock(i, i - 1 if i > 1 else root_id, i * txs_per_block) for i in range(1, count + 1)]
+
+
+def respond(lo, hi, blocks, responder_id, last=True):
+    return RespondRangeMessage(1, lo, hi, blocks, last, responder_id)
+
+
+class TestSplitRange(TestCase):
+
+    def test_one_chunk_per_responder(self):
+        self.assertEqual(split_range(0, 3000, [1, 2, 3]), [[0, 1000, 1], [1000, 2000, 2], [2000, 3000, 3]])
+
+    def test_chunks_not_smaller_than_min_depth(self):
+        chunks = split_range(0, 2 * MIN_RANGE_DEPTH + 10, [1, 2, 3, 4])
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[-1][1], 2 * MIN_RANGE_DEPTH + 10)
+
+    def test_chunks_cover_range(self):
+        chunks = split_range(17, 5017, [4, 5, 6])
+        self.assertEqual(chunks[0][0], 17)
+        self.assertEqual(chunks[-1][1], 5017)
+        for a, b in zip(chunks, chunks[1:]):
+            self.assertEqual(a[1], b[0])
+
+
+class TestRangeRecovery(TestCase):
+
+    def setUp(self):
+        self.blocks = make_path(30)
+        self.recovery = RangeRecovery(1, split_range(0, 3000, [1, 2, 3]), [1, 2, 3], 0)
+
+    def chunk_blocks(self, i):
+        return self.blocks[i * 10:(i + 1) * 10]
+
+    def test_chunks_applied_in_order(self):
+        self.assertEqual(self.recovery.add(respond(2000, 3000, self.chunk_blocks(2), 3)), [])
+        self.assertEqual(self.recovery.add(respond(1000, 2000, self.chunk_blocks(1), 2)), [])
+        ready = self.recovery.add(respond(0, 1000, self.chunk_blocks(0), 1))
+        self.assertEqual(ready, self.blocks)
+        self.assertTrue(self.recovery.done())
+
+    def test_streamed_chunk(self):
+        self.recovery.add(respond(0, 1000, self.blocks[:4], 1, last=False))
+        self.assertEqual(self.recovery.add(respond(0, 1000, self.blocks[4:10], 1)), self.blocks[:10])
+
+    def test_answer_of_unassigned_responder_ignored(self):
+        self.assertEqual(self.recovery.add(respond(0, 1000, self.chunk_blocks(0), 2)), [])
+        self.assertNotIn(0, self.recovery.complete)
+
+    def test_empty_chunk_retried(self):
+        # the responder of the middle chunk is behind and answers without blocks
+        self.recovery.add(respond(0, 1000, self.chunk_blocks(0), 1))
+        self.recovery.add(respond(1000, 2000, [], 2))
+        self.assertEqual(self.recovery.retries, [[1000, 2000, 3]])
+        self.recovery.retries = []
+
+        self.recovery.add(respond(2000, 3000, self.chunk_blocks(2), 3))
+        self.assertEqual(self.recovery.retries, [])
+        self.assertEqual(self.recovery.add(respond(1000, 2000, self.chunk_blocks(1), 3)), self.blocks[10:])
+        self.assertTrue(self.recovery.done())
+        self.assertFalse(self.recovery.failed)
+
+    def test_short_last_chunk_retried(self):
+        self.recovery.add(respond(2000, 3000, self.blocks[20:25], 3))
+        self.assertEqual(self.recovery.retries, [[2000, 3000, 1]])
+        self.assertNotIn(2000, self.recovery.complete)
+
+    def test_chunk_with_gap_retried(self):
+        blocks = self.chunk_blocks(1)
+        self.recovery.add(respond(1000, 2000, blocks[:3] + blocks[4:], 2))
+        self.assertEqual(self.recovery.retries, [[1000, 2000, 3]])
+
+    def test_forked_chunk_retried(self):
+        fork = make_path(10, root_id=999)
+        self.recovery.add(respond(0, 1000, self.chunk_blocks(0), 1))
+        self.assertEqual(self.recovery.add(respond(1000, 2000, fork, 2)), [])
+        self.assertEqual(self.recovery.retries, [[1000, 2000, 3]])
+        self.assertEqual(self.recovery.applied, 1)
+
+    def test_gives_up_after_max_attempts(self):
+        for _ in range(MAX_RANGE_ATTEMPTS - 1):
+            responder = self.recovery.chunks[1][2]
+            self.recovery.add(respond(1000, 2000, [], responder))
+            self.assertFalse(self.recovery.failed)
+        self.recovery.add(respond(1000, 2000, [], self.recovery.chunks[1][2]))
+        self.assertTrue(self.recovery.failed)
+
+    def test_retry_chunks(self):
+        self.recovery.add(respond(0, 1000, self.chunk_blocks(0), 1))
+        self.recovery.add(respond(1000, 2000, self.blocks[10:12], 2, last=False))
+        chunks = self.recovery.retry_chunks()
+        self.assertEqual(chunks, [[1000, 2000, 3], [2000, 3000, 1]])
+        # blocks received from the previous responder are dropped
+        self.assertEqual(self.recovery.received[1000], [])
+
+    def test_retry_chunks_gives_up(self):
+        for _ in range(MAX_RANGE_ATTEMPTS - 1):
+            self.assertIsNotNone(self.recovery.retry_chunks())
+        self.assertIsNone(self.recovery.retry_chunks())
+
+    def test_covers(self):
+        self.assertFalse(self.recovery.covers(0))
+        self.assertTrue(self.recovery.covers(1))
+        self.assertTrue(self.recovery.covers(3000))
+        self.assertFalse(self.recovery.covers(3001))
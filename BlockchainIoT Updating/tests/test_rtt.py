@@ -0,0 +1,55 @@
+"""Tests of the round trip time estimation (rtt module)."""
+
+from twisted.trial.unittest import TestCase
+
+from piChain.rtt import RttEstimator, MARGIN, K
+
+
+class TestRttEstimator(TestCase):
+
+    def test_first_sample(self):
+        estimator = RttEstimator(3)
+        estimator.add_sample('a', 0.4)
+        self.assertEqual(estimator.srtts['a'], 0.4)
+        self.assertEqual(estimator.rttvars['a'], 0.2)
+
+    def test_update(self):
+        # RFC 6298: RTTVAR <- 3/4 * RTTVAR + 1/4 * |SRTT - R|, then SRTT <- 7/8 * SRTT + 1/8 * R
+        estimator = RttEstimator(3)
+        estimator.add_sample('a', 1.)
+        estimator.add_sample('a', 0.5)
+        self.assertAlmostEqual(estimator.rttvars['a'], 0.75 * 0.5 + 0.25 * 0.5)
+        self.assertAlmostEqual(estimator.srtts['a'], 0.875 * 1. + 0.125 * 0.5)
+        estimator.add_sample('a', 0.5)
+        self.assertAlmostEqual(estimator.rttvars['a'], 0.75 * 0.5 + 0.25 * 0.4375)
+        self.assertAlmostEqual(estimator.srtts['a'], 0.875 * 0.9375 + 0.125 * 0.5)
+
+    def test_quorum_value(self):
+        # 5 nodes: a node waits for 2 peers
+        estimator = RttEstimator(5, default_rtt=7)
+        self.assertEqual(estimator.quorum_value([0.3, 0.1, 0.5, 0.2]), 0.2)
+        self.assertEqual(estimator.quorum_value([0.3, 0.1]), 0.3)
+        self.assertEqual(estimator.quorum_value([0.3]), 7)
+        # 3 nodes: the fastest peer
+        self.assertEqual(RttEstimator(3).quorum_value([0.3, 0.1]), 0.1)
+        self.assertEqual(RttEstimator(1).quorum_value([]), 0)
+
+    def test_expected_rtt_and_timeout(self):
+        estimator = RttEstimator(3, default_rtt=2)
+        self.assertEqual(estimator.expected_rtt(), 2 + MARGIN)
+        estimator.add_sample('a', 0.1)
+        estimator.add_sample('b', 1.)
+        self.assertAlmostEqual(estimator.expected_rtt(), 0.1 + MARGIN)
+        self.assertAlmostEqual(estimator.timeout(), 0.1 + K * 0.05 + MARGIN)
+
+    def test_remove_peer(self):
+        estimator = RttEstimator(3, default_rtt=2)
+        estimator.add_sample('a', 0.1)
+        estimator.add_sample('b', 1.)
+        estimator.remove_peer('a')
+        self.assertNotIn('a', estimator.srtts)
+        self.assertNotIn('a', estimator.rttvars)
+        self.assertAlmostEqual(estimator.expected_rtt(), 1. + MARGIN)
+        estimator.remove_peer('b')
+        estimator.remove_peer('unknown')
+        self.assertEqual(estimator.expected_rtt(), 2 + MARGIN)
@@ -0,0 +1,176 @@
+"""Tests of the validation pipeline of received blocks (validation module)."""
+
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from piChain.validation import BlockValidation
+
+
+class FakeTxn:
+    def __init__(self, txn_id):
+        self.txn_id = txn_id
+
+
+class FakeBlock:
+    def __init__(self, block_id, parent_block_id, txn_ids=()):
+        self.block_id = block_id
+        self.parent_block_id = parent_block_id
+        self.txs = [FakeTxn(txn_id) for txn_id in txn_ids]
+
+
+class FakeBlocktree:
+    """`valid_block` returns False for the ids in `invalid` and records on which calls it ran."""
+    def __init__(self):
+        self.invalid = set()
+        self.checked = []
+
+    def valid_block(self, block):
+        self.checked.append(block.block_id)
+        return block.block_id not in self.invalid
+
+
+class ManualThread:
+    """Replaces `threads.deferToThread`: the function runs when `run_next` is called."""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, f, *args):
+        d = defer.Deferred()
+        self.calls.append((d, f, args))
+        return d
+
+    def run_next(self):
+        d, f, args = self.calls.pop(0)
+        try:
+            result = f(*args)
+        except Exception:
+            d.errback()
+        else:
+            d.callback(result)
+
+
+class TestBlockValidation(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.blocktree = FakeBlocktree()
+        self.valid = []
+        self.thread = ManualThread()
+        self.validation = BlockValidation(self.blocktree, self.valid.append, self.clock, max_batch=2,
+                                          run_in_thread=self.thread)
+
+    def ids(self, blocks):
+        return [b.block_id for b in blocks]
+
+    def test_batch_collected_in_one_iteration(self):
+        for i in range(1, 4):
+            self.validation.submit(FakeBlock(i, 0))
+        self.assertEqual(self.thread.calls, [])
+
+        self.clock.advance(0)
+        self.assertEqual(len(self.thread.calls), 1)
+        self.thread.run_next()
+        self.assertEqual(self.ids(self.valid), [1, 2])
+
+        # the next batch is started once the previous one is applied
+        self.assertEqual(len(self.thread.calls), 1)
+        self.thread.run_next()
+        self.assertEqual(self.ids(self.valid), [1, 2, 3])
+        self.assertEqual(self.validation.queued, set())
+
+    def test_duplicate_submit_ignored(self):
+        block = FakeBlock(1, 0)
+        self.validation.submit(block)
+        self.validation.submit(block)
+        self.assertEqual(self.validation.pending, [block])
+
+    def test_flush_one_batch_at_a_time(self):
+        self.validation.submit(FakeBlock(1, 0))
+        self.validation.flush()
+        self.validation.submit(FakeBlock(2, 0))
+        self.validation.flush()
+        self.assertEqual(len(self.thread.calls), 1)
+        self.assertEqual(self.ids(self.validation.pending), [2])
+
+    def test_children_validated_after_parent(self):
+        parent, child, grandchild = FakeBlock(1, 0), FakeBlock(2, 1), FakeBlock(3, 2)
+        self.validation.submit(parent)
+        self.validation.submit(child)
+        self.validation.submit(grandchild)
+        self.assertEqual(self.validation.waiting, {1: [child], 2: [grandchild]})
+
+        self.validation.flush()
+        self.thread.run_next()
+        self.thread.run_next()
+        self.thread.run_next()
+        self.assertEqual(self.ids(self.valid), [1, 2, 3])
+
+    def test_invalid_block_and_descendants_rejected(self):
+        self.blocktree.invalid.add(1)
+        parent, child = FakeBlock(1, 0), FakeBlock(2, 1)
+        self.validation.submit(parent)
+        self.validation.submit(child)
+        self.validation.flush()
+        self.thread.run_next()
+
+        self.assertEqual(self.valid, [])
+        self.assertIn(1, self.validation.invalid)
+        self.assertIn(2, self.validation.invalid)
+        # only the parent is validated, on the worker and again on the reactor thread
+        self.assertEqual(self.blocktree.checked, [1, 1])
+
+        # a later descendant is rejected without validation
+        self.validation.submit(FakeBlock(3, 2))
+        self.assertIn(3, self.validation.invalid)
+        self.assertEqual(self.validation.pending, [])
+
+    def test_structurally_invalid_rejected(self):
+        self.validation.submit(FakeBlock(1, 0, txn_ids=[5, 5]))
+        self.validation.submit(FakeBlock(2, None))
+        self.assertEqual(self.validation.pending, [])
+        self.assertIn(1, self.validation.invalid)
+        self.assertIn(2, self.validation.invalid)
+        self.assertEqual(self.blocktree.checked, [])
+
+    def test_negative_result_checked_on_reactor_thread(self):
+        block = FakeBlock(1, 0)
+        self.validation.submit(block)
+        self.validation.flush()
+        # the worker saw the blocktree in the middle of a change
+        self.validation.validated([False], [block])
+        self.assertEqual(self.valid, [block])
+
+    def test_batch_validated_again_after_genesis_change(self):
+        block = FakeBlock(1, 0)
+        self.validation.submit(block)
+        self.validation.flush()
+        self.validation.genesis_changed()
+        self.blocktree.invalid.add(1)
+        self.validation.validated([True], [block])
+        self.assertEqual(self.valid, [])
+        self.assertIn(1, self.validation.invalid)
+
+    def test_worker_exception_validated_on_reactor_thread(self):
+        block = FakeBlock(1, 0)
+        self.validation.submit(block)
+        self.validation.flush()
+
+        # e.g a block is pruned in the middle of the walk of the worker
+        d, f, args = self.thread.calls.pop(0)
+        d.errback(KeyError(block.block_id))
+        self.assertEqual(self.valid, [block])
+        self.assertFalse(self.validation.validating)
+
+    def test_on_valid_exception_does_not_stop_pipeline(self):
+        def on_valid(b):
+            if b.block_id == 1:
+                raise ValueError()
+            self.valid.append(b)
+        self.validation.on_valid = on_valid
+        self.validation.submit(FakeBlock(1, 0))
+        self.validation.submit(FakeBlock(2, 1))
+        self.validation.flush()
+        self.thread.run_next()
+        self.thread.run_next()
+        self.assertEqual(self.ids(self.valid), [2])
@@ -0,0 +1,21 @@
+"""Comparison of block validation on the reactor thread against the validation pipeline in the simulation harness."""
+
+from twisted.trial.unittest import TestCase
+
+from piChain.simulation import run_load
+
+
+class TestValidationStalls(TestCase):
+
+    def test_validation_off_reactor(self):
+        """With and without the pipeline every txn is committed and the wall time of the reactor calls is reported
+        (`call_p99_ms`, `call_max_ms`, `reactor_busy_sec`). With the pipeline validation is not part of them.
+        """
+        reports = {}
+        for block_validation in [False, True]:
+            reports[block_validation] = run_load(500, 20., n=3, seed=4, latency=0.02,
+                                                 block_validation=block_validation)
+
+        for report in reports.values():
+            self.assertEqual(report['committed'], report['submitted'])
+            self.assertGreaterEqual(report['call_max_ms'], report['call_p99_ms'])
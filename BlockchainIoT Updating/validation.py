@@ -0,0 +1,177 @@
+"""This module implements the validation of received blocks off the reactor thread.
+Checking the transactions of a block against its ancestors (`Blocktree.valid_block`) is the expensive part of
+handling a block. During a recovery burst all message handling would wait behind it. Instead, cheap structural
+checks are done inline and blocks are validated in batches on a worker thread. A block is only validated once its
+parent is, thus results are applied in dependency order. Descendants of an invalid block are rejected without being
+validated.
+
+`Blocktree.valid_block` runs on the worker thread while the reactor keeps adding blocks to and pruning blocks from
+`Blocktree.nodes`. The worker only reads the blocktree, single lookups in `nodes` are atomic and blocks are never
+changed once added. Adding blocks cannot change the validity of a block, pruning (a genesis block change) can. Thus:
+- a batch during which the genesis block changed (see `BlockValidation.genesis_changed`) is validated again on the
+  reactor thread,
+- a block is only rejected once it is invalid on the reactor thread as well,
+- an exception of the worker (e.g a block pruned in the middle of a walk) validates the batch on the reactor thread.
+
+Batches run on a pool with a single thread owned by the pipeline, not on the global reactor threadpool, s.t a burst of
+blocks neither delays other users of that pool nor validates two batches against the blocktree at the same time. In
+the simulation `run_in_thread` is replaced by a synchronous call since the fake reactor has no threads.
+"""
+
+import logging
+
+from twisted.internet import threads
+from twisted.python.threadpool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+# maximal number of blocks validated in one batch
+MAX_VALIDATION_BATCH = 100
+
+# number of invalid block ids remembered to reject their descendants
+MAX_INVALID_BLOCKS = 10000
+
+
+def structurally_valid(block):
+    """Checks that do not depend on other blocks: the block has a parent and no transaction appears twice."""
+    if block.parent_block_id is None:
+        return False
+    txn_ids = [txn.txn_id for txn in block.txs]
+    return len(txn_ids) == len(set(txn_ids))
+
+
+class BlockValidation:
+    """Validation pipeline of received blocks.
+
+    Args:
+        blocktree (Blocktree): the blocktree of the node, `valid_block` is called on a worker thread.
+        on_valid (Callable): called on the reactor thread with every valid block, in dependency order.
+        reactor: reactor used to schedule the batches.
+        max_batch (int): maximal number of blocks validated in one batch.
+        run_in_thread (Callable): runs a function on a worker thread and returns a Deferred firing with its result. If
+            None, the batches run on a pool with a single thread which is stopped when the reactor shuts down.
+
+    Attributes:
+        pending (list): blocks whose parent is validated, to be validated in the next batch.
+        queued (set): ids of the blocks that are pending, waiting or being validated.
+        waiting (dict): Mapping from block_id to the blocks waiting for the validation of that (parent) block.
+        invalid (dict): ids of invalid blocks (used as an ordered set, the oldest are forgotten first).
+        validating (bool): True while a batch is validated (batches are validated one after another).
+        flush_call (IDelayedCall): scheduled validation of the next batch.
+        genesis_changes (int): number of genesis block changes so far.
+        batch_genesis_changes (int): value of `genesis_changes` when the current batch was handed to the worker.
+        pool (ThreadPool): validates the batches if no `run_in_thread` is given (started with the first batch).
+    """
+    def __init__(self, blocktree, on_valid, reactor, max_batch=MAX_VALIDATION_BATCH, run_in_thread=None):
+        self.blocktree = blocktree
+        self.on_valid = on_valid
+        self.reactor = reactor
+        self.max_batch = max_batch
+        self.run_in_thread = self.run_in_pool if run_in_thread is None else run_in_thread
+        self.pool = None
+
+        self.pending = []
+        self.queued = set()
+        self.waiting = {}
+        self.invalid = {}
+        self.validating = False
+        self.flush_call = None
+        self.genesis_changes = 0
+        self.batch_genesis_changes = 0
+
+    def run_in_pool(self, f, *args):
+        """Run `f` on the thread of the pool of this pipeline and return a Deferred firing with its result."""
+        if self.pool is None:
+            self.pool = ThreadPool(minthreads=0, maxthreads=1, name='block-validation')
+            self.pool.start()
+            self.reactor.addSystemEventTrigger('during', 'shutdown', self.pool.stop)
+        return threads.deferToThreadPool(self.reactor, self.pool, f, *args)
+
+    def genesis_changed(self):
+        """Called on the reactor thread when the genesis block changed, the results of the current batch are not
+        trusted anymore.
+        """
+        self.genesis_changes += 1
+
+    def submit(self, block):
+        """Validate `block` (which is already part of the blocktree) and call `on_valid` if it is valid.
+
+        Args:
+            block (Block): received block.
+        """
+        if block.block_id in self.queued:
+            return
+        if block.block_id in self.invalid or block.parent_block_id in self.invalid or not structurally_valid(block):
+            self.reject(block)
+            return
+
+        self.queued.add(block.block_id)
+        if block.parent_block_id in self.queued:
+            self.waiting.setdefault(block.parent_block_id, []).append(block)
+            return
+
+        self.pending.append(block)
+        if self.flush_call is None:
+            # collect the blocks arriving in this reactor iteration into one batch
+            self.flush_call = self.reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """Validate the next batch on a worker thread if no other batch is being validated."""
+        if self.flush_call is not None and self.flush_call.active():
+            self.flush_call.cancel()
+        self.flush_call = None
+
+        if self.validating or not self.pending:
+            return
+
+        batch = self.pending[:self.max_batch]
+        del self.pending[:self.max_batch]
+        self.validating = True
+        self.batch_genesis_changes = self.genesis_changes
+        d = self.run_in_thread(self.validate, batch)
+        d.addCallbacks(self.validated, self.validation_failed, callbackArgs=(batch,), errbackArgs=(batch,))
+
+    def validate(self, batch):
+        """Runs on a worker thread. Returns a list with the validity of every block of `batch`."""
+        return [self.blocktree.valid_block(b) for b in batch]
+
+    def validated(self, results, batch):
+        """Apply the results of a batch on the reactor thread and continue with the blocks waiting for them."""
+        if self.genesis_changes != self.batch_genesis_changes:
+            # blocks were pruned while the batch was validated
+            logger.debug('genesis block changed during validation, validate %s blocks again', str(len(batch)))
+            self.batch_genesis_changes = self.genesis_changes
+            results = self.validate(batch)
+        self.validating = False
+        for b, valid in zip(batch, results):
+            self.queued.discard(b.block_id)
+            if not valid and not self.blocktree.valid_block(b):
+                logger.debug('block invalid')
+                self.reject(b)
+                continue
+            try:
+                self.on_valid(b)
+            except Exception:
+                logger.exception('handling of valid block %s failed', str(b.block_id))
+            for child in self.waiting.pop(b.block_id, []):
+                self.queued.discard(child.block_id)
+                self.submit(child)
+        self.flush()
+
+    def validation_failed(self, failure, batch):
+        """The validation raised an exception (e.g the blocktree changed under it): validate the batch again on the
+        reactor thread, where the blocktree does not change.
+        """
+        logger.debug('validation of %s blocks failed: %s', str(len(batch)), failure.getErrorMessage())
+        self.validated(self.validate(batch), batch)
+
+    def reject(self, block):
+        """Remember that `block` is invalid and reject all blocks waiting for it."""
+        rejected = [block]
+        while rejected:
+            b = rejected.pop()
+            self.invalid[b.block_id] = None
+            if len(self.invalid) > MAX_INVALID_BLOCKS:
+                del self.invalid[next(iter(self.invalid))]
+            self.queued.discard(b.block_id)
+            rejected.extend(self.waiting.pop(b.block_id, []))
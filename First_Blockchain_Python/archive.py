@@ -0,0 +1,294 @@
+"""
+Compressed archive tier of the chain.
+
+Blocks more than ARCHIVE_DEPTH below the tip are written to segment files of SEGMENT_BLOCKS blocks. Each block is
+zlib compressed separately against a preset dictionary sampled from the first segment, so reading one block only
+decompresses that block.
+
+TieredChain behaves like the list of blocks: indexing, slicing, iteration and len work the same, archived blocks are
+decompressed on access.
+
+The archive directory holds generations gen-*, the file current names the one in use. The blocks not yet archived
+are appended to the file hot of the generation, thus a node restarted with the same directory continues with its
+whole chain. A replaced chain is archived into a new generation which is made current with an atomic rename, the old
+generation is deleted once no chain reads it anymore.
+"""
+
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import weakref
+import zlib
+from bisect import bisect_right
+from collections.abc import Sequence
+
+# blocks this far below the tip are archived
+ARCHIVE_DEPTH = 1000
+
+# number of blocks per archive segment
+SEGMENT_BLOCKS = 1000
+
+# maximal size of the preset dictionary (zlib uses at most 32 KiB)
+DICT_SIZE = 32 * 1024
+
+LEVEL = 9
+
+COUNT = struct.Struct('>I')
+
+
+class ChainArchive(object):
+    """
+    Directory of archive segments. A segment file seg-<height of its first block> contains the number of blocks, the
+    offsets of the compressed blocks and the compressed blocks. The file hot contains the height of its first block
+    followed by the blocks above the archived ones, one JSON line each.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.cache = None
+        self.load()
+
+    def load(self):
+        """Read the segments and the dictionary written before (segments are only written completely)."""
+        self.starts = sorted(int(name[4:]) for name in os.listdir(self.path)
+                             if name.startswith('seg-') and not name.endswith('.tmp'))
+        self.length = 0
+        if self.starts:
+            with open(os.path.join(self.path, f'seg-{self.starts[-1]:012d}'), 'rb') as f:
+                count, = COUNT.unpack(f.read(COUNT.size))
+            self.length = self.starts[-1] + count
+        self.dictionary = None
+        if os.path.exists(os.path.join(self.path, 'dict')):
+            with open(os.path.join(self.path, 'dict'), 'rb') as f:
+                self.dictionary = f.read()
+
+    def __len__(self):
+        return self.length
+
+    def load_hot(self):
+        """
+        :return: list of the blocks in the hot file above the archived ones
+        """
+        try:
+            with open(os.path.join(self.path, 'hot'), 'rb') as f:
+                lines = f.read().split(b'\n')
+        except FileNotFoundError:
+            return []
+        start = int(lines[0])
+        if start > self.length:
+            raise ValueError(f'hot blocks start at {start} but only {self.length} blocks are archived')
+        blocks = []
+        # the last line is empty or torn by a crash while it was appended
+        for line in lines[1:-1]:
+            blocks.append(json.loads(line))
+        # blocks archived after the hot file was written are skipped
+        return blocks[self.length - start:]
+
+    def save_hot(self, blocks):
+        """
+        Replace the hot file
+        :param blocks: blocks above the archived ones
+        """
+        name = os.path.join(self.path, 'hot')
+        with open(name + '.tmp', 'wb') as f:
+            f.write(f'{self.length}\n'.encode())
+            f.write(b''.join(json.dumps(block, sort_keys=True).encode() + b'\n' for block in blocks))
+        os.replace(name + '.tmp', name)
+
+    def log_hot(self, block):
+        """
+        Append a block to the hot file
+        :param block: dict - block above the blocks already in the hot file
+        """
+        with open(os.path.join(self.path, 'hot'), 'ab') as f:
+            f.write(json.dumps(block, sort_keys=True).encode() + b'\n')
+
+    def add(self, blocks):
+        """
+        Archive blocks as a new segment
+        :param blocks: list of consecutive blocks, the first one has height len(self)
+        """
+        encoded = [json.dumps(block, sort_keys=True).encode() for block in blocks]
+        if self.dictionary is None:
+            # every n-th block, s.t the dictionary covers the whole segment in at most DICT_SIZE bytes
+            step = max(1, sum(len(data) for data in encoded) // DICT_SIZE)
+            self.dictionary = b''.join(encoded[::step])[-DICT_SIZE:]
+            with open(os.path.join(self.path, 'dict'), 'wb') as f:
+                f.write(self.dictionary)
+
+        compressed = []
+        for data in encoded:
+            c = zlib.compressobj(LEVEL, zdict=self.dictionary)
+            compressed.append(c.compress(data) + c.flush())
+
+        offsets = [0]
+        for data in compressed:
+            offsets.append(offsets[-1] + len(data))
+        header = COUNT.pack(len(blocks)) + struct.pack(f'>{len(offsets)}I', *offsets)
+
+        start = self.length
+        name = os.path.join(self.path, f'seg-{start:012d}')
+        with open(name + '.tmp', 'wb') as f:
+            f.write(header)
+            f.write(b''.join(compressed))
+        os.replace(name + '.tmp', name)
+
+        self.starts.append(start)
+        self.length += len(blocks)
+
+    def segment(self, start):
+        with self.lock:
+            if self.cache is None or self.cache[0] != start:
+                with open(os.path.join(self.path, f'seg-{start:012d}'), 'rb') as f:
+                    data = f.read()
+                count, = COUNT.unpack_from(data)
+                offsets = struct.unpack_from(f'>{count + 1}I', data, COUNT.size)
+                self.cache = (start, data, offsets, COUNT.size + 4 * (count + 1))
+            return self.cache[1:]
+
+    def __getitem__(self, height):
+        """
+        :param height: position of the block in the chain, smaller than len(self)
+        :return: dict - the block
+        """
+        start = self.starts[bisect_right(self.starts, height) - 1]
+        data, offsets, base = self.segment(start)
+        i = height - start
+        d = zlib.decompressobj(zdict=self.dictionary)
+        return json.loads(d.decompress(data[base + offsets[i]:base + offsets[i + 1]]) + d.flush())
+
+
+def open_archive(root):
+    """
+    Open the current generation of the archive in root, create it if there is none. Other generations are left over
+    from a previous run and deleted.
+    :param root: directory of the archive
+    :return: ChainArchive
+    """
+    os.makedirs(root, exist_ok=True)
+    try:
+        with open(os.path.join(root, 'current')) as f:
+            current = f.read().strip()
+    except FileNotFoundError:
+        current = None
+    for name in os.listdir(root):
+        if name.startswith('gen-') and name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    if current is None:
+        return new_archive(root, publish=True)
+    return ChainArchive(os.path.join(root, current))
+
+
+def new_archive(root, publish=False):
+    """
+    Create an empty generation of the archive in root
+    :param root: directory of the archive
+    :param publish: make it the current generation right away
+    :return: ChainArchive
+    """
+    archive = ChainArchive(tempfile.mkdtemp(prefix='gen-', dir=root))
+    if publish:
+        publish_archive(root, archive)
+    return archive
+
+
+def publish_archive(root, archive, old=None):
+    """
+    Atomically make archive the current generation in root. The old generation is deleted once it is garbage
+    collected, i.e when no chain reads it anymore.
+    :param root: directory of the archive
+    :param archive: ChainArchive in root
+    :param old: ChainArchive replaced by archive or None
+    """
+    name = os.path.join(root, 'current')
+    with open(name + '.tmp', 'w') as f:
+        f.write(os.path.basename(archive.path))
+    os.replace(name + '.tmp', name)
+    if old is not None:
+        # a generation still in use at exit is deleted by open_archive on the next start
+        weakref.finalize(old, shutil.rmtree, old.path, True).atexit = False
+
+
+class TieredChain(Sequence):
+    """
+    The chain as a sequence of blocks, blocks more than depth below the tip are moved to archive in segments of
+    SEGMENT_BLOCKS blocks. The chain starts with the blocks already in archive, blocks continue them.
+    """
+
+    def __init__(self, blocks, archive, depth=ARCHIVE_DEPTH):
+        self.archive = archive
+        self.depth = depth
+        self.hot = archive.load_hot()
+        archive.save_hot(self.hot)
+        for block in blocks:
+            self.append(block)
+
+    def __len__(self):
+        return len(self.archive) + len(self.hot)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('chain index out of range')
+        if i < len(self.archive):
+            return self.archive[i]
+        return self.hot[i - len(self.archive)]
+
+    def __iter__(self):
+        for i in range(len(self.archive)):
+            yield self.archive[i]
+        yield from list(self.hot)
+
+    def snapshot(self):
+        """
+        :return: ChainSnapshot of the current blocks, cheap to take (archived blocks are read when accessed)
+        """
+        return ChainSnapshot(self.archive, len(self.archive), list(self.hot))
+
+    def append(self, block):
+        self.hot.append(block)
+        if len(self.hot) >= self.depth + SEGMENT_BLOCKS:
+            self.archive.add(self.hot[:SEGMENT_BLOCKS])
+            del self.hot[:SEGMENT_BLOCKS]
+            self.archive.save_hot(self.hot)
+        else:
+            self.archive.log_hot(block)
+
+
+class ChainSnapshot(Sequence):
+    """
+    The blocks of a TieredChain at the time the snapshot was taken. Segments are never changed once written, thus the
+    archived blocks are read from archive even after the chain grew or moved blocks to archive.
+    """
+
+    def __init__(self, archive, archived, hot):
+        self.archive = archive
+        self.archived = archived
+        self.hot = hot
+
+    def __len__(self):
+        return self.archived + len(self.hot)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('chain index out of range')
+        if i < self.archived:
+            return self.archive[i]
+        return self.hot[i - self.archived]
+
+    def __iter__(self):
+        for i in range(self.archived):
+            yield self.archive[i]
+        yield from self.hot
@@ -0,0 +1,258 @@
+"""
+Asyncio (ASGI) serving mode of the blockchain node, with the same routes as the Flask app in blockchain.py.
+
+The chain is only changed on the event loop thread. Proof of work and chain validation run on a process pool,
+serializing the chain runs on a thread, and the chains of the peers are fetched concurrently. Thus no request blocks
+the event loop.
+
+Needs uvicorn and httpx. Usage:
+    python blockchain.py --port 6000 --asgi
+"""
+
+import asyncio
+import json
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs
+
+import httpx
+
+from blockchain import Blockchain, blockchain, node_identifier, valid_link, chain_json, app as flask_app
+from metrics import metrics, profiler
+
+# seconds to wait for the chain of a peer
+PEER_TIMEOUT = 10.
+
+cpu_pool = None
+
+
+def find_proof(last_proof):
+    """
+    Proof of work, runs in a worker process
+    :param last_proof: int
+    :return: int
+    """
+    proof = 0
+    while Blockchain.valid_proof(last_proof, proof) is False:
+        proof = proof + 1
+    return proof
+
+
+def check_chain(chain):
+    """
+    Sequential validation of a chain, runs in a worker process
+    :param chain: a blockchain
+    :return: True if valid, False if not
+    """
+    return all(valid_link(chain[i - 1], chain[i]) for i in range(1, len(chain)))
+
+
+async def run_cpu(f, *args):
+    global cpu_pool
+    if cpu_pool is None:
+        cpu_pool = ProcessPoolExecutor()
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool, f, *args)
+
+
+async def mine(request):
+    # the chain may change while the proof is computed, then the proof is computed again on the new last block
+    # blocks read from the archive are new dicts on every access, thus the last block is compared by its hash
+    while True:
+        last_block = blockchain.last_block
+        last_hash = blockchain.hash(last_block)
+        start = time.perf_counter()
+        proof = await run_cpu(find_proof, last_block['proof'])
+        metrics.observe('proof_of_work', time.perf_counter() - start)
+        if blockchain.hash(blockchain.last_block) == last_hash:
+            break
+
+    blockchain.new_transaction(
+        sender = "0",
+        receiver= node_identifier,
+        amount=1,
+    )
+    block = blockchain.new_block(proof, last_hash)
+
+    response = {
+        'message': "new Block forged",
+        'index': block['index'],
+        'transactions': block['transaction'],
+        'proof':block['proof'],
+        'previous_hash':block['previous_hash'],
+    }
+    return response,200
+
+
+async def new_transaction(request):
+    values = await request.json()
+
+    required = ['sender', 'receiver', 'amount' ]
+    if not isinstance(values, dict) or not all(k in values for k in required):
+        return 'Missing values',400
+
+    index = blockchain.new_transaction(values['sender'], values['receiver'], values['amount'])
+
+    response = {'message': f'Transaction will be added to Block {index}'}
+    return response,201
+
+
+async def full_chain(request):
+    # the snapshot is taken on the event loop, it is encoded on another thread while the loop changes the chain
+    return chain_json(blockchain.snapshot()),200
+
+
+async def register_nodes(request):
+    values = await request.json()
+    nodes = values.get('nodes') if values else None
+
+    if nodes is None:
+        return "Error: Please supply a valid list of nodes",400
+
+    for node in nodes:
+        blockchain.register_node(node)
+
+    response = {
+        'message': 'new nodes have been added',
+        'total_nodes': list(blockchain.nodes)
+    }
+    return response,201
+
+
+async def fetch_chain(client, node):
+    try:
+        response = await client.get(f'http://{node}/chain', timeout=PEER_TIMEOUT)
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    return response.json()['chain']
+
+
+async def consensus(request):
+    async with httpx.AsyncClient() as client:
+        chains = await asyncio.gather(*[fetch_chain(client, node) for node in blockchain.nodes])
+
+    # validate the longest chains first, the first valid one longer than ours replaces it
+    replaced = False
+    for chain in sorted((c for c in chains if c is not None), key=len, reverse=True):
+        if len(chain) <= len(blockchain.chain):
+            break
+        start = time.perf_counter()
+        valid = await run_cpu(check_chain, chain)
+        metrics.observe('valid_chain', time.perf_counter() - start)
+        if valid and len(chain) > len(blockchain.chain):
+            blockchain.replace_chain(chain)
+            replaced = True
+            break
+
+    message = 'blockchain was replaced' if replaced else 'chain is authoritative'
+    return chain_json(blockchain.snapshot(), message=message),200
+
+
+async def debug_metrics(request):
+    return metrics.summary(),200
+
+
+async def debug_profile(request):
+    if not flask_app.config['PROFILER_ENABLED']:
+        return "Error: profiler is disabled",403
+
+    if 'token' in request.args:
+        try:
+            stacks = profiler.result(request.args['token'][0])
+        except KeyError:
+            return "Error: unknown profile",404
+        if stacks is None:
+            return "Profile is still running",202
+        return stacks,200
+
+    try:
+        seconds = float(request.args.get('seconds', ['5'])[0])
+    except ValueError:
+        seconds = 5.
+    token = profiler.start(seconds)
+    if token is None:
+        return "Error: a profile is already running",409
+    return {'token': token},202
+
+
+ROUTES = {
+    ('GET', '/mine'): mine,
+    ('POST', '/transactions/new'): new_transaction,
+    ('GET', '/chain'): full_chain,
+    ('POST', '/nodes/register'): register_nodes,
+    ('GET', '/nodes/resolve'): consensus,
+    ('GET', '/debug/metrics'): debug_metrics,
+    ('GET', '/debug/profile'): debug_profile,
+}
+
+
+class Request(object):
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.args = parse_qs(scope.get('query_string', b'').decode())
+
+    async def body(self):
+        chunks = []
+        while True:
+            message = await self.receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def json(self):
+        try:
+            return json.loads(await self.body() or b'null')
+        except ValueError:
+            return None
+
+
+async def send_response(send, result, status):
+    if isinstance(result, types.GeneratorType):
+        # streamed JSON (see chain_json), encoding a long chain and reading its archived blocks is done off the loop
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, next, result, None)
+            if chunk is None:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    if isinstance(result, str):
+        body = result.encode()
+        content_type = b'text/plain'
+    else:
+        body = json.dumps(result).encode()
+        content_type = b'application/json'
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if cpu_pool is not None:
+                    cpu_pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    start = time.perf_counter()
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        await send_response(send, 'Not Found', 404)
+        metrics.observe('route <unmatched>', time.perf_counter() - start)
+        return
+
+    result, status = await handler(Request(scope, receive))
+    await send_response(send, result, status)
+    metrics.observe('route ' + scope['path'], time.perf_counter() - start)
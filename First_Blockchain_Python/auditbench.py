@@ -0,0 +1,61 @@
+"""
+Benchmark of the full chain audit in blockchain.py.
+
+Builds a valid chain without mining: every block uses the same proof p with valid_proof(p, p). Reports the blocks
+checked per second by the sequential valid_chain and by audit_chain with each given number of workers. Parallel
+speedup needs as many idle cpus as workers.
+
+Usage:
+    python auditbench.py --blocks 200000 --workers 2,4
+"""
+
+import time
+from argparse import ArgumentParser
+
+from blockchain import Blockchain, block_hash, AUDIT_SEGMENT_SIZE
+
+
+def make_chain(length, txs):
+    """
+    :param length: number of blocks
+    :param txs: number of transactions per block
+    :return: list - a valid chain
+    """
+    proof = 0
+    while not Blockchain.valid_proof(proof, proof):
+        proof += 1
+
+    chain = [{'index': 1, 'timestamp': 0, 'transactions': [], 'proof': proof, 'previous_hash': 1}]
+    for i in range(2, length + 1):
+        transactions = [{'sender': 'sender%d' % j, 'receiver': 'receiver%d' % i, 'amount': j} for j in range(txs)]
+        chain.append({'index': i, 'timestamp': time.time(), 'transactions': transactions, 'proof': proof,
+                      'previous_hash': block_hash(chain[-1])})
+    return chain
+
+
+def measure(f):
+    """
+    :param f: function auditing the chain
+    :return: float - seconds f took
+    """
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--blocks', default=200000, type=int, help='length of the chain')
+    parser.add_argument('--txs', default=5, type=int, help='transactions per block')
+    parser.add_argument('--workers', default='2,4', help='comma separated numbers of audit workers')
+    parser.add_argument('--segment', default=AUDIT_SEGMENT_SIZE, type=int, help='blocks per audit segment')
+    args = parser.parse_args()
+
+    chain = make_chain(args.blocks, args.txs)
+    blockchain = Blockchain()
+
+    seconds = measure(lambda: blockchain.valid_chain(chain))
+    print('sequential  %8.0f blocks/s' % (len(chain) / seconds))
+    for workers in [int(w) for w in args.workers.split(',')]:
+        seconds = measure(lambda: Blockchain.audit_chain(chain, workers, args.segment))
+        print('%2d workers  %8.0f blocks/s' % (workers, len(chain) / seconds))
@@ -1,17 +1,102 @@
 import hashlib
 import json
+import multiprocessing
+import os
+import requests
+import threading
 from time import time
 from textwrap import dedent
 
 from uuid import uuid4
 from flask import Flask
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 from urllib.parse import urlparse
 
+from metrics import metrics, timed, instrument, profiler
+from archive import TieredChain, open_archive, new_archive, publish_archive, ARCHIVE_DEPTH
+
+# number of blocks checked by one task of a parallel audit
+AUDIT_SEGMENT_SIZE = 10000
+
+# approximate size in bytes of the parts a chain response is streamed in
+CHAIN_CHUNK_BYTES = 64 * 1024
+
+# chain being audited, inherited by forked audit workers (thus only the segment bounds are sent to them)
+_audit_chain = None
+
+
+def block_hash(block):
+    """
+    SHA-256 hash of a block, not timed since it also runs in forked audit workers
+    :param block: dict - block
+    :return: str
+    """
+    block_string = json.dumps(block, sort_keys=True).encode()
+    return hashlib.sha256(block_string).hexdigest()
+
+
+def valid_link(last_block, block):
+    """
+    Check that block follows last_block: its previous_hash and its proof of work are correct
+    :param last_block: dict - previous block
+    :param block: dict - block
+    :return: True if valid, False if not
+    """
+    if block['previous_hash'] != block_hash(last_block):
+        return False
+    return Blockchain.valid_proof(last_block['proof'], block['proof'])
+
+
+def chain_json(chain, **fields):
+    """
+    Encode a response containing the chain a few blocks at a time, thus the archived blocks of a long chain are never
+    all decompressed at once
+    :param chain: snapshot of the chain (see Blockchain.snapshot)
+    :param fields: other fields of the response
+    :return: generator of bytes - the JSON object {fields..., "length": len(chain), "chain": [blocks]}
+    """
+    fields['length'] = len(chain)
+    yield json.dumps(fields)[:-1].encode() + b', "chain": ['
+    parts = []
+    size = 0
+    for i, block in enumerate(chain):
+        part = (', ' if i else '') + json.dumps(block)
+        parts.append(part)
+        size += len(part)
+        if size >= CHAIN_CHUNK_BYTES:
+            yield ''.join(parts).encode()
+            parts = []
+            size = 0
+    yield (''.join(parts) + ']}').encode()
+
+
+def audit_segment(segment):
+    """
+    Check the blocks of one segment of the chain, runs in a worker process
+    :param segment: (start, end, blocks) - blocks is None if the chain was inherited from the parent, else the JSON
+        encoded blocks start - 1 to end - 1
+    :return: height of the first invalid block in the segment, None if all are valid
+    """
+    start, end, blocks = segment
+    if blocks is None:
+        blocks = _audit_chain[start - 1:end]
+    else:
+        blocks = json.loads(blocks)
+
+    for height in range(start, end):
+        if not valid_link(blocks[height - start], blocks[height - start + 1]):
+            return height
+    return None
+
+
 class Blockchain(object):
     def __init__(self):
         self.chain = []
         self.current_transactions = []
+        self.nodes = set()
+        self.archive = None
+        self.archive_path = None
+        self.archive_depth = ARCHIVE_DEPTH
 
         # create the genesis block
         self.new_block(previous_hash = 1, proof=100)
@@ -57,11 +142,50 @@ class Blockchain(object):
         return block
 
 
+    def enable_archive(self, path, depth=ARCHIVE_DEPTH):
+        """
+        Keep blocks more than depth below the tip in compressed archive segments (see archive.py). If the archive
+        already contains the chain of a previous run, it is continued instead of the new genesis block.
+        :param path: directory of the archive
+        :param depth: number of blocks kept uncompressed
+        """
+        self.archive = open_archive(path)
+        self.archive_path = path
+        self.archive_depth = depth
+        chain = TieredChain([], self.archive, depth)
+        if not len(chain):
+            for block in self.chain:
+                chain.append(block)
+        self.chain = chain
+
+    def replace_chain(self, chain):
+        """
+        Replace our chain by chain
+        :param chain: list of blocks
+        """
+        if self.archive is not None:
+            # the current chain may still be read, archive the new one into a new generation
+            archive = new_archive(self.archive_path)
+            chain = TieredChain(chain, archive, self.archive_depth)
+            publish_archive(self.archive_path, archive, old=self.archive)
+            self.archive = archive
+        self.chain = chain
+
+    def snapshot(self):
+        """
+        :return: the blocks of the chain at this moment, unaffected by later changes of the chain (the archived
+            blocks of a TieredChain are read when accessed)
+        """
+        if isinstance(self.chain, TieredChain):
+            return self.chain.snapshot()
+        return list(self.chain)
+
     @property
     def last_block(self):
         return self.chain[-1]
 
     @staticmethod
+    @timed('hash')
     def hash(block):
         """
         creates a SHA-256 hash of a block
@@ -69,10 +193,10 @@ class Blockchain(object):
         :param block: dict - block
         :return: str
         """
-        block_string = json.dump(block, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+        return block_hash(block)
 
 
+    @timed('proof_of_work')
     def proof_of_work(self, last_proof):
         """
         simple proof of work algorithm
@@ -104,29 +228,25 @@ class Blockchain(object):
             raise ValueError('Invalid URL')
 
 
-    def valid_chain(self, chain):
+    @timed('valid_chain')
+    def valid_chain(self, chain, workers=None):
         """
         Consider whether a given chain  is valid
         :param chain: a blockcgain
+        :param workers: if given, audit the chain in parallel on that many processes (see audit_chain)
         :return: True if valid, False if not
         """
+        if workers:
+            return self.audit_chain(chain, workers) is None
+
         last_block = chain[0]
         current_index = 1
 
         while current_index < len(chain):
             block = chain[current_index]
 
-            print(f'{last_block}')
-            print(f'{block}')
-            print("\n ")
-
-            # Check that the hash of the block is correct
-            last_block_hash = self.hash(last_block)
-            if block['previous_hash'] !=last_block_hash:
-                    return False
-
-            #check that the Proof_of_Work is correct
-            if not self.valid_proof(last_block['proof'], block['proof'], last_block_hash):
+            # Check that the hash and the Proof_of_Work of the block are correct
+            if not valid_link(last_block, block):
                 return False
 
             last_block=block
@@ -134,6 +254,49 @@ class Blockchain(object):
 
         return True
 
+    @staticmethod
+    def audit_chain(chain, workers=None, segment_size=AUDIT_SEGMENT_SIZE):
+        """
+        Check the whole chain in parallel. Every block only depends on the block before it, thus the chain is split
+        into segments which overlap by one block and are checked on a pool of worker processes.
+        A chain of a single segment or a single worker is checked in this process, starting a pool would cost more
+        than the check. Where fork is available and this process runs no other thread the workers inherit the chain,
+        otherwise (e.g in the threaded Flask server, where a forked child could inherit a lock held by another thread)
+        the workers are started by a fork server or spawned and each segment is sent as one JSON string instead of
+        pickling every block.
+        :param chain: a blockchain
+        :param workers: number of worker processes, default is the number of cpus
+        :param segment_size: number of blocks per segment
+        :return: height (position in chain) of the first invalid block, None if the chain is valid
+        """
+        global _audit_chain
+
+        workers = workers or os.cpu_count() or 1
+        bounds = [(start, min(start + segment_size, len(chain))) for start in range(1, len(chain), segment_size)]
+        if len(bounds) <= 1 or workers == 1:
+            for height in range(1, len(chain)):
+                if not valid_link(chain[height - 1], chain[height]):
+                    return height
+            return None
+
+        methods = multiprocessing.get_all_start_methods()
+        if 'fork' in methods and threading.active_count() == 1:
+            context = multiprocessing.get_context('fork')
+            _audit_chain = chain
+            segments = [(start, end, None) for start, end in bounds]
+        else:
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            segments = ((start, end, json.dumps(chain[start - 1:end])) for start, end in bounds)
+
+        try:
+            with context.Pool(workers) as pool:
+                # results come in chain order, the first invalid segment contains the first invalid block
+                for height in pool.imap(audit_segment, segments):
+                    if height is not None:
+                        return height
+        finally:
+            _audit_chain = None
+        return None
 
     def resolve_conflicts(self):
         """
@@ -149,7 +312,7 @@ class Blockchain(object):
 
         #grab and verify the chains from all the nodes in our network
         for node in neighbors:
-            response = request.get(f'htt[://{node}/chain')
+            response = requests.get(f'http://{node}/chain')
             if response.status_code ==200:
                 length = response.json()['length']
                 chain = response.json()['chain']
@@ -161,7 +324,7 @@ class Blockchain(object):
 
         # Replace our chain if we discover a new, valid chain longer than ours
         if new_chain:
-            self.chain = new_chain
+            self.replace_chain(new_chain)
             return True
 
         return False
@@ -187,6 +350,10 @@ class Blockchain(object):
 
 # Instantiate the node
 app = Flask(__name__)
+instrument(app)
+
+# the profiler stops all threads for a moment per sample, thus it has to be enabled explicitly
+app.config['PROFILER_ENABLED'] = os.environ.get('BLOCKCHAIN_PROFILER') == '1'
 
 #Genrate a gloobal unique address for the node
 node_identifier = str(uuid4()).replace('-','')
@@ -194,6 +361,9 @@ node_identifier = str(uuid4()).replace('-','')
 # Instantiate the blockchain
 
 blockchain = Blockchain()
+if os.environ.get('BLOCKCHAIN_ARCHIVE'):
+    blockchain.enable_archive(os.environ['BLOCKCHAIN_ARCHIVE'],
+                              int(os.environ.get('BLOCKCHAIN_ARCHIVE_DEPTH', ARCHIVE_DEPTH)))
 
 @app.route('/mine', methods = ['GET'])
 
@@ -206,7 +376,7 @@ blockchain = Blockchain()
 def mine():
     # Run the PoW to get the next Proof
     last_block = blockchain.last_block
-    proof = blockchain.proof_of_work(last_block)
+    proof = blockchain.proof_of_work(last_block['proof'])
 
     #we must receive a reward for fiding the proof
     #the sender is '0' to signify that this node has mined a new coin
@@ -218,7 +388,7 @@ def mine():
 
 
     # Forge the new block by adding to the chain
-    previous_hash = blockchain.blockchain.hash(last_block)
+    previous_hash = blockchain.hash(last_block)
     block = blockchain.new_block(proof, previous_hash)
 
     response = {
@@ -237,7 +407,7 @@ def new_transaction():
 
     #Check that the required fields are in the Post data
     required = ['sender', 'receiver', 'amount' ]
-    if not all(k in values for k in required):
+    if not isinstance(values, dict) or not all(k in values for k in required):
         return 'Missing values',400
 
     # Create a new transaction
@@ -249,11 +419,7 @@ def new_transaction():
 
 @app.route('/chain', methods= ['GET'])
 def full_chain():
-    respone = {
-        'chain': blockchain.chain,
-        'length':len(blockchain.chain)
-    }
-    return jsonify(respone),200
+    return Response(stream_with_context(chain_json(blockchain.snapshot())), 200, mimetype='application/json')
 
 @app.route('/nodes/register', methods = ['POST'])
 def register_nodes():
@@ -275,19 +441,37 @@ def register_nodes():
 @app.route('/nodes/resolve', methods = ['GET'])
 def consensus():
     replaced = blockchain.resolve_conflicts()
+    message = 'blockchain was replaced' if replaced else 'chain is authoritative'
 
-    if replaced:
-        response = {
-            'message': 'blockchain was replaced',
-            'chain': blockchain.chain
-        }
-    else:
-        response = {
-            'message': 'chain is authoritative',
-            'chain': blockchain.chain
-        }
+    return Response(stream_with_context(chain_json(blockchain.snapshot(), message=message)), 200,
+                    mimetype='application/json')
 
-    return jsonify(response),200
+@app.route('/debug/metrics', methods = ['GET'])
+def debug_metrics():
+    return jsonify(metrics.summary()),200
+
+@app.route('/debug/profile', methods = ['GET'])
+def debug_profile():
+    if not app.config['PROFILER_ENABLED']:
+        return "Error: profiler is disabled",403
+
+    # a profile runs in the background, its stacks are fetched with the returned token
+    token = request.args.get('token')
+    if token is not None:
+        try:
+            stacks = profiler.result(token)
+        except KeyError:
+            return "Error: unknown profile",404
+        if stacks is None:
+            return "Profile is still running",202
+        return stacks,200,{'Content-Type': 'text/plain'}
+
+    seconds = request.args.get('seconds', default=5., type=float)
+    token = profiler.start(seconds)
+    if token is None:
+        return "Error: a profile is already running",409
+
+    return jsonify({'token': token}),202
 
 
 if __name__ == '__main__':
@@ -295,10 +479,27 @@ if __name__ == '__main__':
 
     parser = ArgumentParser()
     parser.add_argument('-p', '--port', default = 6000, type=int, help='port listen on')
+    parser.add_argument('--profiler', action='store_true', help='enable /debug/profile')
+    parser.add_argument('--asgi', action='store_true', help='serve with the asyncio app in asgi.py (needs uvicorn)')
+    parser.add_argument('--archive', help='directory of the compressed archive of old blocks')
+    parser.add_argument('--archive-depth', default=ARCHIVE_DEPTH, type=int, help='blocks kept uncompressed')
     args = parser.parse_args()
     port = args.port
-
-    app.run(host='127.0.0.1', port=port)
+    if args.profiler:
+        app.config['PROFILER_ENABLED'] = True
+        os.environ['BLOCKCHAIN_PROFILER'] = '1'
+    if args.archive:
+        blockchain.enable_archive(args.archive, args.archive_depth)
+        os.environ['BLOCKCHAIN_ARCHIVE'] = args.archive
+        os.environ['BLOCKCHAIN_ARCHIVE_DEPTH'] = str(args.archive_depth)
+
+    if args.asgi:
+        import uvicorn
+
+        # asgi imports this file as the blockchain module, which holds the state of the node from now on
+        uvicorn.run('asgi:app', host='127.0.0.1', port=port, log_level='warning')
+    else:
+        app.run(host='127.0.0.1', port=port)
 
 
 
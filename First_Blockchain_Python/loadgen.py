@@ -0,0 +1,283 @@
+"""
+Load generator for the blockchain node in blockchain.py.
+
+Starts several local nodes on consecutive ports, registers them with each other through /nodes/register and then
+floods /transactions/new at a fixed rate while other clients call /mine, /chain and /nodes/resolve. Reports the
+p50/p99 latency per endpoint, the transactions committed per second and the memory of the nodes over time.
+
+With --server both, the same load is run against the Flask server and the asyncio (ASGI) server, one after the other.
+
+Usage:
+    python loadgen.py --nodes 3 --duration 30 --rate 200
+    python loadgen.py --server both
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+NODE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blockchain.py')
+
+
+def percentile(values, p):
+    """
+    :param values: sorted list of numbers
+    :param p: percentile between 0 and 100
+    :return: the p-th percentile of values (0 if empty)
+    """
+    if not values:
+        return 0.
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def rss(pid):
+    """
+    :param pid: process id
+    :return: resident memory of the process in bytes, None if it cannot be read
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+class Stats(object):
+    """Latencies and error counts per endpoint, shared by all client threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, latency, ok):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(endpoint, []).append(latency)
+            else:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self):
+        rows = []
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies.get(endpoint, []))
+            rows.append({
+                'endpoint': endpoint,
+                'count': len(values),
+                'errors': self.errors.get(endpoint, 0),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+            })
+        return rows
+
+
+def call(url, stats, endpoint, body=None, scheduled=None, timeout=30):
+    """
+    Send one request and record its latency. The latency of a request sent at a fixed rate is measured from the time it
+    was scheduled, thus a slow server is not hidden by the client falling behind.
+    :return: decoded JSON response, None on error
+    """
+    start = scheduled or time.perf_counter()
+    data = None
+    headers = {}
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers['Content-Type'] = 'application/json'
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data, headers), timeout=timeout) as response:
+            result = json.loads(response.read().decode())
+        stats.record(endpoint, time.perf_counter() - start, True)
+        return result
+    except (urllib.error.URLError, OSError, ValueError):
+        stats.record(endpoint, time.perf_counter() - start, False)
+        return None
+
+
+def start_nodes(count, base_port, server='flask'):
+    processes = []
+    for i in range(count):
+        command = [sys.executable, NODE_SCRIPT, '--port', str(base_port + i)]
+        if server == 'asgi':
+            command.append('--asgi')
+        processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    urls = [f'http://127.0.0.1:{base_port + i}' for i in range(count)]
+
+    # wait until every node answers
+    deadline = time.time() + 30
+    for url in urls:
+        while True:
+            try:
+                urllib.request.urlopen(url + '/chain', timeout=1).close()
+                break
+            except (urllib.error.URLError, OSError):
+                if time.time() > deadline:
+                    stop_nodes(processes)
+                    raise RuntimeError(f'node {url} did not start')
+                time.sleep(0.1)
+    return processes, urls
+
+
+def stop_nodes(processes):
+    for p in processes:
+        p.terminate()
+    for p in processes:
+        p.wait()
+
+
+def register_nodes(urls, stats):
+    for url in urls:
+        peers = [peer for peer in urls if peer != url]
+        call(url + '/nodes/register', stats, '/nodes/register', {'nodes': peers})
+
+
+def every(interval, stop, f):
+    """Call f every interval seconds until stop is set."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        f()
+        stop.wait(max(0., interval - (time.perf_counter() - start)))
+
+
+def flood_transactions(urls, rate, stop, stats, pool):
+    """Send rate transactions per second (round robin over the nodes) at fixed times until stop is set."""
+    interval = 1. / rate
+    next_time = time.perf_counter()
+    i = 0
+    while not stop.is_set():
+        now = time.perf_counter()
+        if now < next_time:
+            time.sleep(next_time - now)
+            continue
+        url = urls[i % len(urls)]
+        body = {'sender': f'client-{i % 100}', 'receiver': f'client-{(i + 1) % 100}', 'amount': 1}
+        pool.submit(call, url + '/transactions/new', stats, '/transactions/new', body, next_time)
+        i += 1
+        next_time += interval
+    return i
+
+
+def committed_transactions(urls, stats):
+    """
+    :return: number of client transactions (not mining rewards) in the longest chain of all nodes
+    """
+    best = 0
+    for url in urls:
+        result = call(url + '/chain', stats, '/chain')
+        if result is None:
+            continue
+        count = sum(1 for block in result['chain'] for txn in block['transaction'] if txn['sender'] != '0')
+        best = max(best, count)
+    return best
+
+
+def run(args, server='flask'):
+    stats = Stats()
+    processes, urls = start_nodes(args.nodes, args.base_port, server)
+    memory = []
+    try:
+        register_nodes(urls, stats)
+
+        stop = threading.Event()
+        threads = []
+        for i in range(args.miners):
+            url = urls[i % len(urls)]
+            threads.append(threading.Thread(target=every, args=(args.mine_interval, stop, lambda url=url: call(
+                url + '/mine', stats, '/mine'))))
+        for i in range(args.readers):
+            url = urls[i % len(urls)]
+            threads.append(threading.Thread(target=every, args=(args.chain_interval, stop, lambda url=url: call(
+                url + '/chain', stats, '/chain'))))
+        for i in range(args.resolvers):
+            url = urls[i % len(urls)]
+            threads.append(threading.Thread(target=every, args=(args.resolve_interval, stop, lambda url=url: call(
+                url + '/nodes/resolve', stats, '/nodes/resolve'))))
+
+        start = time.time()
+
+        def sample_memory():
+            values = [rss(p.pid) for p in processes]
+            if None not in values:
+                memory.append((time.time() - start, sum(values)))
+
+        threads.append(threading.Thread(target=every, args=(1., stop, sample_memory)))
+
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            for t in threads:
+                t.start()
+            timer = threading.Timer(args.duration, stop.set)
+            timer.start()
+            sent = flood_transactions(urls, args.rate, stop, stats, pool)
+            for t in threads:
+                t.join()
+        elapsed = time.time() - start
+
+        # mine the remaining transactions, then count what made it into a chain
+        for url in urls:
+            call(url + '/mine', stats, '/mine')
+        committed = committed_transactions(urls, stats)
+    finally:
+        stop_nodes(processes)
+
+    return {
+        'server': server,
+        'nodes': args.nodes,
+        'duration': elapsed,
+        'sent': sent,
+        'committed': committed,
+        'committed_per_second': committed / elapsed,
+        'endpoints': stats.report(),
+        'memory': [{'t': round(t, 1), 'rss_mb': value / 2 ** 20} for t, value in memory],
+    }
+
+
+def print_report(result):
+    print(f"server={result['server']} nodes={result['nodes']} duration={result['duration']:.1f}s sent={result['sent']} "
+          f"committed={result['committed']} ({result['committed_per_second']:.1f} txns/s)")
+    print(f"{'endpoint':<20}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in result['endpoints']:
+        print(f"{row['endpoint']:<20}{row['count']:>8}{row['errors']:>8}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    if result['memory']:
+        print('memory of all nodes over time:')
+        for sample in result['memory']:
+            print(f"  t={sample['t']:>6.1f}s rss={sample['rss_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--nodes', default=3, type=int, help='number of nodes')
+    parser.add_argument('--base-port', default=6000, type=int, help='port of the first node')
+    parser.add_argument('--duration', default=30., type=float, help='seconds of load')
+    parser.add_argument('--rate', default=200., type=float, help='transactions per second')
+    parser.add_argument('--concurrency', default=64, type=int, help='maximal transactions in flight')
+    parser.add_argument('--miners', default=1, type=int, help='clients calling /mine')
+    parser.add_argument('--mine-interval', default=1., type=float, help='seconds between two /mine calls')
+    parser.add_argument('--readers', default=1, type=int, help='clients calling /chain')
+    parser.add_argument('--chain-interval', default=0.5, type=float, help='seconds between two /chain calls')
+    parser.add_argument('--resolvers', default=1, type=int, help='clients calling /nodes/resolve')
+    parser.add_argument('--resolve-interval', default=2., type=float, help='seconds between two /nodes/resolve calls')
+    parser.add_argument('--server', default='flask', choices=['flask', 'asgi', 'both'], help='server of the nodes')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    results = []
+    for server in (['flask', 'asgi'] if args.server == 'both' else [args.server]):
+        results.append(run(args, server))
+        print_report(results[-1])
+        print()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results if len(results) > 1 else results[0], f, indent=2)
@@ -0,0 +1,191 @@
+"""
+Instrumentation of the blockchain node: latency histograms of routes and functions and a sampling profiler.
+
+All histograms live in the module level `metrics` registry, which is safe to use from the threads of the server.
+"""
+
+import functools
+import math
+import sys
+import threading
+import time
+from collections import Counter
+from uuid import uuid4
+
+# growth factor of the histogram buckets: a quantile is reported at most 10% above the true value
+BUCKET_GROWTH = 1.1
+
+# upper bound of the first histogram bucket in seconds, shorter durations are counted in it
+MIN_BUCKET = 1e-6
+
+# time between two samples of the profiler in seconds
+PROFILE_INTERVAL = 0.005
+
+# longest allowed profile in seconds
+MAX_PROFILE_SECONDS = 60
+
+
+class Histogram(object):
+    """
+    Histogram with logarithmic buckets: bucket i counts the durations up to MIN_BUCKET * BUCKET_GROWTH ** i. Only
+    buckets that were used are stored, thus there is no largest bucket and the relative error of a quantile is the
+    same for every duration.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        index = 0 if value <= MIN_BUCKET else math.ceil(math.log(value / MIN_BUCKET, BUCKET_GROWTH))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        :param q: quantile between 0 and 1
+        :return: upper bound of the bucket containing the quantile, 0 if nothing was observed
+        """
+        rank = q * self.count
+        cumulative = 0
+        for index in sorted(self.counts):
+            cumulative += self.counts[index]
+            if cumulative >= rank:
+                return MIN_BUCKET * BUCKET_GROWTH ** index
+        return 0.
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum_seconds': self.sum,
+            'mean_seconds': self.sum / self.count if self.count else 0.,
+            'p50_seconds': self.quantile(0.5),
+            'p99_seconds': self.quantile(0.99),
+        }
+
+
+class Metrics(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[name] = histogram
+            histogram.observe(value)
+
+    def summary(self):
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+
+metrics = Metrics()
+
+
+def timed(name):
+    """
+    Decorator observing the duration of every call of the decorated function in the histogram name
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def instrument(app):
+    """
+    Observe the duration of every request of the Flask app per route (e.g 'route /mine'). Requests which do not match
+    a route are observed as 'route <unmatched>'.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.teardown_request
+    def stop_timer(exception=None):
+        start = g.pop('request_start', None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+            metrics.observe('route ' + rule, time.perf_counter() - start)
+
+
+class Profiler(object):
+    """
+    Sampling profiler: a thread samples the stacks of all other threads every PROFILE_INTERVAL seconds. Only one
+    profile is taken at a time, the node is not slowed down while no profile is taken. A profile runs in the
+    background, its stacks are fetched with the token returned by start. Only the last profile is kept.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token = None
+        self.stacks = None
+
+    def start(self, seconds):
+        """
+        Start a profile of seconds on a new thread
+        :param seconds: duration, at most MAX_PROFILE_SECONDS
+        :return: str - token of the profile (see result), None if a profile is already running
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        self.token = uuid4().hex
+        self.stacks = None
+        seconds = min(max(seconds, 0.), MAX_PROFILE_SECONDS)
+        threading.Thread(target=self.run, args=(seconds,), name='profiler', daemon=True).start()
+        return self.token
+
+    def run(self, seconds):
+        try:
+            self.stacks = self.sample(seconds)
+        finally:
+            self.lock.release()
+
+    def result(self, token):
+        """
+        :param token: token returned by start
+        :return: collapsed stacks of the profile ('outer;...;inner count' per line, most frequent first), None if it
+            is still running
+        :raises KeyError: token is not the one of the last profile
+        """
+        if token != self.token:
+            raise KeyError(token)
+        return self.stacks
+
+    @staticmethod
+    def sample(seconds):
+        """
+        Sample the stacks of all threads except the calling one for seconds
+        :return: collapsed stacks
+        """
+        caller = threading.get_ident()
+        stacks = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == caller:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_filename}:{code.co_name}:{frame.f_lineno}')
+                    frame = frame.f_back
+                stacks[';'.join(reversed(stack))] += 1
+            time.sleep(PROFILE_INTERVAL)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+profiler = Profiler()
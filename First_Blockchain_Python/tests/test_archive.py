@@ -0,0 +1,109 @@
+"""
+Tests of the compressed archive tier (archive.py). Run from First_Blockchain_Python:
+    python -m pytest tests
+"""
+
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from archive import TieredChain, open_archive
+from blockchain import Blockchain
+
+
+def make_blocks(count):
+    return [{'index': i + 1, 'transaction': [{'sender': f's{i}', 'receiver': 'r', 'amount': i}], 'proof': i,
+             'previous_hash': f'{i:064x}'} for i in range(count)]
+
+
+class TestTieredChain(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+
+    def test_restart_round_trip(self):
+        blocks = make_blocks(2500)
+        chain = TieredChain(blocks, open_archive(self.root), depth=1000)
+        self.assertEqual(len(chain.archive), 1000)
+
+        reopened = TieredChain([], open_archive(self.root), depth=1000)
+        self.assertEqual(len(reopened), 2500)
+        self.assertEqual(list(reopened), blocks)
+
+        # appending after the restart continues the persisted chain, also across a new segment
+        more = make_blocks(3100)[2500:]
+        for block in more:
+            reopened.append(block)
+        self.assertEqual(list(TieredChain([], open_archive(self.root), depth=1000)), blocks + more)
+
+    def test_torn_hot_line_is_ignored(self):
+        blocks = make_blocks(20)
+        TieredChain(blocks, open_archive(self.root), depth=1000)
+        archive = open_archive(self.root)
+        with open(archive.path + '/hot', 'ab') as f:
+            f.write(b'{"index": 21, "pro')
+        self.assertEqual(list(TieredChain([], archive, depth=1000)), blocks)
+
+    def test_indexing_and_slices(self):
+        blocks = make_blocks(2100)
+        chain = TieredChain(blocks, open_archive(self.root), depth=50)
+        self.assertEqual(chain[0], blocks[0])
+        self.assertEqual(chain[-1], blocks[-1])
+        self.assertEqual(chain[990:1010], blocks[990:1010])
+        with self.assertRaises(IndexError):
+            chain[2100]
+
+    def test_snapshot_does_not_change(self):
+        blocks = make_blocks(1500)
+        chain = TieredChain(blocks, open_archive(self.root), depth=100)
+        snapshot = chain.snapshot()
+        for block in make_blocks(2600)[1500:]:
+            chain.append(block)
+        self.assertEqual(list(snapshot), blocks)
+
+
+class TestBlockchainArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        patcher = mock.patch('archive.SEGMENT_BLOCKS', 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_restart_keeps_tip(self):
+        blockchain = Blockchain()
+        blockchain.enable_archive(self.root, depth=5)
+        for proof in range(40):
+            blockchain.new_block(proof)
+        chain = list(blockchain.chain)
+
+        restarted = Blockchain()
+        restarted.enable_archive(self.root, depth=5)
+        self.assertEqual(list(restarted.chain), chain)
+        block = restarted.new_block(100)
+        self.assertEqual(block['index'], len(chain) + 1)
+        self.assertEqual(block['previous_hash'], Blockchain.hash(chain[-1]))
+
+    def test_replace_chain_new_generation(self):
+        blockchain = Blockchain()
+        blockchain.enable_archive(self.root, depth=5)
+        old_chain = blockchain.chain
+        old_path = blockchain.archive.path
+
+        replacement = make_blocks(60)
+        blockchain.replace_chain(replacement)
+        self.assertNotEqual(blockchain.archive.path, old_path)
+        # the old chain can still be read until it is dropped
+        self.assertEqual(len(old_chain), 1)
+        self.assertEqual(list(blockchain.chain), replacement)
+
+        restarted = Blockchain()
+        restarted.enable_archive(self.root, depth=5)
+        self.assertEqual(list(restarted.chain), replacement)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Tests of the asyncio (ASGI) app in asgi.py, requests are sent to the app directly without a server.
+"""
+
+import asyncio
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import asgi
+from blockchain import blockchain, app as flask_app
+from metrics import profiler
+from test_metrics import wait_for_profile
+
+
+def call(method, path, body=None, query=''):
+    """
+    Send one request to asgi.app
+    :return: (status, decoded JSON body or text)
+    """
+    messages = []
+    data = b'' if body is None else body.encode()
+
+    async def receive():
+        return {'type': 'http.request', 'body': data, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode()}
+    asyncio.run(asgi.app(scope, receive, send))
+    status = messages[0]['status']
+    content = b''.join(message['body'] for message in messages[1:])
+    headers = dict(messages[0]['headers'])
+    if headers[b'content-type'] == b'application/json':
+        return status, json.loads(content)
+    return status, content.decode()
+
+
+class TestAsgi(unittest.TestCase):
+
+    def setUp(self):
+        state = (blockchain.chain, blockchain.archive, blockchain.archive_path, blockchain.archive_depth,
+                 blockchain.current_transactions)
+
+        def restore():
+            (blockchain.chain, blockchain.archive, blockchain.archive_path, blockchain.archive_depth,
+             blockchain.current_transactions) = state
+        self.addCleanup(restore)
+
+    @classmethod
+    def tearDownClass(cls):
+        if asgi.cpu_pool is not None:
+            asgi.cpu_pool.shutdown()
+            asgi.cpu_pool = None
+
+    def test_mine_with_archived_tip(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        # with depth 0 the tip is read from the archive as a new dict on every access
+        with mock.patch('archive.SEGMENT_BLOCKS', 1):
+            blockchain.enable_archive(root, depth=0)
+        self.assertIsNot(blockchain.last_block, blockchain.last_block)
+
+        length = len(blockchain.chain)
+        status, response = call('GET', '/mine')
+        self.assertEqual(status, 200)
+        self.assertEqual(response['index'], length + 1)
+        self.assertEqual(len(blockchain.chain), length + 1)
+
+    def test_chain(self):
+        status, response = call('GET', '/chain')
+        self.assertEqual(status, 200)
+        self.assertEqual(response['length'], len(response['chain']))
+        self.assertEqual(response['chain'], list(blockchain.chain))
+
+    def test_new_transaction(self):
+        status, response = call('POST', '/transactions/new', json.dumps({'sender': 'a', 'receiver': 'b', 'amount': 1}))
+        self.assertEqual(status, 201)
+        self.assertEqual(call('POST', '/transactions/new', json.dumps({'sender': 'a'}))[0], 400)
+        for body in ['["sender", "receiver", "amount"]', '"sender receiver amount"', '5', 'not json', '']:
+            self.assertEqual(call('POST', '/transactions/new', body)[0], 400, body)
+
+    def test_profile_in_background(self):
+        with mock.patch.dict(flask_app.config, {'PROFILER_ENABLED': True}):
+            status, response = call('GET', '/debug/profile', query='seconds=0.05')
+            self.assertEqual(status, 202)
+            token = response['token']
+            self.assertEqual(call('GET', '/debug/profile', query='seconds=0.05')[0], 409)
+
+            wait_for_profile(profiler, token)
+            status, stacks = call('GET', '/debug/profile', query='token=' + token)
+            self.assertEqual(status, 200)
+            self.assertIsInstance(stacks, str)
+            self.assertEqual(call('GET', '/debug/profile', query='token=unknown')[0], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
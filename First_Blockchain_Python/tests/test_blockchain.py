@@ -0,0 +1,180 @@
+"""
+Tests of the blockchain node in blockchain.py (the Flask app is called through its test client).
+"""
+
+import json
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import blockchain as node
+from blockchain import Blockchain, app, blockchain
+from test_metrics import wait_for_profile
+
+
+class TestChainRoutes(unittest.TestCase):
+
+    def setUp(self):
+        state = (blockchain.chain, blockchain.archive, blockchain.archive_path, blockchain.archive_depth)
+
+        def restore():
+            blockchain.chain, blockchain.archive, blockchain.archive_path, blockchain.archive_depth = state
+        self.addCleanup(restore)
+        self.client = app.test_client()
+
+    def test_chain_streamed_in_parts(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        with mock.patch('archive.SEGMENT_BLOCKS', 10):
+            blockchain.enable_archive(root, depth=5)
+            for proof in range(50):
+                blockchain.new_block(proof)
+        self.assertGreater(len(blockchain.archive), 0)
+
+        with mock.patch('blockchain.CHAIN_CHUNK_BYTES', 512):
+            parts = list(node.chain_json(blockchain.snapshot()))
+            response = self.client.get('/chain')
+        self.assertGreater(len(parts), 2)
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEqual(result['length'], len(blockchain.chain))
+        self.assertEqual(result['chain'], list(blockchain.chain))
+
+    def test_chain_json_empty_and_fields(self):
+        result = json.loads(b''.join(node.chain_json([], message='hi')))
+        self.assertEqual(result, {'message': 'hi', 'length': 0, 'chain': []})
+
+    def test_snapshot_unaffected_by_new_blocks(self):
+        snapshot = blockchain.snapshot()
+        length = len(snapshot)
+        blockchain.new_block(1)
+        self.assertEqual(len(snapshot), length)
+        blockchain.chain.pop()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+def fixed_point_proof():
+    """
+    :return: int - a proof p with valid_proof(p, p), every block of a chain can use it and no mining is needed
+    """
+    proof = 0
+    while not Blockchain.valid_proof(proof, proof):
+        proof += 1
+    return proof
+
+
+FIXED_PROOF = fixed_point_proof()
+
+
+def make_chain(length):
+    """
+    :param length: number of blocks
+    :return: list - a valid chain of length blocks with one transaction each
+    """
+    chain = [{'index': 1, 'timestamp': 0, 'transactions': [], 'proof': FIXED_PROOF, 'previous_hash': 1}]
+    for i in range(2, length + 1):
+        chain.append({'index': i, 'timestamp': i, 'proof': FIXED_PROOF, 'previous_hash': node.block_hash(chain[-1]),
+                      'transactions': [{'sender': 'a', 'receiver': 'b', 'amount': i}]})
+    return chain
+
+
+class TestNewTransaction(unittest.TestCase):
+
+    def setUp(self):
+        transactions = blockchain.current_transactions
+
+        def restore():
+            blockchain.current_transactions = transactions
+        self.addCleanup(restore)
+        blockchain.current_transactions = []
+        self.client = app.test_client()
+
+    def test_new_transaction(self):
+        response = self.client.post('/transactions/new', json={'sender': 'a', 'receiver': 'b', 'amount': 1})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(blockchain.current_transactions), 1)
+
+    def test_body_not_an_object(self):
+        for body in [['sender', 'receiver', 'amount'], 'sender receiver amount', 5, {'sender': 'a'}]:
+            self.assertEqual(self.client.post('/transactions/new', json=body).status_code, 400, body)
+        self.assertEqual(blockchain.current_transactions, [])
+
+
+class TestProfileRoute(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(app.config, {'PROFILER_ENABLED': True})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def test_profile_in_background(self):
+        response = self.client.get('/debug/profile?seconds=0.05')
+        self.assertEqual(response.status_code, 202)
+        token = response.get_json()['token']
+        self.assertEqual(self.client.get('/debug/profile?seconds=0.05').status_code, 409)
+
+        wait_for_profile(node.profiler, token)
+        response = self.client.get('/debug/profile?token=' + token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+        self.assertEqual(self.client.get('/debug/profile?token=unknown').status_code, 404)
+
+    def test_disabled(self):
+        app.config['PROFILER_ENABLED'] = False
+        self.assertEqual(self.client.get('/debug/profile').status_code, 403)
+
+
+class TestAuditChain(unittest.TestCase):
+
+    def setUp(self):
+        self.chain = make_chain(12)
+
+    def audit(self, chain):
+        return Blockchain.audit_chain(chain, workers=2, segment_size=3)
+
+    def test_valid_chain(self):
+        self.assertIsNone(self.audit(self.chain))
+        self.assertTrue(blockchain.valid_chain(self.chain))
+        self.assertTrue(blockchain.valid_chain(self.chain, workers=2))
+
+    def test_tampered_transaction(self):
+        self.chain[4]['transactions'][0]['amount'] = 1000
+        # the block after the tampered one does not link to it anymore
+        self.assertEqual(self.audit(self.chain), 5)
+        self.assertFalse(blockchain.valid_chain(self.chain))
+        self.assertFalse(blockchain.valid_chain(self.chain, workers=2))
+
+    def test_tampered_proof(self):
+        proof = next(p for p in range(10) if not Blockchain.valid_proof(FIXED_PROOF, p))
+        self.chain[8]['proof'] = proof
+        self.assertEqual(self.audit(self.chain), 8)
+        self.assertFalse(blockchain.valid_chain(self.chain))
+
+    def test_first_invalid_of_several(self):
+        self.chain[10]['previous_hash'] = 'x'
+        self.chain[3]['previous_hash'] = 'x'
+        self.assertEqual(self.audit(self.chain), 3)
+
+    def test_short_chain_checked_without_pool(self):
+        with mock.patch('multiprocessing.get_context', side_effect=AssertionError('pool started')):
+            self.assertIsNone(Blockchain.audit_chain(self.chain[:1], workers=2))
+            self.assertIsNone(Blockchain.audit_chain(self.chain, workers=2))
+            self.assertIsNone(Blockchain.audit_chain(self.chain, workers=1, segment_size=3))
+            self.chain[6]['previous_hash'] = 'x'
+            self.assertEqual(Blockchain.audit_chain(self.chain, workers=2), 6)
+
+    def test_no_fork_from_threads(self):
+        results = []
+        with mock.patch('multiprocessing.get_context', wraps=multiprocessing.get_context) as get_context:
+            thread = threading.Thread(target=lambda: results.append(self.audit(self.chain)))
+            thread.start()
+            thread.join()
+        self.assertEqual(results, [None])
+        self.assertNotIn(mock.call('fork'), get_context.call_args_list)
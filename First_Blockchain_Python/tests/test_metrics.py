@@ -0,0 +1,81 @@
+"""
+Tests of the latency histograms and the sampling profiler in metrics.py.
+"""
+
+import time
+import unittest
+
+from metrics import Histogram, Metrics, Profiler, BUCKET_GROWTH
+
+
+def wait_for_profile(profiler, token, timeout=10.):
+    """
+    :return: collapsed stacks of the profile with token once it finished
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        stacks = profiler.result(token)
+        if stacks is not None:
+            return stacks
+        time.sleep(0.01)
+    raise AssertionError('profile did not finish')
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantile_error_bounded(self):
+        histogram = Histogram()
+        values = [0.00001 * 1.7 ** i for i in range(30)]
+        for value in values:
+            histogram.observe(value)
+        for q in [0.1, 0.5, 0.9, 0.99]:
+            true_value = values[max(0, int(q * len(values) + 0.5) - 1)]
+            estimate = histogram.quantile(q)
+            self.assertGreaterEqual(estimate, true_value * 0.999999, q)
+            self.assertLessEqual(estimate, true_value * BUCKET_GROWTH, q)
+
+    def test_empty_and_tiny(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.quantile(0.5), 0.)
+        histogram.observe(0.)
+        self.assertEqual(len(histogram.counts), 1)
+        self.assertEqual(histogram.summary()['count'], 1)
+
+    def test_no_largest_bucket(self):
+        histogram = Histogram()
+        histogram.observe(100.)
+        histogram.observe(1000.)
+        self.assertGreaterEqual(histogram.quantile(0.99), 1000.)
+        self.assertLessEqual(histogram.quantile(0.99), 1000. * BUCKET_GROWTH)
+
+    def test_metrics_summary(self):
+        metrics = Metrics()
+        metrics.observe('route /chain', 0.002)
+        metrics.observe('route /chain', 0.004)
+        metrics.observe('route /mine', 1.)
+        summary = metrics.summary()
+        self.assertEqual(list(summary), ['route /chain', 'route /mine'])
+        self.assertEqual(summary['route /chain']['count'], 2)
+        self.assertAlmostEqual(summary['route /chain']['mean_seconds'], 0.003)
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_profile_in_background(self):
+        profiler = Profiler()
+        token = profiler.start(0.05)
+        self.assertIsNotNone(token)
+        # only one profile at a time
+        self.assertIsNone(profiler.start(0.05))
+        self.assertIsInstance(wait_for_profile(profiler, token), str)
+        self.assertRaises(KeyError, profiler.result, 'unknown')
+
+        # the stacks of the previous profile are forgotten when the next one starts
+        next_token = profiler.start(0.)
+        self.assertIsNotNone(next_token)
+        self.assertRaises(KeyError, profiler.result, token)
+        wait_for_profile(profiler, next_token)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,52 @@
+import glob
 import hashlib as hasher
-from datetime import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from flask import Flask
 from flask import request
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Canonical block header: index, timestamp (microseconds since the epoch, UTC), sha256 of the data, previous hash.
+# The hash of a block is the sha256 of its header, thus it does not depend on locale or datetime formatting.
+HEADER = struct.Struct('>Qq32s32s')
+
+# On-disk record of a block: data offset and length (into the data file), header and hash.
+RECORD = struct.Struct('>QI80s32s')
+
+CHAIN_FILE = os.environ.get('CHAIN_FILE', 'chain')
+
+# number of blocks whose hashes and links are verified at startup
+VERIFY_TAIL = 16
+
+# a block is sealed once it has MAX_BLOCK_TXNS transactions or the oldest unsealed one waited BLOCK_INTERVAL seconds
+MAX_BLOCK_TXNS = 1000
+BLOCK_INTERVAL = 1.0
+
+# transactions that are not yet sealed into a block, further ones are rejected
+MAX_PENDING_TXNS = 100000
+
+# size after which a new log segment is started (once every transaction of the current one is sealed)
+LOG_SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+def to_micros(timestamp):
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
 
 class Blockchain:
     def __init__(self, index, timestamp, data, previous_hash):
         """
 
         :param index:
-        :param timestamp:
+        :param timestamp: timezone aware datetime
         :param data:
-        :param previous_hash:
+        :param previous_hash: hex digest of the previous block
         """
 
         self.index = index
@@ -20,53 +55,269 @@ class Blockchain:
         self.previous_hash = previous_hash
         self.hash = self.hash_block()
 
+    def header(self):
+        return HEADER.pack(self.index, to_micros(self.timestamp), hasher.sha256(self.encoded_data()).digest(),
+                           bytes.fromhex(self.previous_hash))
+
+    def encoded_data(self):
+        return str(self.data).encode('utf-8')
+
     def hash_block(self):
-        sha = hasher.sha256()
-        sha.update(str(self.index).encode('utf-8') + str(self.timestamp).encode('utf-8') + str(self.data).encode(
-            'utf-8') + str(self.previous_hash).encode('utf-8'))
+        return hasher.sha256(self.header()).hexdigest()
+
+
+class ChainFile:
+    """Append-only chain on disk. `path`.idx holds one fixed-width record per block and is memory-mapped, thus any
+    block is read in constant time. `path`.data holds the block data.
+    """
+    def __init__(self, path):
+        self.index_file = open(path + '.idx', 'a+b')
+        self.data_file = open(path + '.data', 'a+b')
+        self.map = None
+        self.length = 0
+        self.recover()
+        self.remap()
+
+    def recover(self):
+        # a crash while appending may leave a partial record or data without a record, cut them off
+        size = os.fstat(self.index_file.fileno()).st_size
+        self.index_file.truncate(size - size % RECORD.size)
+        self.length = size // RECORD.size
+        end = 0
+        if self.length > 0:
+            self.index_file.seek((self.length - 1) * RECORD.size)
+            offset, length, _, _ = RECORD.unpack(self.index_file.read(RECORD.size))
+            end = offset + length
+        self.data_file.truncate(end)
+
+    def remap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.length > 0:
+            self.map = mmap.mmap(self.index_file.fileno(), self.length * RECORD.size, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.length
+
+    def record(self, height):
+        return RECORD.unpack_from(self.map, height * RECORD.size)
+
+    def __getitem__(self, height):
+        if height < 0:
+            height += self.length
+        if not 0 <= height < self.length:
+            raise IndexError('block height out of range')
+        offset, length, header, block_hash = self.record(height)
+        index, micros, _, previous_hash = HEADER.unpack(header)
+        self.data_file.seek(offset)
+        data = self.data_file.read(length).decode('utf-8')
+        block = Blockchain(index, EPOCH + timedelta(microseconds=micros), data, previous_hash.hex())
+        if block.hash != block_hash.hex():
+            raise ValueError('block #{} is corrupted'.format(height))
+        return block
+
+    def append(self, block):
+        if block.index != self.length:
+            raise ValueError('expected block #{}, got #{}'.format(self.length, block.index))
+        data = block.encoded_data()
+        self.data_file.seek(0, os.SEEK_END)
+        offset = self.data_file.tell()
+        self.data_file.write(data)
+        self.data_file.flush()
+        os.fsync(self.data_file.fileno())
+        self.index_file.write(RECORD.pack(offset, len(data), block.header(), bytes.fromhex(block.hash)))
+        self.index_file.flush()
+        os.fsync(self.index_file.fileno())
+        self.length += 1
+        self.remap()
+
+    def verify_tail(self, count=VERIFY_TAIL):
+        """Check the hashes and links of the last `count` blocks. Raises ValueError if the chain is corrupted."""
+        start = max(0, self.length - count)
+        previous = self[start - 1] if start > 0 else None
+        for height in range(start, self.length):
+            block = self[height]
+            if previous is not None and block.previous_hash != previous.hash:
+                raise ValueError('block #{} does not link to its predecessor'.format(height))
+            previous = block
 
-        return sha.hexdigest()
+
+class LogFull(Exception):
+    pass
+
+
+class TransactionLog:
+    """Durable append-only log of the received transactions, one JSON line per transaction. Log offsets are absolute,
+    the log is split into segments `path`.<offset of the first byte>. Appends are written and fsynced in groups by a
+    writer thread (group commit): `append` returns once the transaction is durable.
+
+    Durable transactions stay in `pending` until `seal` is called, i.e until they are part of a block. A block stores
+    the log offset up to which it contains the transactions, thus after a restart the log is replayed from there.
+    """
+    def __init__(self, path, sealed):
+        self.path = path
+        self.lock = threading.Condition()
+        self.buffer = []    # (end offset, txn, line, time queued) not yet written
+        self.pending = []   # (end offset, txn, time queued) durable but not sealed
+        self.writing = False
+        self.sealed = sealed
+        self.recover()
+        self.end = self.written
+        threading.Thread(target=self.write_loop, daemon=True).start()
+
+    def recover(self):
+        segments = sorted(int(name.rsplit('.', 1)[1]) for name in glob.glob(self.path + '.*'))
+        self.base = segments[-1] if segments else self.sealed
+        for base in segments[:-1]:
+            os.remove('{}.{}'.format(self.path, base))
+        self.file = open('{}.{}'.format(self.path, self.base), 'a+b')
+        self.file.seek(0)
+        offset = self.base
+        now = time.monotonic()
+        for line in self.file:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            if offset > self.sealed:
+                self.pending.append((offset, json.loads(line.decode('utf-8')), now))
+        # cut off a torn last line
+        self.file.truncate(offset - self.base)
+        self.written = offset
+
+    def append(self, txn):
+        line = (json.dumps(txn, sort_keys=True) + '\n').encode('utf-8')
+        with self.lock:
+            if len(self.pending) + len(self.buffer) >= MAX_PENDING_TXNS:
+                raise LogFull()
+            self.end += len(line)
+            end = self.end
+            self.buffer.append((end, txn, line, time.monotonic()))
+            self.lock.notify_all()
+            while self.written < end:
+                self.lock.wait()
+
+    def write_loop(self):
+        while True:
+            with self.lock:
+                while not self.buffer:
+                    self.lock.wait()
+                batch = self.buffer
+                self.buffer = []
+                self.writing = True
+            self.file.write(b''.join(line for _, _, line, _ in batch))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            with self.lock:
+                self.writing = False
+                self.written = batch[-1][0]
+                self.pending.extend((end, txn, queued) for end, txn, _, queued in batch)
+                self.lock.notify_all()
+
+    def rotate(self):
+        # every transaction of the current segment is sealed and the writer is idle, later appends go to a new one.
+        # Called with the lock held.
+        old = '{}.{}'.format(self.path, self.base)
+        self.file.close()
+        self.base = self.written
+        self.file = open('{}.{}'.format(self.path, self.base), 'a+b')
+        os.remove(old)
+
+    def take(self, max_count, max_wait):
+        """Wait until `max_count` transactions are pending or the oldest pending one was queued `max_wait` seconds
+        ago. Returns up to `max_count` pending (end offset, txn, time queued) tuples, they stay pending until `seal`
+        is called.
+        """
+        with self.lock:
+            while not self.pending:
+                self.lock.wait()
+            deadline = self.pending[0][2] + max_wait
+            while len(self.pending) < max_count and time.monotonic() < deadline:
+                self.lock.wait(deadline - time.monotonic())
+            return self.pending[:max_count]
+
+    def seal(self, count, offset):
+        """The first `count` pending transactions (up to log `offset`) are now part of a block, drop them."""
+        with self.lock:
+            del self.pending[:count]
+            self.sealed = offset
+            if self.sealed == self.written and not self.writing and self.written - self.base >= LOG_SEGMENT_BYTES:
+                self.rotate()
+
+
+def sealed_offset(block):
+    try:
+        return json.loads(block.data)['log_offset']
+    except (ValueError, TypeError, KeyError):
+        return 0
+
+
+def assemble_blocks(txlog):
+    """Seal the logged transactions into blocks, runs on a background thread."""
+    global previous_block
+    while True:
+        batch = txlog.take(MAX_BLOCK_TXNS, BLOCK_INTERVAL)
+        offset = batch[-1][0]
+        data = json.dumps({'transactions': [txn for _, txn, _ in batch], 'log_offset': offset}, sort_keys=True)
+        block_to_add = Blockchain(previous_block.index + 1, datetime.now(timezone.utc), data, previous_block.hash)
+        blockchain.append(block_to_add)
+        txlog.seal(len(batch), offset)
+        previous_block = block_to_add
+
+        print(" Block #{} has been sealed with {} transactions".format(block_to_add.index, len(batch)))
 
 
 # Genesis block
 def create_genesis_block():
-    return Blockchain(0, datetime.now(), "genesis", "0")
+    return Blockchain(0, datetime.now(timezone.utc), "genesis", "0" * 64)
 
 
 def next_block(last_block):
     this_index = last_block.index +1
-    this_timestamp = datetime.now()
+    this_timestamp = datetime.now(timezone.utc)
     this_data = "data" + str(this_index)
     this_hash = last_block.hash
     return Blockchain(this_index, this_timestamp, this_data,this_hash)
 
 
-# Create a blockchain
-blockchain = [create_genesis_block()]
-previous_block = blockchain[0]
+# Open the blockchain, it is only created (and filled with example blocks) if it does not exist yet
+blockchain = ChainFile(CHAIN_FILE)
+blockchain.verify_tail()
+
+if len(blockchain) == 0:
+    blockchain.append(create_genesis_block())
+    previous_block = blockchain[0]
+
+    number_of_blocks = 30
+
+    for i in range(0, number_of_blocks):
+        block_to_add = next_block(previous_block)
+        blockchain.append(block_to_add)
+        previous_block = block_to_add
+
+        print(" Block #{} has been added".format(block_to_add.index))
+        print(" Hash: #{}\n".format(block_to_add.hash))
 
-number_of_blocks = 30
+previous_block = blockchain[-1]
+print(" Chain loaded, last block #{}".format(previous_block.index))
 
-for i in range(0, number_of_blocks):
-    block_to_add = next_block(previous_block)
-    blockchain.append(block_to_add)
-    previous_block = block_to_add
 
-    print(" Block #{} has been added".format(block_to_add.index))
-    print(" Hash: #{}\n".format(block_to_add.hash))
+txlog = TransactionLog(CHAIN_FILE + '.txlog', sealed_offset(previous_block))
+threading.Thread(target=assemble_blocks, args=(txlog,), daemon=True).start()
 
 
 node = Flask(__name__)
-this_node_transactions = []
 
 @node.route('/txtion', methods=['POST'])
 
 def transaction():
     if request.method == 'POST':
         new_txion = request.get_json()
-        this_node_transactions.append(new_txion)
+        try:
+            txlog.append(new_txion)
+        except LogFull:
+            return "Too many pending transactions\n", 503
 
-        print(" New Transaction")
-        print("From : {} ".format(new_txion['from']))
+        return "Transaction submission successful\n"
 
-#https://medium.com/crypto-currently/lets-make-the-tiniest-blockchain-bigger-ac360a328f4d
\ No newline at end of file
+#https://medium.com/crypto-currently/lets-make-the-tiniest-blockchain-bigger-ac360a328f4d